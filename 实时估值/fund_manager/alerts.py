@@ -0,0 +1,125 @@
+import database
+
+FUND_METRICS = {
+    "est_rate": "估算涨跌",
+    "est_nav": "估算净值",
+    "today_pnl": "今日盈亏",
+    "total_pnl": "累计盈亏",
+    "stale": "行情未更新(秒)",
+}
+ACCOUNT_METRICS = {
+    "today_pnl": "今日盈亏",
+    "total_pnl": "累计盈亏",
+    "market_value": "持仓市值",
+}
+RATE_METRICS = ("est_rate",)
+
+
+class AlertRule:
+    __slots__ = ("id", "scope", "target", "metric", "op", "threshold", "hysteresis", "triggered", "note")
+
+    def __init__(self, row):
+        self.id = row["id"]
+        self.scope = row["scope"]
+        self.target = row["target"]
+        self.metric = row["metric"]
+        self.op = row["op"]
+        self.threshold = float(row["threshold"])
+        self.hysteresis = abs(float(row["hysteresis"] or 0))
+        self.triggered = bool(row["triggered"])
+        self.note = row["note"]
+
+    def check(self, value):
+        # fires once when the condition starts to hold, re-arms only after the
+        # value moves back past threshold +/- hysteresis
+        if value is None:
+            return None
+        if self.op == "<":
+            hit = value < self.threshold
+            rearm = value >= self.threshold + self.hysteresis
+        else:
+            hit = value > self.threshold
+            rearm = value <= self.threshold - self.hysteresis
+        if not self.triggered and hit:
+            self.triggered = True
+            return "fired"
+        if self.triggered and rearm:
+            self.triggered = False
+            return "rearmed"
+        return None
+
+    def describe(self, value=None):
+        labels = FUND_METRICS if self.scope == "fund" else ACCOUNT_METRICS
+        if self.metric in RATE_METRICS:
+            th = f"{self.threshold * 100:+.2f}%"
+            cur = f"{value * 100:+.2f}%" if value is not None else ""
+        else:
+            th = f"{self.threshold:,.2f}"
+            cur = f"{value:,.2f}" if value is not None else ""
+        text = f"{self.target} {labels.get(self.metric, self.metric)} {self.op} {th}"
+        if cur:
+            text += f"（当前 {cur}）"
+        return text
+
+
+class AlertEngine:
+    # Rules are indexed by fund code / account name, so a tick only looks at
+    # the handful of rules that mention that fund or its account.
+    def __init__(self):
+        self.by_fund = {}
+        self.by_account = {}
+        self.stale_rules = []
+
+    def load(self, rows=None):
+        rows = database.get_alert_rules(enabled_only=True) if rows is None else rows
+        self.by_fund = {}
+        self.by_account = {}
+        self.stale_rules = []
+        for row in rows:
+            rule = AlertRule(row)
+            if rule.scope == "fund" and rule.metric == "stale":
+                self.stale_rules.append(rule)
+            elif rule.scope == "fund":
+                self.by_fund.setdefault(rule.target, []).append(rule)
+            else:
+                self.by_account.setdefault(rule.target, []).append(rule)
+
+    def _evaluate(self, rules, values):
+        events = []
+        for rule in rules:
+            value = values.get(rule.metric)
+            state = rule.check(value)
+            if state:
+                events.append((state, rule, value))
+        return events
+
+    def on_fund_tick(self, code, values):
+        rules = self.by_fund.get(code)
+        return self._evaluate(rules, values) if rules else []
+
+    def on_account_tick(self, account, values):
+        rules = self.by_account.get(account)
+        return self._evaluate(rules, values) if rules else []
+
+    def has_fund_rules(self, code):
+        return code in self.by_fund
+
+    def has_account_rules(self, account):
+        return account in self.by_account
+
+    def watches(self, code, account):
+        # whether a fund's quotes feed any rule: its own, a stale rule, or its account's
+        return code in self.by_fund or account in self.by_account or \
+            any(rule.target == code for rule in self.stale_rules)
+
+    def check_stale(self, now, last_quote_at, default_since, codes=None):
+        # codes: funds being fetched; a rule on any other fund can never be satisfied, so it is skipped
+        events = []
+        for rule in self.stale_rules:
+            if codes is not None and rule.target not in codes:
+                continue
+            age = now - last_quote_at.get(rule.target, default_since)
+            state = rule.check(age)
+            if state:
+                events.append((state, rule, age))
+        return events
@@ -0,0 +1,210 @@
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import database
+import nav_archive
+
+# Strategy backtests over stored NAV history (nav_history, filled by
+# history.sync_nav_history). A strategy turns P parameter sets into a P x T
+# matrix of order amounts, one column per session; every parameter set of a
+# fund is then filled and valued in one pass of array arithmetic.
+#
+# Fills follow calc.reconcile_pending_trades: an order placed during session t
+# (before 15:00) is confirmed on the next session and priced at that session's
+# NAV; cost grows by amount + fee, as in calc.replay_trades.
+# The day's move used by dip buying is the NAV return of session t, standing in
+# for the intraday est_rate seen when the order is placed.
+
+CHUNK_ROWS = 512  # parameter sets evaluated per block, bounds memory to a few P x T arrays
+RESULT_FIELDS = ("invested", "final_value", "total_return", "max_drawdown", "buys")
+
+
+def param_grid(**values):
+    # {"every": [5, 10], "amount": [500]} -> {"every": array, "amount": array}, one entry per combination
+    names = list(values)
+    combos = list(itertools.product(*(np.atleast_1d(values[n]) for n in names)))
+    if not combos:
+        return {n: np.empty(0) for n in names}
+    cols = list(zip(*combos))
+    return {n: np.asarray(col, dtype=float) for n, col in zip(names, cols)}
+
+
+def _dca(nav, ret, p):
+    # fixed amount every `every` sessions, starting at session `offset`
+    t = np.arange(len(nav))[None, :]
+    every = np.maximum(p["every"], 1)[:, None]
+    offset = p.get("offset", np.zeros(len(every)))[:, None]
+    due = (t >= offset) & ((t - offset) % every == 0)
+    return due * p["amount"][:, None]
+
+
+def _dip(nav, ret, p):
+    # optional base DCA plus an extra buy on sessions whose move is at or below `threshold`
+    orders = _dca(nav, ret, p) if "every" in p else np.zeros((len(p["threshold"]), len(nav)))
+    dips = ret[None, :] <= p["threshold"][:, None]
+    return orders + dips * p["dip_amount"][:, None]
+
+
+def _value_averaging(nav, ret, p):
+    # every `every` sessions, top the holding up to a target that grows by `step`
+    # per period; buys are capped at `max_amount`, and there are no sells.
+    # Path dependent, so this walks the periods but stays vectorized over P.
+    n_params, n = len(p["step"]), len(nav)
+    every = np.maximum(p["every"].astype(int), 1)
+    orders = np.zeros((n_params, n))
+    shares = np.zeros(n_params)
+    pending = np.zeros(n_params)  # ordered yesterday, confirmed today
+    period = np.zeros(n_params)
+    for t in range(n):
+        shares += pending / nav[t]
+        pending[:] = 0.0
+        due = t % every == 0
+        if not due.any():
+            continue
+        period += due
+        want = np.clip(period * p["step"] - shares * nav[t], 0.0, p["max_amount"])
+        buy = np.where(due, want, 0.0)
+        if t + 1 < n:
+            orders[:, t] = buy
+            pending = buy
+    return orders
+
+
+STRATEGIES = {
+    "dca": (_dca, ("every", "amount")),
+    "dip": (_dip, ("threshold", "dip_amount")),
+    "value_avg": (_value_averaging, ("every", "step", "max_amount")),
+}
+
+
+def evaluate(nav, orders, fee_rate=0.0):
+    # nav: (T,), orders: (P, T) amounts ordered per session -> dict of (P,) arrays
+    nav = np.asarray(nav, dtype=float)
+    orders = np.asarray(orders, dtype=float)
+    filled = np.zeros_like(orders)
+    filled[:, 1:] = orders[:, :-1]  # T+1 confirmation; last session's orders never fill
+    shares = np.cumsum(filled / nav[None, :], axis=1)
+    cost = np.cumsum(filled * (1.0 + fee_rate), axis=1)
+    value = shares * nav[None, :]
+    invested = cost[:, -1]
+    final_value = value[:, -1]
+    ratio = np.divide(value, cost, out=np.ones_like(value), where=cost > 0)
+    peak = np.maximum.accumulate(ratio, axis=1)
+    drawdown = (1.0 - ratio / peak).max(axis=1)
+    return {
+        "invested": invested,
+        "final_value": final_value,
+        "total_return": np.divide(final_value - invested, invested, out=np.zeros_like(invested), where=invested > 0),
+        "max_drawdown": drawdown,
+        "buys": np.count_nonzero(filled, axis=1),
+    }
+
+
+def run_fund(nav, strategy, params, fee_rate=0.0):
+    fn, required = STRATEGIES[strategy]
+    missing = [k for k in required if k not in params]
+    if missing:
+        raise ValueError(f"{strategy} needs parameters: {', '.join(missing)}")
+    nav = np.asarray(nav, dtype=float)
+    ret = np.zeros(len(nav))
+    if len(nav) > 1:
+        ret[1:] = nav[1:] / nav[:-1] - 1.0
+    n_params = len(next(iter(params.values())))
+    out = {k: np.empty(n_params) for k in RESULT_FIELDS}
+    for lo in range(0, n_params, CHUNK_ROWS):
+        chunk = {k: np.asarray(v[lo:lo + CHUNK_ROWS], dtype=float) for k, v in params.items()}
+        res = evaluate(nav, fn(nav, ret, chunk), fee_rate)
+        for k in RESULT_FIELDS:
+            out[k][lo:lo + CHUNK_ROWS] = res[k]
+    return out
+
+
+def _run_fund_job(args):
+    code, nav, strategy, params, fee_rate = args
+    return code, run_fund(nav, strategy, params, fee_rate)
+
+
+def load_navs(codes, start=None, end=None):
+    # {code: (dates, navs)} from the NAV archive, or nav_history for funds not archived yet
+    archive = nav_archive.get_archive()
+    navs = {}
+    for code in codes:
+        if code in archive:
+            dates, values = archive.series(code, start, end)
+            if len(values) >= 2:
+                navs[code] = (dates.astype(str).tolist(), values)
+            continue
+        rows = database.get_nav_history(code)
+        rows = [r for r in rows if (not start or r[0] >= start) and (not end or r[0] <= end)]
+        if len(rows) >= 2:
+            navs[code] = ([r[0] for r in rows], np.array([r[1] for r in rows], dtype=float))
+    return navs
+
+
+def sweep(navs, strategy, params, fee_rate=0.0, processes=0):
+    # navs: {code: (dates, navs)}; params: output of param_grid.
+    # Returns {code: {field: (P,) array}}; funds run in a process pool when processes > 0.
+    jobs = [(code, nav, strategy, params, fee_rate) for code, (_, nav) in navs.items()]
+    if processes > 0 and len(jobs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                return dict(pool.map(_run_fund_job, jobs))
+        except BrokenProcessPool:
+            pass
+    return dict(map(_run_fund_job, jobs))
+
+
+def best(results, params, key="total_return", top=10):
+    # flat ranking across funds: [(code, {param: value}, {field: value}), ...]
+    rows = []
+    for code, res in results.items():
+        for i in np.argsort(-res[key])[:top]:
+            rows.append((code, {k: float(v[i]) for k, v in params.items()},
+                         {k: float(res[k][i]) for k in RESULT_FIELDS}))
+    rows.sort(key=lambda r: -r[2][key])
+    return rows[:top]
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",") if x]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按历史净值回测定投策略")
+    parser.add_argument("codes", nargs="+", help="基金代码")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES), default="dca")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=V1,V2,...",
+                        help="参数取值，如 every=5,10,21 amount=500")
+    parser.add_argument("--fee", type=float, default=0.0, help="申购费率")
+    parser.add_argument("--start")
+    parser.add_argument("--end")
+    parser.add_argument("--processes", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    grid = {}
+    for item in args.param:
+        name, _, values = item.partition("=")
+        grid[name] = _floats(values)
+    missing = [k for k in STRATEGIES[args.strategy][1] if not grid.get(k)]
+    if missing:
+        parser.error(f"{args.strategy} 策略需要参数: {', '.join(missing)}（用 --param NAME=V1,V2 指定）")
+    params = param_grid(**grid)
+    navs = load_navs(args.codes, args.start, args.end)
+    if not navs:
+        print("没有可用的历史净值，请先同步净值")
+        return 1
+    results = sweep(navs, args.strategy, params, args.fee, args.processes)
+    for code, p, r in best(results, params, top=args.top):
+        desc = " ".join(f"{k}={v:g}" for k, v in p.items())
+        print(f"{code} {desc}: 投入 {r['invested']:,.0f} 市值 {r['final_value']:,.0f} "
+              f"收益 {r['total_return'] * 100:+.2f}% 最大回撤 {r['max_drawdown'] * 100:.2f}% 买入 {r['buys']:.0f} 次")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,9 +1,10 @@
-from database import get_trades_by_fund, update_position, update_trade_shares
+from database import get_trades_by_fund, update_position, update_trade_shares, unit_of_work
 from datetime import datetime, timedelta
 import exchange_calendars as xcals
 
-def recalculate_position(fund_id):
-    trades = get_trades_by_fund(fund_id)
+
+def replay_trades(trades):
+    # yields (trade, shares, cost, realized) after applying each trade
     current_shares = 0.0
     current_cost = 0.0
     for trade in trades:
@@ -11,6 +12,7 @@ def recalculate_position(fund_id):
         shares = float(trade['shares'])
         amount = float(trade['amount'])
         fee = float(trade['fee'])
+        realized = 0.0
         if t_type == 'buy':
             if shares > 0:
                 current_shares += shares
@@ -26,10 +28,24 @@ def recalculate_position(fund_id):
             current_shares -= shares
             current_cost -= reduced_cost
             current_cost -= fee
-    if current_shares < 0.0001:
-        current_shares = 0
-        current_cost = 0
-    update_position(fund_id, current_shares, current_cost)
+            price = float(trade.get('price') or 0)
+            gross = amount if amount > 0 else shares * price
+            # the fee leaves cost basis above, so release it together with the reduced cost
+            realized = (gross - fee) - (reduced_cost + fee)
+        yield trade, current_shares, current_cost, realized
+
+
+def recalculate_position(fund_id):
+    with unit_of_work():
+        trades = get_trades_by_fund(fund_id)
+        current_shares = 0.0
+        current_cost = 0.0
+        for _, current_shares, current_cost, _ in replay_trades(trades):
+            pass
+        if current_shares < 0.0001:
+            current_shares = 0
+            current_cost = 0
+        update_position(fund_id, current_shares, current_cost)
     return current_shares, current_cost
 
 _XSHG = xcals.get_calendar("XSHG")
@@ -47,46 +63,60 @@ def _add_trading_days(d, n):
     return cur
 
 
+def confirm_date(trade_time):
+    # T+1: before 15:00 confirm next trading day;
+    # after 15:00 confirm the trading day after next.
+    trade_date = trade_time.date()
+    base_date = trade_date
+    if trade_time.time() >= datetime.strptime("15:00:00", "%H:%M:%S").time():
+        base_date = _add_trading_days(trade_date, 1)
+    return _add_trading_days(base_date, 1)
+
+
+def pricing_date(trade_time):
+    # the session whose NAV prices the order
+    d = trade_time.date()
+    if trade_time.time() >= datetime.strptime("15:00:00", "%H:%M:%S").time() or not _XSHG.is_session(d):
+        return _add_trading_days(d, 1)
+    return d
+
+
 def reconcile_pending_trades(fund_id, est_nav, nav=None, nav_date=None, now_dt=None):
+    # confirmed shares and the new position are written together
     if now_dt is None:
         now_dt = datetime.now()
     changed = False
-    trades = get_trades_by_fund(fund_id)
-    for trade in trades:
-        if trade['type'] == 'buy' and float(trade['shares']) <= 0 and float(trade['amount']) > 0:
-            try:
-                trade_time = datetime.strptime(trade['trade_time'], "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                trade_time = now_dt
-            trade_date = trade_time.date()
-            # T+1: before 15:00 confirm next trading day;
-            # after 15:00 confirm the trading day after next.
-            base_date = trade_date
-            if trade_time.time() >= datetime.strptime("15:00:00", "%H:%M:%S").time():
-                base_date = _add_trading_days(trade_date, 1)
-            target_date = _add_trading_days(base_date, 1)
-
-            if now_dt.date() < target_date:
-                continue
-
-            price = None
-            if nav and nav_date:
+    with unit_of_work():
+        trades = get_trades_by_fund(fund_id)
+        for trade in trades:
+            if trade['type'] == 'buy' and float(trade['shares']) <= 0 and float(trade['amount']) > 0:
                 try:
-                    nav_dt = datetime.strptime(nav_date, "%Y-%m-%d").date()
-                    if nav_dt >= target_date:
-                        price = float(nav)
+                    trade_time = datetime.strptime(trade['trade_time'], "%Y-%m-%d %H:%M:%S")
                 except Exception:
-                    pass
-            if price is None:
-                if est_nav is None or est_nav <= 0:
+                    trade_time = now_dt
+                target_date = confirm_date(trade_time)
+
+                if now_dt.date() < target_date:
                     continue
-                price = float(est_nav)
 
-            shares = float(trade['amount']) / price
-            update_trade_shares(trade['id'], shares, price)
-            changed = True
-    if changed:
-        recalculate_position(fund_id)
+                price = None
+                if nav and nav_date:
+                    try:
+                        nav_dt = datetime.strptime(nav_date, "%Y-%m-%d").date()
+                        if nav_dt >= target_date:
+                            price = float(nav)
+                    except Exception:
+                        pass
+                if price is None:
+                    if est_nav is None or est_nav <= 0:
+                        continue
+                    price = float(est_nav)
+
+                shares = float(trade['amount']) / price
+                update_trade_shares(trade['id'], shares, price)
+                changed = True
+        if changed:
+            recalculate_position(fund_id)
     return changed
 
 def calc_display_metrics(shares, cost_amount, est_nav, est_rate):
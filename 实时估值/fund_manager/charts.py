@@ -0,0 +1,497 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QTabWidget, QPushButton
+from PySide6.QtCore import Qt, QThread, Signal, QPointF, QRectF
+from PySide6.QtGui import QPainter, QPen, QColor, QPolygonF
+from datetime import datetime, date
+import math
+import time
+
+import numpy as np
+
+import database
+import history
+from history import HistoryEngine
+from providers import RealProvider
+
+# Level-of-detail line charts. A LodSeries keeps a min/max pyramid: level k
+# holds, for every run of 2**k raw points, the index of its lowest and highest
+# point. A view that spans N raw points on a W pixel wide plot is drawn from
+# the level where N / 2**k is about 2*W, so painting costs O(W) whatever the
+# zoom, the pyramid doubles as the per-zoom cache, and appending a tick only
+# recomputes the last bucket of each level.
+
+PLOT_MARGINS = (64, 10, 12, 22)  # left, top, right, bottom
+HISTORY_RETRY_SEC = 300  # a load that failed or came back empty is not retried sooner unless asked
+SERIES_COLORS = [QColor(220, 80, 40), QColor(43, 106, 223), QColor(17, 169, 120)]
+
+
+def _pair(src, y, pick_min):
+    # merge neighbouring buckets two by two, keeping the extreme point's index
+    a = src[0::2]
+    b = src[1::2]
+    out = a.copy()
+    m = len(b)
+    if m:
+        take_b = y[b] < y[a[:m]] if pick_min else y[b] > y[a[:m]]
+        out[:m] = np.where(take_b, b, a[:m])
+    return out
+
+
+class LodSeries:
+    def __init__(self, capacity=1024):
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.n = 0
+        self.version = 0
+        self._levels = []  # level k at [k-1]: [min_idx, max_idx, raw points covered]
+        self._last_query = None
+
+    @classmethod
+    def from_arrays(cls, xs, ys):
+        series = cls(max(16, len(xs)))
+        series.extend(xs, ys)
+        return series
+
+    def __len__(self):
+        return self.n
+
+    def extend(self, xs, ys):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        need = self.n + len(xs)
+        if need > len(self.x):
+            cap = max(need, 2 * len(self.x))
+            for name in ("x", "y"):
+                grown = np.empty(cap)
+                grown[:self.n] = getattr(self, name)[:self.n]
+                setattr(self, name, grown)
+        self.x[self.n:need] = xs
+        self.y[self.n:need] = ys
+        self.n = need
+        self.version += 1
+
+    def append(self, x, y):
+        if self.n == len(self.x):
+            self.extend([x], [y])
+            return
+        self.x[self.n] = x
+        self.y[self.n] = y
+        self.n += 1
+        self.version += 1
+
+    def clear(self):
+        self.n = 0
+        self._levels = []
+        self.version += 1
+
+    def _ensure_level(self, k):
+        y = self.y
+        for j in range(1, k + 1):
+            if j > len(self._levels):
+                self._levels.append([np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), 0])
+            level = self._levels[j - 1]
+            if level[2] == self.n:
+                continue
+            # only the last, possibly partial, bucket and anything after it changes
+            first = level[2] >> j
+            if j == 1:
+                src_min = src_max = np.arange(2 * first, self.n)
+            else:
+                below = self._levels[j - 2]
+                count = -(-self.n >> (j - 1))  # buckets in use one level down
+                src_min = below[0][2 * first:count]
+                src_max = below[1][2 * first:count]
+            new_min = _pair(src_min, y, True)
+            end = first + len(new_min)
+            if end > len(level[0]):
+                cap = max(end, 2 * len(level[0]))
+                for i in (0, 1):
+                    grown = np.empty(cap, dtype=np.int64)
+                    grown[:first] = level[i][:first]
+                    level[i] = grown
+            level[0][first:end] = new_min
+            level[1][first:end] = _pair(src_max, y, False)
+            level[2] = self.n
+
+    def query(self, x0, x1, width):
+        # (xs, ys) to draw for [x0, x1] on `width` pixels, in x order
+        key = (x0, x1, width, self.version)
+        if self._last_query is not None and self._last_query[0] == key:
+            return self._last_query[1]
+        n = self.n
+        if n == 0:
+            result = (np.empty(0), np.empty(0))
+        else:
+            xs = self.x[:n]
+            lo = max(0, int(np.searchsorted(xs, x0, side="left")) - 1)
+            hi = min(n, int(np.searchsorted(xs, x1, side="right")) + 1)
+            count = max(hi - lo, 1)
+            target = max(2 * int(width), 2)
+            k = max(0, math.ceil(math.log2(count / target))) if count > target else 0
+            if k == 0:
+                idx = np.arange(lo, hi)
+            else:
+                self._ensure_level(k)
+                mins, maxs, _ = self._levels[k - 1]
+                b0, b1 = lo >> k, ((hi - 1) >> k) + 1
+                mn, mx = mins[b0:b1], maxs[b0:b1]
+                idx = np.column_stack([np.minimum(mn, mx), np.maximum(mn, mx)]).ravel()
+            result = (self.x[idx], self.y[idx])
+        self._last_query = (key, result)
+        return result
+
+
+def _format_time(x):
+    return datetime.fromtimestamp(x).strftime("%H:%M")
+
+
+def _format_day(x):
+    return str(np.datetime64(int(round(x)), "D"))
+
+
+class ChartWidget(QWidget):
+    # wheel zooms around the cursor, drag pans, double-click resets and follows new data
+    def __init__(self, x_format, y_format="{:,.2f}", parent=None):
+        super().__init__(parent)
+        self.x_format = x_format
+        self.y_format = y_format
+        self.series = []  # [(name, LodSeries, QColor)]
+        self._view = None  # (x0, x1) or None for the full range
+        self.follow = True
+        self._drag = None
+        self.setMinimumHeight(160)
+        self.setMouseTracking(False)
+
+    def set_series(self, series):
+        self.series = [(name, s, SERIES_COLORS[i % len(SERIES_COLORS)]) for i, (name, s) in enumerate(series)]
+        self._view = None
+        self.follow = True
+        self.update()
+
+    def data_range(self):
+        spans = [(s.x[0], s.x[s.n - 1]) for _, s, _ in self.series if s.n]
+        if not spans:
+            return None
+        return min(a for a, _ in spans), max(b for _, b in spans)
+
+    def view_range(self):
+        full = self.data_range()
+        if full is None:
+            return None
+        if self._view is None:
+            x0, x1 = full
+        else:
+            x0, x1 = self._view
+            if self.follow and x1 < full[1]:
+                # keep the zoom width, slide to the newest point
+                x0, x1 = x0 + full[1] - x1, full[1]
+                self._view = (x0, x1)
+        if x1 <= x0:
+            x1 = x0 + 1.0
+        return x0, x1
+
+    def data_appended(self):
+        view = self.view_range()
+        if view is None:
+            return
+        full = self.data_range()
+        if self.follow or full[1] <= view[1]:
+            self.update()
+
+    def _plot_rect(self):
+        left, top, right, bottom = PLOT_MARGINS
+        return QRectF(left, top, max(1, self.width() - left - right), max(1, self.height() - top - bottom))
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), QColor(255, 250, 245))
+        rect = self._plot_rect()
+        view = self.view_range()
+        if view is None:
+            painter.setPen(QColor(140, 140, 140))
+            painter.drawText(self.rect(), Qt.AlignCenter, "暂无数据")
+            return
+        x0, x1 = view
+        drawn = []
+        for name, s, color in self.series:
+            xs, ys = s.query(x0, x1, int(rect.width()))
+            if len(xs):
+                drawn.append((name, xs, ys, color))
+        if not drawn:
+            return
+        y0 = min(float(ys.min()) for _, _, ys, _ in drawn)
+        y1 = max(float(ys.max()) for _, _, ys, _ in drawn)
+        if y1 - y0 < 1e-12:
+            y0, y1 = y0 - 1.0, y1 + 1.0
+        pad = (y1 - y0) * 0.05
+        y0, y1 = y0 - pad, y1 + pad
+
+        grid = QPen(QColor(230, 200, 175), 1)
+        for i in range(5):
+            yv = y0 + (y1 - y0) * i / 4
+            py = rect.bottom() - (yv - y0) / (y1 - y0) * rect.height()
+            painter.setPen(grid)
+            painter.drawLine(QPointF(rect.left(), py), QPointF(rect.right(), py))
+            painter.setPen(QColor(90, 70, 60))
+            painter.drawText(QRectF(0, py - 8, PLOT_MARGINS[0] - 6, 16), Qt.AlignRight | Qt.AlignVCenter,
+                             self.y_format.format(yv))
+        painter.setPen(QColor(90, 70, 60))
+        painter.drawText(QRectF(rect.left(), rect.bottom() + 4, 120, 16), Qt.AlignLeft, self.x_format(x0))
+        painter.drawText(QRectF(rect.right() - 120, rect.bottom() + 4, 120, 16), Qt.AlignRight, self.x_format(x1))
+
+        sx = rect.width() / (x1 - x0)
+        sy = rect.height() / (y1 - y0)
+        painter.setClipRect(rect)
+        for i, (name, xs, ys, color) in enumerate(drawn):
+            px = rect.left() + (xs - x0) * sx
+            py = rect.bottom() - (ys - y0) * sy
+            poly = QPolygonF([QPointF(a, b) for a, b in zip(px.tolist(), py.tolist())])
+            painter.setPen(QPen(color, 1.4))
+            painter.drawPolyline(poly)
+            painter.drawText(QRectF(rect.left() + 6, rect.top() + 2 + 16 * i, 240, 16), Qt.AlignLeft, name)
+
+    def wheelEvent(self, event):
+        view = self.view_range()
+        if view is None:
+            return
+        x0, x1 = view
+        rect = self._plot_rect()
+        frac = min(max((event.position().x() - rect.left()) / rect.width(), 0.0), 1.0)
+        anchor = x0 + (x1 - x0) * frac
+        factor = 0.8 ** (event.angleDelta().y() / 120.0)
+        full = self.data_range()
+        span = min(max((x1 - x0) * factor, 1e-6), (full[1] - full[0]) or 1.0)
+        x0 = anchor - span * frac
+        self._set_view(x0, x0 + span)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.view_range() is not None:
+            self._drag = (event.position().x(), self.view_range())
+
+    def mouseMoveEvent(self, event):
+        if self._drag is None:
+            return
+        start_x, (x0, x1) = self._drag
+        shift = (start_x - event.position().x()) / self._plot_rect().width() * (x1 - x0)
+        self._set_view(x0 + shift, x1 + shift)
+
+    def mouseReleaseEvent(self, event):
+        self._drag = None
+
+    def mouseDoubleClickEvent(self, event):
+        self._view = None
+        self.follow = True
+        self.update()
+
+    def _set_view(self, x0, x1):
+        full = self.data_range()
+        span = x1 - x0
+        if x0 < full[0]:
+            x0, x1 = full[0], full[0] + span
+        if x1 > full[1]:
+            x0, x1 = full[1] - span, full[1]
+        self._view = (max(x0, full[0]), x1)
+        self.follow = x1 >= full[1]
+        self.update()
+
+
+class HistoryLoader(QThread):
+    # syncs NAV history / account curves off the GUI thread
+    loaded = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.provider = RealProvider()
+        self.engine = HistoryEngine()
+        self.code = None
+        self.results = {}  # filled here, read by the panel after `loaded`
+
+    def load(self, code=None):
+        if self.isRunning():
+            return False
+        self.code = code
+        self.start()
+        return True
+
+    def run(self):
+        try:
+            if self.code:
+                history.sync_nav_history(self.provider, self.code)
+                self.results[("fund", self.code)] = database.get_nav_history(self.code)
+            else:
+                for code in {f["code"] for f in database.get_all_funds_with_positions()}:
+                    history.sync_nav_history(self.provider, code)
+                for name, curve in self.engine.update_all().items():
+                    self.results[("account", name)] = curve
+                self.results[("account", "全部")] = self.engine.portfolio_curve()
+        except Exception as e:
+            print(f"History load error: {e}")
+        self.loaded.emit()
+
+
+class ChartPanel(QWidget):
+    MODES = ["所选基金", "当前仓位"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        bar = QHBoxLayout()
+        self.title = QLabel("")
+        self.mode_combo = QComboBox()
+        self.mode_combo.addItems(self.MODES)
+        bar.addWidget(self.title)
+        bar.addStretch()
+        self.btn_reload = QPushButton("重新加载")
+        bar.addWidget(self.btn_reload)
+        bar.addWidget(self.mode_combo)
+        layout.addLayout(bar)
+        self.tabs = QTabWidget()
+        self.intraday = ChartWidget(_format_time, "{:+.2f}")
+        self.history = ChartWidget(_format_day)
+        self.tabs.addTab(self.intraday, "分时")
+        self.tabs.addTab(self.history, "历史")
+        layout.addWidget(self.tabs)
+
+        self.fund_ticks = {}     # fund id -> LodSeries of est_rate (%)
+        self.account_ticks = {}  # account -> LodSeries of today's P&L
+        self._nav_series = {}    # code -> LodSeries of NAV by day
+        self._account_series = {}  # account -> (market value, total P&L) LodSeries
+        self._tick_day = date.today()
+        self.fund = None  # (fid, code, name)
+        self.account = "全部"
+        self.loader = HistoryLoader(self)
+        self.loader.loaded.connect(self._history_loaded)
+        self._queued_code = False  # code waiting for the loader, None means account curves
+        self._attempted = {}  # code (None = account curves) -> monotonic time of a load that gave nothing
+
+        self.mode_combo.currentIndexChanged.connect(self.refresh)
+        self.btn_reload.clicked.connect(self.reload_history)
+        self.tabs.currentChanged.connect(self.refresh)
+
+    def fund_mode(self):
+        return self.mode_combo.currentIndex() == 0
+
+    def _roll_day(self, ts):
+        day = date.fromtimestamp(ts)
+        if day != self._tick_day:
+            self._tick_day = day
+            self.fund_ticks.clear()
+            self.account_ticks.clear()
+            self.refresh()
+
+    def add_fund_tick(self, fid, ts, value):
+        self._roll_day(ts)
+        series = self.fund_ticks.get(fid)
+        if series is None:
+            series = self.fund_ticks[fid] = LodSeries(64)
+        series.append(ts, value)
+        if self.fund_mode() and self.fund and self.fund[0] == fid:
+            if len(series) == 1:
+                self.refresh()
+            else:
+                self.intraday.data_appended()
+
+    def add_account_tick(self, account, ts, value):
+        self._roll_day(ts)
+        series = self.account_ticks.get(account)
+        if series is None:
+            series = self.account_ticks[account] = LodSeries(256)
+        series.append(ts, value)
+        if not self.fund_mode() and account == self.account:
+            if len(series) == 1:
+                self.refresh()
+            else:
+                self.intraday.data_appended()
+
+    def set_fund(self, fid, code, name):
+        if self.fund and self.fund[0] == fid:
+            return
+        self.fund = (fid, code, name)
+        if self.fund_mode():
+            self.refresh()
+
+    def set_account(self, name):
+        self.account = name
+        if not self.fund_mode():
+            self.refresh()
+
+    def refresh(self):
+        if self.fund_mode():
+            if not self.fund:
+                self.title.setText("")
+                self.intraday.set_series([])
+                self.history.set_series([])
+                return
+            fid, code, name = self.fund
+            self.title.setText(f"{code} {name}")
+            ticks = self.fund_ticks.get(fid)
+            self.intraday.set_series([("估算涨跌 %", ticks)] if ticks is not None else [])
+            nav = self._nav_series.get(code)
+            self.history.set_series([("单位净值", nav)] if nav is not None else [])
+            if nav is None and self.tabs.currentWidget() is self.history and self._may_request(code):
+                self._request(code)
+        else:
+            self.title.setText(f"仓位: {self.account}")
+            ticks = self.account_ticks.get(self.account)
+            self.intraday.set_series([("今日盈亏", ticks)] if ticks is not None else [])
+            curves = self._account_series.get(self.account)
+            self.history.set_series([("持仓市值", curves[0]), ("累计盈亏", curves[1])] if curves else [])
+            if curves is None and self.tabs.currentWidget() is self.history and self._may_request(None):
+                self._request(None)
+
+    def _may_request(self, code):
+        failed_at = self._attempted.get(code)
+        return failed_at is None or time.monotonic() - failed_at >= HISTORY_RETRY_SEC
+
+    def reload_history(self):
+        # user asked: fetch the shown history again even if it failed a moment ago
+        if self.fund_mode():
+            if not self.fund:
+                return
+            code = self.fund[1]
+            self._nav_series.pop(code, None)
+        else:
+            code = None
+            self._account_series.clear()
+        self._attempted.pop(code, None)
+        self._request(code)
+
+    def _request(self, code):
+        if not self.loader.load(code):
+            self._queued_code = code
+
+    def _history_loaded(self):
+        for (scope, key), data in self.loader.results.items():
+            if scope == "fund":
+                if data:
+                    days = np.array([d for d, _ in data], dtype="datetime64[D]").astype(np.int64)
+                    self._nav_series[key] = LodSeries.from_arrays(days, [nav for _, nav in data])
+            elif len(data["dates"]):
+                days = data["dates"].astype(np.int64)
+                self._account_series[key] = (LodSeries.from_arrays(days, data["market_value"]),
+                                             LodSeries.from_arrays(days, data["total_pnl"]))
+        self.loader.results = {}
+        # network error, no NAV rows or no curve for the shown account: remember it so
+        # refresh() does not start the same load again straight away
+        requested = self.loader.code
+        if requested:
+            loaded = requested in self._nav_series
+        else:
+            loaded = self.account in self._account_series
+        if loaded:
+            self._attempted.pop(requested, None)
+        else:
+            self._attempted[requested] = time.monotonic()
+        if self._queued_code is not False:
+            code, self._queued_code = self._queued_code, False
+            self._request(code)
+        self.refresh()
+
+    def invalidate_history(self):
+        # after trades change, account curves are rebuilt on next view
+        self._account_series.clear()
+        self._attempted.pop(None, None)
+
+    def shutdown(self):
+        self.loader.wait()
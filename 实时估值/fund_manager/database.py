@@ -1,14 +1,90 @@
 ﻿import sqlite3
 import datetime
 import os
+import threading
+from contextlib import contextmanager
 
 DB_FILE = "fund_data.db"
 
+_local = threading.local()
+
+
+class _SharedConnection:
+    # Handed out by get_connection() inside batch(): the helpers' commit()/close()
+    # are deferred to the batch, and rollback() only undoes the innermost savepoint.
+    def __init__(self, conn):
+        self._conn = conn
+        self._savepoints = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def rollback(self):
+        if self._savepoints:
+            self._conn.execute(f"ROLLBACK TO {self._savepoints[-1]}")
+        else:
+            self._conn.rollback()
+
+    @contextmanager
+    def savepoint(self):
+        name = f"sp{len(self._savepoints)}"
+        self._conn.execute(f"SAVEPOINT {name}")
+        self._savepoints.append(name)
+        try:
+            yield self
+        except Exception:
+            self._conn.execute(f"ROLLBACK TO {name}")
+            raise
+        finally:
+            self._savepoints.pop()
+            self._conn.execute(f"RELEASE {name}")
+
+
 def get_connection():
+    shared = getattr(_local, "shared", None)
+    if shared is not None:
+        return shared
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
     return conn
 
+@contextmanager
+def batch():
+    # every helper called on this thread inside the block shares one transaction
+    shared = getattr(_local, "shared", None)
+    if shared is not None:
+        yield shared
+        return
+    conn = sqlite3.connect(DB_FILE)
+    conn.row_factory = sqlite3.Row
+    conn.execute("BEGIN")
+    shared = _local.shared = _SharedConnection(conn)
+    try:
+        yield shared
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _local.shared = None
+        conn.close()
+
+@contextmanager
+def unit_of_work():
+    # one logical operation (e.g. add a trade and recalculate the position):
+    # every helper inside shares one connection and the whole thing commits
+    # once or not at all. Nested in batch() or another unit it becomes a
+    # savepoint, so a failure only undoes this operation.
+    with batch() as conn:
+        with conn.savepoint():
+            yield conn
+
 def init_db():
     conn = get_connection()
     c = conn.cursor()
@@ -44,6 +120,46 @@ def init_db():
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(fund_id) REFERENCES funds(id)
     )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS nav_history (
+        code TEXT NOT NULL,
+        nav_date TEXT NOT NULL,
+        nav REAL NOT NULL,
+        PRIMARY KEY(code, nav_date)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS daily_snapshots (
+        snap_date TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        key TEXT NOT NULL,
+        shares REAL,
+        cost_amount REAL,
+        nav REAL,
+        market_value REAL,
+        realized_pnl REAL,
+        unrealized_pnl REAL,
+        PRIMARY KEY(scope, key, snap_date)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS fund_holdings (
+        code TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        stock_name TEXT,
+        weight REAL NOT NULL,
+        stock_ratio REAL,
+        report_date TEXT,
+        PRIMARY KEY(code, symbol)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS alert_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scope TEXT NOT NULL,
+        target TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        op TEXT NOT NULL,
+        threshold REAL NOT NULL,
+        hysteresis REAL DEFAULT 0,
+        enabled INTEGER DEFAULT 1,
+        triggered INTEGER DEFAULT 0,
+        note TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''')
     # migrate old db: add account column if missing
     c.execute("PRAGMA table_info(funds)")
     cols = [row[1] for row in c.fetchall()]
@@ -63,9 +179,43 @@ def init_db():
     if "sort_order" not in a_cols:
         c.execute("ALTER TABLE accounts ADD COLUMN sort_order INTEGER")
     c.execute("UPDATE accounts SET sort_order = id WHERE sort_order IS NULL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_trades_fund_time ON trades(fund_id, trade_time)")
+    _init_trade_search(c)
+    _init_lots(c)
     conn.commit()
     conn.close()
 
+def _init_trade_search(c):
+    # full-text index over trade notes plus the fund's code and name, rowid = trades.id;
+    # triggers keep it in step with every write path, existing trades are indexed once
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trade_search'")
+    if c.fetchone():
+        return
+    try:
+        c.execute("CREATE VIRTUAL TABLE trade_search USING fts5(note, code, name, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        return  # SQLite built without FTS5/trigram: search_trades scans instead
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_search_insert AFTER INSERT ON trades BEGIN
+        INSERT INTO trade_search (rowid, note, code, name)
+        SELECT new.id, new.note, code, name FROM funds WHERE id = new.fund_id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_search_delete AFTER DELETE ON trades BEGIN
+        DELETE FROM trade_search WHERE rowid = old.id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_search_update AFTER UPDATE OF note, fund_id ON trades BEGIN
+        DELETE FROM trade_search WHERE rowid = old.id;
+        INSERT INTO trade_search (rowid, note, code, name)
+        SELECT new.id, new.note, code, name FROM funds WHERE id = new.fund_id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS funds_search_update AFTER UPDATE OF code, name ON funds BEGIN
+        UPDATE trade_search SET code = new.code, name = new.name
+        WHERE rowid IN (SELECT id FROM trades WHERE fund_id = new.id);
+    END''')
+    c.execute('''
+        INSERT INTO trade_search (rowid, note, code, name)
+        SELECT t.id, t.note, f.code, f.name FROM trades t JOIN funds f ON f.id = t.fund_id
+    ''')
+
 def add_fund(code, name, account="默认账户"):
     try:
         conn = get_connection()
@@ -82,19 +232,61 @@ def add_fund(code, name, account="默认账户"):
     finally:
         conn.close()
 
-def get_all_funds_with_positions():
+def get_all_funds_with_positions(account=None):
+    where, params = _account_filter(account)
     conn = get_connection()
     c = conn.cursor()
-    query = '''
+    query = f'''
         SELECT f.id, f.code, f.name, f.account, p.shares, p.cost_amount 
         FROM funds f 
         LEFT JOIN positions p ON f.id = p.fund_id
+        {where}
     '''
-    c.execute(query)
+    c.execute(query, params)
+    rows = c.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+def _account_filter(account):
+    if account and account != "全部":
+        return "WHERE COALESCE(f.account, '默认账户') = ?", (account,)
+    return "", ()
+
+def count_funds(account=None):
+    where, params = _account_filter(account)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"SELECT COUNT(1) FROM funds f {where}", params)
+    n = c.fetchone()[0]
+    conn.close()
+    return n
+
+def get_funds_page(account=None, offset=0, limit=200):
+    where, params = _account_filter(account)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT f.id, f.code, f.name, f.account, p.shares, p.cost_amount
+        FROM funds f
+        LEFT JOIN positions p ON f.id = p.fund_id
+        {where}
+        ORDER BY f.id
+        LIMIT ? OFFSET ?
+    ''', params + (limit, offset))
     rows = c.fetchall()
     conn.close()
     return [dict(row) for row in rows]
 
+def get_fund_refs(account=None):
+    # just what the quote worker needs to schedule fetches
+    where, params = _account_filter(account)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f"SELECT f.id, f.code, f.account FROM funds f {where} ORDER BY f.id", params)
+    rows = [{"id": r[0], "code": r[1], "account": r[2]} for r in c.fetchall()]
+    conn.close()
+    return rows
+
 def add_trade(fund_id, trade_type, date_str, amount, shares, price, fee, note):
     conn = get_connection()
     c = conn.cursor()
@@ -105,6 +297,102 @@ def add_trade(fund_id, trade_type, date_str, amount, shares, price, fee, note):
     conn.commit()
     conn.close()
 
+IMPORT_CHUNK_SIZE = 1000
+
+
+def import_trades(records, account="默认账户", chunk_size=IMPORT_CHUNK_SIZE):
+    # records (a lazy parser is fine) are staged chunk by chunk into a TEMP
+    # table, which takes no lock on the main database, so memory stays flat
+    # and the quote writer is not blocked while a large file is parsed. The
+    # trades are then inserted from the staging table in one statement.
+    # A trade is identified by fund, type, time and amount (shares can be
+    # rounded differently from one export to the next). The k-th occurrence of
+    # a key in the file is only inserted while fewer than k such trades exist,
+    # so re-imports are skipped but identical rows within one file all count.
+    # Rows without shares that carry a nav_date (their pricing session) take
+    # shares from that day's stored NAV when there is one.
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''CREATE TEMP TABLE IF NOT EXISTS import_staging (
+            seq INTEGER PRIMARY KEY, code TEXT, name TEXT, type TEXT, trade_time TEXT,
+            amount REAL, shares REAL, price REAL, fee REAL, note TEXT, nav_date TEXT
+        )''')
+        c.execute("DELETE FROM temp.import_staging")
+        batch = []
+        for rec in records:
+            batch.append((rec['code'], rec.get('name') or rec['code'], rec['type'], rec['trade_time'],
+                          rec['amount'], rec['shares'], rec.get('price'), rec.get('fee') or 0,
+                          rec.get('note'), rec.get('nav_date')))
+            if len(batch) >= chunk_size:
+                c.executemany("INSERT INTO temp.import_staging (code, name, type, trade_time, amount, shares, "
+                              "price, fee, note, nav_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                batch.clear()
+        if batch:
+            c.executemany("INSERT INTO temp.import_staging (code, name, type, trade_time, amount, shares, "
+                          "price, fee, note, nav_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+        # from here on the main database is written; this part is short
+        c.execute('''
+            SELECT s.code, s.name FROM temp.import_staging s
+            WHERE s.seq IN (SELECT MIN(seq) FROM temp.import_staging GROUP BY code)
+              AND s.code NOT IN (SELECT code FROM funds)
+        ''')
+        for code, name in c.fetchall():
+            c.execute("INSERT INTO funds (code, name, account) VALUES (?, ?, ?)", (code, name, account))
+            c.execute("INSERT INTO positions (fund_id, shares, cost_amount) VALUES (?, 0, 0)", (c.lastrowid,))
+        c.execute('''
+            UPDATE temp.import_staging
+            SET price = (SELECT n.nav FROM nav_history n
+                         WHERE n.code = import_staging.code AND n.nav_date = import_staging.nav_date)
+            WHERE shares = 0 AND amount > 0 AND nav_date IS NOT NULL
+        ''')
+        c.execute('''
+            UPDATE temp.import_staging SET shares = amount / price
+            WHERE shares = 0 AND amount > 0 AND price > 0
+        ''')
+        c.execute("SELECT COALESCE(MAX(id), 0) FROM trades")
+        last_id = c.fetchone()[0]
+        c.execute('''
+            INSERT INTO trades (fund_id, type, trade_time, amount, shares, price, fee, note)
+            SELECT staged.fund_id, staged.type, staged.trade_time, staged.amount,
+                   staged.shares, staged.price, staged.fee, staged.note
+            FROM (
+                SELECT s.*, f.id AS fund_id,
+                       ROW_NUMBER() OVER (PARTITION BY f.id, s.type, s.trade_time, s.amount ORDER BY s.seq) AS k
+                FROM temp.import_staging s JOIN funds f ON f.code = s.code
+            ) AS staged
+            LEFT JOIN (
+                SELECT fund_id, type, trade_time, amount, COUNT(1) AS n FROM trades
+                WHERE fund_id IN (SELECT f.id FROM funds f WHERE f.code IN (SELECT code FROM temp.import_staging))
+                GROUP BY fund_id, type, trade_time, amount
+            ) AS existing
+              ON existing.fund_id = staged.fund_id AND existing.type = staged.type
+             AND existing.trade_time = staged.trade_time AND existing.amount = staged.amount
+            WHERE staged.k > COALESCE(existing.n, 0)
+            ORDER BY staged.seq
+        ''')
+        inserted = c.rowcount
+        c.execute('''
+            SELECT COUNT(1), COALESCE(SUM(k > 1), 0) FROM (
+                SELECT ROW_NUMBER() OVER (PARTITION BY code, type, trade_time, amount ORDER BY seq) AS k
+                FROM temp.import_staging
+            )
+        ''')
+        total, repeated = c.fetchone()
+        # only funds that actually got new trades need recalculating
+        c.execute("SELECT DISTINCT fund_id FROM trades WHERE id > ? ORDER BY fund_id", (last_id,))
+        touched = [row[0] for row in c.fetchall()]
+        c.execute("DELETE FROM temp.import_staging")
+        conn.commit()
+        return True, {"total": total, "inserted": inserted, "duplicates": total - inserted,
+                      "repeated": repeated, "touched": touched}
+    except Exception as e:
+        conn.rollback()
+        return False, str(e)
+    finally:
+        conn.close()
+
 def update_position(fund_id, shares, cost_amount):
     conn = get_connection()
     c = conn.cursor()
@@ -124,6 +412,132 @@ def get_trades_by_fund(fund_id):
     conn.close()
     return [dict(row) for row in rows]
 
+def _init_lots(c):
+    # open lots per (fund, cost method) and how far into the trade list they are applied.
+    # Dropping the lot_state row makes lots.sync() rebuild that fund; the triggers do it
+    # whenever a trade changes, is deleted, or is inserted before the applied point.
+    c.execute('''CREATE TABLE IF NOT EXISTS lots (
+        fund_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        trade_id INTEGER NOT NULL,
+        trade_time TEXT NOT NULL,
+        acquired TEXT NOT NULL,
+        shares REAL NOT NULL,
+        cost REAL NOT NULL,
+        PRIMARY KEY(fund_id, method, trade_id)
+    )''')
+    c.execute('''CREATE TABLE IF NOT EXISTS lot_state (
+        fund_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        last_time TEXT NOT NULL,
+        last_id INTEGER NOT NULL,
+        shares REAL NOT NULL,
+        cost REAL NOT NULL,
+        realized REAL NOT NULL,
+        PRIMARY KEY(fund_id, method)
+    )''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_lots_insert AFTER INSERT ON trades
+        WHEN EXISTS (SELECT 1 FROM lot_state WHERE fund_id = new.fund_id AND last_time > new.trade_time) BEGIN
+        DELETE FROM lot_state WHERE fund_id = new.fund_id;
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_lots_update
+        AFTER UPDATE OF fund_id, type, trade_time, amount, shares, price, fee ON trades BEGIN
+        DELETE FROM lot_state WHERE fund_id IN (old.fund_id, new.fund_id);
+    END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trades_lots_delete AFTER DELETE ON trades BEGIN
+        DELETE FROM lot_state WHERE fund_id = old.fund_id;
+    END''')
+
+def get_lot_state(fund_id, method):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM lot_state WHERE fund_id = ? AND method = ?", (fund_id, method))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_lots(fund_id, method):
+    # open lots in acquisition order
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT trade_id, trade_time, acquired, shares, cost FROM lots
+        WHERE fund_id = ? AND method = ? ORDER BY trade_time, trade_id
+    ''', (fund_id, method))
+    rows = [dict(r) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_trades_after(fund_id, trade_time="", trade_id=0):
+    # trades ordered by (trade_time, id) strictly after the given one
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT * FROM trades
+        WHERE fund_id = ? AND (trade_time > ? OR (trade_time = ? AND id > ?))
+        ORDER BY trade_time, id
+    ''', (fund_id, trade_time, trade_time, trade_id))
+    rows = [dict(r) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def save_lot_book(fund_id, method, state, changed, removed, replace=False):
+    # state: (last_time, last_id, shares, cost, realized); changed: lot dicts to upsert;
+    # removed: trade ids of lots fully sold; replace drops every stored lot first
+    conn = get_connection()
+    c = conn.cursor()
+    if replace:
+        c.execute("DELETE FROM lots WHERE fund_id = ? AND method = ?", (fund_id, method))
+    elif removed:
+        c.executemany("DELETE FROM lots WHERE fund_id = ? AND method = ? AND trade_id = ?",
+                      [(fund_id, method, tid) for tid in removed])
+    c.executemany('''
+        INSERT OR REPLACE INTO lots (fund_id, method, trade_id, trade_time, acquired, shares, cost)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(fund_id, method, lot["trade_id"], lot["trade_time"], lot["acquired"], lot["shares"], lot["cost"])
+          for lot in changed])
+    c.execute('''
+        INSERT OR REPLACE INTO lot_state (fund_id, method, last_time, last_id, shares, cost, realized)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (fund_id, method) + tuple(state))
+    conn.commit()
+    conn.close()
+
+SEARCH_PAGE_SIZE = 50
+SEARCH_MIN_TERM = 3  # the trigram index needs 3 characters; shorter terms are checked row by row
+
+
+def search_trades(query, offset=0, limit=SEARCH_PAGE_SIZE):
+    # whitespace-separated terms, each must appear in the note, fund code or fund name.
+    # Returns (one page of trades, latest first, whether another page follows).
+    terms = [t.lower() for t in query.split()]
+    if not terms:
+        return [], False
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trade_search'")
+    indexed = c.fetchone() is not None
+    long_terms = [t for t in terms if len(t) >= SEARCH_MIN_TERM] if indexed else []
+    source = "trades t JOIN funds f ON f.id = t.fund_id"
+    where, params = [], []
+    if long_terms:
+        source = "trade_search s JOIN trades t ON t.id = s.rowid JOIN funds f ON f.id = t.fund_id"
+        where.append("trade_search MATCH ?")
+        params.append(" ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+    for t in terms:
+        if t not in long_terms:
+            where.append("(instr(lower(t.note), ?) > 0 OR instr(f.code, ?) > 0 OR instr(lower(f.name), ?) > 0)")
+            params += [t, t, t]
+    c.execute(f'''
+        SELECT t.*, f.code, f.name, f.account FROM {source}
+        WHERE {" AND ".join(where)}
+        ORDER BY t.trade_time DESC, t.id DESC
+        LIMIT ? OFFSET ?
+    ''', params + [limit + 1, offset])
+    rows = [dict(r) for r in c.fetchall()]
+    conn.close()
+    return rows[:limit], len(rows) > limit
+
 def get_accounts():
     conn = get_connection()
     c = conn.cursor()
@@ -182,6 +596,8 @@ def rename_account(old_name, new_name):
             return False, "仓位名称已存在"
         c.execute("UPDATE accounts SET name = ? WHERE name = ?", (new_name, old_name))
         c.execute("UPDATE funds SET account = ? WHERE account = ?", (new_name, old_name))
+        c.execute("UPDATE daily_snapshots SET key = ? WHERE scope = 'account' AND key = ?", (new_name, old_name))
+        c.execute("UPDATE alert_rules SET target = ? WHERE scope = 'account' AND target = ?", (new_name, old_name))
         conn.commit()
         return True, "Success"
     except Exception as e:
@@ -205,7 +621,7 @@ def get_fund_with_position(fund_id):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT f.id, f.code, f.name, p.shares, p.cost_amount
+        SELECT f.id, f.code, f.name, f.account, p.shares, p.cost_amount
         FROM funds f
         LEFT JOIN positions p ON f.id = p.fund_id
         WHERE f.id = ?
@@ -231,6 +647,8 @@ def delete_fund(fund_id):
     try:
         c.execute("DELETE FROM trades WHERE fund_id = ?", (fund_id,))
         c.execute("DELETE FROM positions WHERE fund_id = ?", (fund_id,))
+        c.execute("DELETE FROM lots WHERE fund_id = ?", (fund_id,))
+        c.execute("DELETE FROM lot_state WHERE fund_id = ?", (fund_id,))
         c.execute("DELETE FROM funds WHERE id = ?", (fund_id,))
         conn.commit()
         return True, "Success"
@@ -239,3 +657,173 @@ def delete_fund(fund_id):
         return False, str(e)
     finally:
         conn.close()
+
+def upsert_nav_history(code, rows):
+    # rows: iterable of (nav_date, nav)
+    conn = get_connection()
+    c = conn.cursor()
+    c.executemany(
+        "INSERT OR REPLACE INTO nav_history (code, nav_date, nav) VALUES (?, ?, ?)",
+        ((code, d, nav) for d, nav in rows),
+    )
+    n = c.rowcount
+    conn.commit()
+    conn.close()
+    return n
+
+def get_nav_history(code, since=None):
+    conn = get_connection()
+    c = conn.cursor()
+    if since:
+        c.execute("SELECT nav_date, nav FROM nav_history WHERE code = ? AND nav_date > ? ORDER BY nav_date ASC",
+                  (code, since))
+    else:
+        c.execute("SELECT nav_date, nav FROM nav_history WHERE code = ? ORDER BY nav_date ASC", (code,))
+    rows = [(r[0], r[1]) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def get_nav_on_or_before(code, nav_date):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT nav FROM nav_history WHERE code = ? AND nav_date <= ? ORDER BY nav_date DESC LIMIT 1",
+              (code, nav_date))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def get_last_nav_date(code):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT MAX(nav_date) FROM nav_history WHERE code = ?", (code,))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def replace_fund_holdings(code, report_date, rows, stock_ratio=None):
+    # rows: iterable of (symbol, stock_name, weight); weight and stock_ratio are fractions of NAV
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM fund_holdings WHERE code = ?", (code,))
+    c.executemany('''
+        INSERT OR REPLACE INTO fund_holdings (code, symbol, stock_name, weight, stock_ratio, report_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((code, symbol, name, weight, stock_ratio, report_date) for symbol, name, weight in rows))
+    conn.commit()
+    conn.close()
+
+def get_fund_holdings(code=None):
+    conn = get_connection()
+    c = conn.cursor()
+    if code:
+        c.execute("SELECT * FROM fund_holdings WHERE code = ?", (code,))
+    else:
+        c.execute("SELECT * FROM fund_holdings ORDER BY code")
+    rows = [dict(r) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def write_snapshots(rows):
+    # rows: (snap_date, scope, key, shares, cost_amount, nav, market_value, realized_pnl, unrealized_pnl)
+    conn = get_connection()
+    c = conn.cursor()
+    c.executemany('''
+        INSERT OR REPLACE INTO daily_snapshots
+        (snap_date, scope, key, shares, cost_amount, nav, market_value, realized_pnl, unrealized_pnl)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+def refresh_group_snapshots(snap_date):
+    # account and portfolio rows roll up each fund's latest snapshot on or before snap_date
+    conn = get_connection()
+    c = conn.cursor()
+    latest = '''
+        FROM funds f
+        JOIN daily_snapshots s ON s.scope = 'fund' AND s.key = f.code
+         AND s.snap_date = (SELECT MAX(snap_date) FROM daily_snapshots
+                            WHERE scope = 'fund' AND key = f.code AND snap_date <= ?)
+    '''
+    c.execute(f'''
+        INSERT OR REPLACE INTO daily_snapshots
+        (snap_date, scope, key, shares, cost_amount, nav, market_value, realized_pnl, unrealized_pnl)
+        SELECT ?, 'account', COALESCE(f.account, '默认账户'), NULL, SUM(s.cost_amount), NULL,
+               SUM(s.market_value), SUM(s.realized_pnl), SUM(s.unrealized_pnl)
+        {latest}
+        GROUP BY COALESCE(f.account, '默认账户')
+    ''', (snap_date, snap_date))
+    c.execute(f'''
+        INSERT OR REPLACE INTO daily_snapshots
+        (snap_date, scope, key, shares, cost_amount, nav, market_value, realized_pnl, unrealized_pnl)
+        SELECT ?, 'portfolio', '全部', NULL, SUM(s.cost_amount), NULL,
+               SUM(s.market_value), SUM(s.realized_pnl), SUM(s.unrealized_pnl)
+        {latest}
+        HAVING COUNT(1) > 0
+    ''', (snap_date, snap_date))
+    conn.commit()
+    conn.close()
+
+def get_snapshot_on_or_before(scope, key, snap_date):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('''
+        SELECT * FROM daily_snapshots
+        WHERE scope = ? AND key = ? AND snap_date <= ?
+        ORDER BY snap_date DESC LIMIT 1
+    ''', (scope, key, snap_date))
+    row = c.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_last_snapshot_dates():
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT key, MAX(snap_date) FROM daily_snapshots WHERE scope = 'fund' GROUP BY key")
+    rows = {r[0]: r[1] for r in c.fetchall()}
+    conn.close()
+    return rows
+
+def get_alert_rules(enabled_only=False):
+    conn = get_connection()
+    c = conn.cursor()
+    if enabled_only:
+        c.execute("SELECT * FROM alert_rules WHERE enabled = 1 ORDER BY id")
+    else:
+        c.execute("SELECT * FROM alert_rules ORDER BY id")
+    rows = [dict(r) for r in c.fetchall()]
+    conn.close()
+    return rows
+
+def add_alert_rule(scope, target, metric, op, threshold, hysteresis=0, note=None):
+    if scope not in ("fund", "account") or op not in ("<", ">"):
+        return False, "规则参数无效"
+    if not target:
+        return False, "请填写基金代码或仓位"
+    try:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO alert_rules (scope, target, metric, op, threshold, hysteresis, note)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (scope, target, metric, op, threshold, hysteresis, note))
+        conn.commit()
+        return True, "Success"
+    except Exception as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+def delete_alert_rule(rule_id):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM alert_rules WHERE id = ?", (rule_id,))
+    conn.commit()
+    conn.close()
+
+def set_alert_triggered(rule_id, triggered):
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("UPDATE alert_rules SET triggered = ? WHERE id = ?", (1 if triggered else 0, rule_id))
+    conn.commit()
+    conn.close()
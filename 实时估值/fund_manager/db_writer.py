@@ -0,0 +1,106 @@
+from PySide6.QtCore import QThread, Signal
+from concurrent.futures import Future
+from collections import OrderedDict, deque
+import threading
+
+import database
+
+MAX_BATCH = 200
+
+
+class _Job:
+    __slots__ = ("fn", "args", "callback", "future")
+
+    def __init__(self, fn, args, callback):
+        self.fn = fn
+        self.args = args
+        self.callback = callback
+        self.future = Future()
+
+
+class DbWriter(QThread):
+    # callbacks are queued here and run on the GUI thread when this fires;
+    # results never travel as signal arguments
+    results_ready = Signal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = OrderedDict()  # key -> _Job, in submission order
+        self._seq = 0
+        self._cond = threading.Condition()
+        self.running = True
+        self._results = deque()  # (callback, value), appended by run(), drained on the GUI thread
+        self.results_ready.connect(self._deliver)
+
+    def submit(self, key, fn, *args, callback=None):
+        # a job with the same key that has not started yet is replaced in place,
+        # so a burst of quotes for one fund collapses into one write
+        with self._cond:
+            if key is None:
+                self._seq += 1
+                key = ("__seq__", self._seq)
+            job = self._jobs.get(key)
+            if job is not None:
+                job.fn, job.args, job.callback = fn, args, callback
+            else:
+                job = self._jobs[key] = _Job(fn, args, callback)
+            self._cond.notify()
+            return job.future
+
+    def _take_batch(self):
+        with self._cond:
+            while self.running and not self._jobs:
+                self._cond.wait(0.5)
+            batch = []
+            while self._jobs and len(batch) < MAX_BATCH:
+                batch.append(self._jobs.popitem(last=False)[1])
+            return batch
+
+    def run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if not self.running:
+                    break
+                continue
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        results = []
+        try:
+            # one transaction for the whole batch
+            with database.batch() as conn:
+                for job in batch:
+                    try:
+                        # a failing job only rolls back its own savepoint
+                        with conn.savepoint():
+                            value = job.fn(*job.args)
+                        results.append((job, value, None))
+                    except Exception as e:
+                        results.append((job, None, e))
+        except Exception as e:
+            results = [(job, None, e) for job in batch]
+        pending = False
+        for job, value, error in results:
+            if error is not None:
+                print(f"DB write error: {error}")
+                job.future.set_exception(error)
+                continue
+            job.future.set_result(value)
+            if job.callback is not None:
+                self._results.append((job.callback, value))
+                pending = True
+        if pending:
+            self.results_ready.emit()
+
+    def _deliver(self):
+        while self._results:
+            callback, value = self._results.popleft()
+            callback(value)
+
+    def stop(self):
+        # drains whatever is queued before returning
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self.wait()
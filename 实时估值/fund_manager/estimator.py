@@ -0,0 +1,257 @@
+import re
+import threading
+import time
+
+import numpy as np
+import requests
+
+import database
+import parsing
+
+# In-house estimate from each fund's disclosed top holdings:
+#   est_rate = mean return of the quoted holdings (by weight) * stock share of NAV
+# Weights live in one sparse funds x stocks matrix, so every fund's estimate is
+# a single matrix-vector product with the stock return vector.
+
+HOLDINGS_URL = "http://fundf10.eastmoney.com"
+PINGZHONG_URL = "http://fund.eastmoney.com"
+STOCK_REFRESH_SEC = 5
+
+_SINA_RE = re.compile(r'hq_str_(\w+)="([^"]*)"')
+
+
+def stock_symbol(stock_code):
+    # exchange-prefixed symbol: sh600519 / sz000001 / bj830799 / hk00700
+    if len(stock_code) == 5:
+        return f"hk{stock_code}"
+    if stock_code[0] in "569":
+        return f"sh{stock_code}"
+    if stock_code[0] in "48":
+        return f"bj{stock_code}"
+    return f"sz{stock_code}"
+
+
+class StockFeed:
+    # fetch(symbols) -> {symbol: return since previous close}
+    # base_url can be pointed at a local stand-in server for testing.
+    name = 'base'
+
+    def __init__(self, base_url=None, timeout=5):
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def fetch(self, symbols):
+        raise NotImplementedError
+
+
+class SinaStockFeed(StockFeed):
+    name = '新浪行情'
+    base_url = 'http://hq.sinajs.cn'
+    MAX_SYMBOLS = 200  # per request
+
+    def fetch(self, symbols):
+        headers = {'Referer': 'https://finance.sina.com.cn/'}
+        returns = {}
+        symbols = list(symbols)
+        for i in range(0, len(symbols), self.MAX_SYMBOLS):
+            chunk = symbols[i:i + self.MAX_SYMBOLS]
+            query = ",".join(f"rt_{s}" if s.startswith("hk") else s for s in chunk)
+            resp = requests.get(f"{self.base_url}/list={query}", headers=headers, timeout=self.timeout)
+            for key, body in _SINA_RE.findall(resp.text):
+                parts = body.split(',')
+                try:
+                    if key.startswith("rt_hk"):
+                        # name_en, name, open, prev_close, high, low, price, ...
+                        symbol, prev_close, price = key[3:], float(parts[3]), float(parts[6])
+                    else:
+                        # name, open, prev_close, price, ...
+                        symbol, prev_close, price = key, float(parts[2]), float(parts[3])
+                except (IndexError, ValueError):
+                    continue
+                if prev_close > 0 and price > 0:
+                    returns[symbol] = price / prev_close - 1.0
+        return returns
+
+
+def fetch_holdings(code, holdings_url=HOLDINGS_URL, pingzhong_url=PINGZHONG_URL, timeout=10):
+    # latest top holdings and stock share of NAV; stored, then returned as DB rows
+    resp = requests.get(f"{holdings_url}/FundArchivesDatas.aspx",
+                        params={'type': 'jjcc', 'code': code, 'topline': 10}, timeout=timeout)
+    report_date, holdings = parsing.parse_holdings(resp.content)
+    if not holdings:
+        return []
+    try:
+        resp = requests.get(f"{pingzhong_url}/pingzhongdata/{code}.js", timeout=timeout)
+        stock_ratio = parsing.parse_stock_ratio(resp.content)
+    except Exception:
+        stock_ratio = None
+    rows = [(stock_symbol(stock_code), name, weight) for stock_code, name, weight in holdings]
+    database.replace_fund_holdings(code, report_date, rows, stock_ratio)
+    return database.get_fund_holdings(code)
+
+
+class HoldingsMatrix:
+    # W (funds x stocks) in CSR for the full product, plus a CSC copy so a
+    # single stock tick only touches the funds that hold it.
+    def __init__(self):
+        self.row_of = {}
+        self.codes = []
+        self.col_of = {}
+        self.symbols = []
+        self.returns = np.zeros(0)
+        self.quoted = np.zeros(0, dtype=bool)
+        self.stock_ratio = np.zeros(0)
+        self._total = self._weighted = self._covered = np.zeros(0)
+        self._set_arrays(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0), 0, 0)
+
+    def _set_arrays(self, rows, cols, weights, n_rows, n_cols):
+        order = np.lexsort((cols, rows))
+        self.indptr = np.searchsorted(rows[order], np.arange(n_rows + 1))
+        self.indices = cols[order]
+        self.data = weights[order]
+        order = np.lexsort((rows, cols))
+        self.col_indptr = np.searchsorted(cols[order], np.arange(n_cols + 1))
+        self.col_rows = rows[order]
+        self.col_data = weights[order]
+
+    def build(self, holdings):
+        # holdings: rows from database.get_fund_holdings()
+        codes = sorted({h['code'] for h in holdings})
+        symbols = sorted({h['symbol'] for h in holdings})
+        row_of = {c: i for i, c in enumerate(codes)}
+        col_of = {s: j for j, s in enumerate(symbols)}
+        rows = np.fromiter((row_of[h['code']] for h in holdings), dtype=np.int64, count=len(holdings))
+        cols = np.fromiter((col_of[h['symbol']] for h in holdings), dtype=np.int64, count=len(holdings))
+        weights = np.fromiter((float(h['weight']) for h in holdings), dtype=float, count=len(holdings))
+        self._set_arrays(rows, cols, weights, len(codes), len(symbols))
+
+        # keep the returns already seen for stocks that are still held
+        returns = np.zeros(len(symbols))
+        quoted = np.zeros(len(symbols), dtype=bool)
+        for s, j in col_of.items():
+            old = self.col_of.get(s)
+            if old is not None:
+                returns[j] = self.returns[old]
+                quoted[j] = self.quoted[old]
+        self.codes, self.row_of = codes, row_of
+        self.symbols, self.col_of = symbols, col_of
+        self.returns, self.quoted = returns, quoted
+
+        # disclosed weights stand in for the stock share when it is unknown
+        self._total = self._matvec(np.ones(len(symbols)))
+        self.stock_ratio = self._total.copy()
+        for h in holdings:
+            if h.get('stock_ratio'):
+                self.stock_ratio[row_of[h['code']]] = float(h['stock_ratio'])
+        self.recompute()
+
+    def _matvec(self, x):
+        n = len(self.codes)
+        if not len(self.data):
+            return np.zeros(n)
+        # rows are never empty (they come from holdings), so reduceat is exact
+        return np.add.reduceat(self.data * x[self.indices], self.indptr[:-1])
+
+    def recompute(self):
+        self._weighted = self._matvec(self.returns)
+        self._covered = self._matvec(self.quoted.astype(float))
+
+    def update_returns(self, returns):
+        # returns: {symbol: return}; unknown symbols are ignored
+        cols, values = [], []
+        for symbol, r in returns.items():
+            j = self.col_of.get(symbol)
+            if j is not None:
+                cols.append(j)
+                values.append(r)
+        if not cols:
+            return 0
+        cols = np.array(cols)
+        values = np.array(values, dtype=float)
+        delta = values - self.returns[cols]
+        newly = ~self.quoted[cols]
+        self.returns[cols] = values
+        self.quoted[cols] = True
+        if len(cols) * 4 > len(self.symbols):
+            # a large share of the vector moved: one full product beats scattering
+            self.recompute()
+            return len(cols)
+        for j, d, new in zip(cols, delta, newly):
+            lo, hi = self.col_indptr[j], self.col_indptr[j + 1]
+            rows = self.col_rows[lo:hi]
+            w = self.col_data[lo:hi]
+            self._weighted[rows] += w * d
+            if new:
+                self._covered[rows] += w
+        return len(cols)
+
+    def estimate(self, code):
+        # (est_rate, coverage) or None when none of the fund's holdings is quoted
+        i = self.row_of.get(code)
+        if i is None or self._covered[i] <= 0:
+            return None
+        rate = self._weighted[i] / self._covered[i] * self.stock_ratio[i]
+        return float(rate), float(self._covered[i] / self._total[i])
+
+    def estimate_all(self):
+        rates = np.divide(self._weighted, self._covered, out=np.zeros(len(self.codes)), where=self._covered > 0)
+        return dict(zip(self.codes, (rates * self.stock_ratio).tolist()))
+
+
+class HoldingsEstimator:
+    def __init__(self, feed=None, refresh_sec=STOCK_REFRESH_SEC, holdings_url=HOLDINGS_URL,
+                 pingzhong_url=PINGZHONG_URL):
+        self.feed = feed if feed is not None else SinaStockFeed()
+        self.refresh_sec = refresh_sec
+        self.holdings_url = holdings_url
+        self.pingzhong_url = pingzhong_url
+        self.matrix = HoldingsMatrix()
+        self._holdings = {}  # code -> rows
+        self._missing = set()  # codes with no disclosed stock holdings
+        self._last_poll = float('-inf')
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            self._holdings = {}
+            for h in database.get_fund_holdings():
+                self._holdings.setdefault(h['code'], []).append(h)
+            self._rebuild()
+
+    def _rebuild(self):
+        self.matrix.build([h for rows in self._holdings.values() for h in rows])
+
+    def ensure(self, code):
+        with self._lock:
+            if code in self._holdings or code in self._missing:
+                return code in self._holdings
+        rows = fetch_holdings(code, self.holdings_url, self.pingzhong_url)
+        with self._lock:
+            if not rows:
+                self._missing.add(code)
+                return False
+            self._holdings[code] = rows
+            self._rebuild()
+            self._last_poll = float('-inf')
+            return True
+
+    def on_stock_quotes(self, returns):
+        with self._lock:
+            return self.matrix.update_returns(returns)
+
+    def poll(self, force=False):
+        # one batched feed request covers every fund's constituents
+        with self._lock:
+            if not force and time.monotonic() - self._last_poll < self.refresh_sec:
+                return 0
+            self._last_poll = time.monotonic()
+            symbols = list(self.matrix.symbols)
+        if not symbols:
+            return 0
+        return self.on_stock_quotes(self.feed.fetch(symbols))
+
+    def estimate(self, code):
+        with self._lock:
+            return self.matrix.estimate(code)
@@ -0,0 +1,213 @@
+import argparse
+import csv
+import json
+import os
+import sys
+
+import database
+
+CHUNK_ROWS = 5000
+
+DATASETS = {
+    'trades': '''
+        SELECT t.id, f.code, f.name, f.account, t.type, t.trade_time,
+               t.amount, t.shares, t.price, t.fee, t.note
+        FROM trades t
+        JOIN funds f ON f.id = t.fund_id
+        ORDER BY t.id
+    ''',
+    'positions': '''
+        SELECT f.id AS fund_id, f.code, f.name, f.account,
+               p.shares, p.cost_amount, p.updated_at
+        FROM funds f
+        LEFT JOIN positions p ON f.id = p.fund_id
+        ORDER BY f.id
+    ''',
+    'accounts': '''
+        SELECT f.account, COUNT(1) AS funds,
+               SUM(COALESCE(p.shares, 0) > 0) AS held_funds,
+               SUM(COALESCE(p.cost_amount, 0)) AS cost_amount
+        FROM funds f
+        LEFT JOIN positions p ON f.id = p.fund_id
+        GROUP BY f.account
+        ORDER BY f.account
+    ''',
+}
+
+# history tables are exported as-is when present in the database
+HISTORY_TABLES = ('nav_history', 'daily_snapshots')
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+# save-dialog name filter -> format
+FILE_FILTERS = {'CSV (*.csv)': 'csv', 'JSON Lines (*.jsonl)': 'jsonl', 'Parquet (*.parquet)': 'parquet'}
+
+
+def available_datasets():
+    conn = database.get_connection()
+    try:
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in c.fetchall()}
+    finally:
+        conn.close()
+    return list(DATASETS) + [t for t in HISTORY_TABLES if t in tables]
+
+
+def _dataset_query(name):
+    if name in DATASETS:
+        return DATASETS[name]
+    if name in HISTORY_TABLES:
+        return f"SELECT * FROM {name} ORDER BY rowid"
+    raise ValueError(f"未知的数据集: {name}")
+
+
+def guess_format(path):
+    lower = path.lower()
+    if lower.endswith('.jsonl') or lower.endswith('.ndjson'):
+        return 'jsonl'
+    if lower.endswith('.parquet'):
+        return 'parquet'
+    return 'csv'
+
+
+def iter_chunks(query, chunk_rows=CHUNK_ROWS):
+    # plain tuples straight off the cursor, never a full list of dicts
+    conn = database.get_connection()
+    conn.row_factory = None
+    try:
+        c = conn.cursor()
+        c.execute(query)
+        columns = [d[0] for d in c.description]
+        yield columns
+        while True:
+            rows = c.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+
+class _CsvWriter:
+    def __init__(self, path, columns):
+        # utf-8-sig so Excel opens Chinese text correctly
+        self.f = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.f)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _JsonlWriter:
+    def __init__(self, path, columns):
+        self.f = open(path, 'w', encoding='utf-8')
+        self.columns = columns
+
+    def write(self, rows):
+        cols = self.columns
+        self.f.writelines(json.dumps(dict(zip(cols, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self):
+        self.f.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("导出 parquet 需要安装 pyarrow")
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.columns = columns
+        self.writer = None
+
+    def write(self, rows):
+        # one row group per chunk
+        data = {col: [row[i] for row in rows] for i, col in enumerate(self.columns)}
+        table = self.pa.Table.from_pydict(data)
+        if self.writer is None:
+            # all-NULL first chunk: fall back to string columns
+            schema = self.pa.schema([
+                self.pa.field(f.name, self.pa.string()) if self.pa.types.is_null(f.type) else f
+                for f in table.schema
+            ])
+            table = table.cast(schema)
+            self.writer = self.pq.ParquetWriter(self.path, schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(
+                self.path, self.pa.schema([(c, self.pa.string()) for c in self.columns]))
+        self.writer.close()
+
+
+WRITERS = {'csv': _CsvWriter, 'jsonl': _JsonlWriter, 'parquet': _ParquetWriter}
+
+
+def export_dataset(name, path, fmt=None, chunk_rows=CHUNK_ROWS, progress=None, should_stop=None):
+    # rows written, or None when should_stop() cancelled the export;
+    # a cancelled or failed export removes the partial file
+    fmt = fmt or guess_format(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"不支持的格式: {fmt}")
+    chunks = iter_chunks(_dataset_query(name), chunk_rows)
+    writer = None
+    written = 0
+    complete = False
+    try:
+        columns = next(chunks)
+        writer = WRITERS[fmt](path, columns)
+        for rows in chunks:
+            if should_stop and should_stop():
+                break
+            writer.write(rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+        else:
+            complete = True
+    finally:
+        chunks.close()
+        if writer is not None:
+            try:
+                writer.close()
+            finally:
+                if not complete:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+    return written if complete else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导出交易、持仓和净值数据")
+    parser.add_argument("dataset", help="数据集: " + ", ".join(list(DATASETS) + list(HISTORY_TABLES)))
+    parser.add_argument("output", help="输出文件路径")
+    parser.add_argument("--format", choices=FORMATS, help="默认根据扩展名推断")
+    parser.add_argument("--db", default=database.DB_FILE, help="数据库文件")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    database.DB_FILE = args.db
+    try:
+        n = export_dataset(args.dataset, args.output, args.format, args.chunk_rows,
+                           progress=lambda n: print(f"\r{n} rows", end="", file=sys.stderr))
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"\r{n} rows -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+from datetime import datetime
+import numpy as np
+
+import database
+import calc
+import nav_archive
+
+CURVE_FIELDS = ('nav', 'shares', 'cost', 'market_value', 'realized_pnl', 'unrealized_pnl', 'total_pnl')
+
+
+def sync_nav_history(provider, code):
+    # store only the days we don't have yet; the columnar archive follows the table
+    last = database.get_last_nav_date(code)
+    rows = provider.get_nav_history(code, since=last)
+    if rows:
+        database.upsert_nav_history(code, rows)
+    archive = nav_archive.get_archive()
+    # first time in the archive: take the whole stored series
+    archived = rows if code in archive else database.get_nav_history(code)
+    if archived:
+        archive.append(code, archived)
+    return len(rows)
+
+
+def _to_days(date_strs):
+    return np.array(date_strs, dtype='datetime64[D]')
+
+
+def _trade_signature(trades):
+    return [(t['id'], t['type'], t['trade_time'], float(t['amount']), float(t['shares']), float(t['fee']))
+            for t in trades]
+
+
+def _first_difference(old, new):
+    for i, (a, b) in enumerate(zip(old, new)):
+        if a != b:
+            return i
+    if len(old) == len(new):
+        return None
+    return min(len(old), len(new))
+
+
+class _FundState:
+    def __init__(self):
+        self.dates = np.empty(0, dtype='datetime64[D]')
+        self.nav = np.empty(0)
+        self.curve = {f: np.empty(0) for f in CURVE_FIELDS if f != 'nav'}
+        self.signature = []
+        self.event_dates = np.empty(0, dtype='datetime64[D]')
+        self.events = None  # (shares_after, cost_after, realized_cum)
+        self.unpriced_from = None
+        self.version = 0
+
+
+class HistoryEngine:
+    def __init__(self):
+        self._funds = {}     # fund_id -> _FundState
+        self._accounts = {}  # account -> (member versions, curve)
+
+    def _effective_date(self, trade):
+        try:
+            trade_time = datetime.strptime(trade['trade_time'], "%Y-%m-%d %H:%M:%S")
+        except Exception:
+            return np.datetime64(trade['trade_time'][:10], 'D')
+        return np.datetime64(calc.pricing_date(trade_time), 'D')
+
+    def _replay(self, st, trades):
+        confirmed = [t for t in trades if t['type'] == 'sell' or float(t['shares']) > 0]
+        dates = np.array([self._effective_date(t) for t in confirmed], dtype='datetime64[D]')
+        order = np.argsort(dates, kind='stable')
+        confirmed = [dict(confirmed[i]) for i in order]
+        dates = dates[order]
+        # sells entered without amount/price are valued at that day's NAV
+        st.unpriced_from = None
+        idx = np.searchsorted(st.dates, dates, side='right') - 1
+        for t, d, i in zip(confirmed, dates, idx):
+            if t['type'] == 'sell' and not float(t['amount']) and not float(t.get('price') or 0):
+                if len(st.dates) and i >= 0:
+                    t['price'] = float(st.nav[i])
+                if not len(st.dates) or d > st.dates[-1]:
+                    st.unpriced_from = d if st.unpriced_from is None else min(st.unpriced_from, d)
+        shares, cost, realized = [], [], []
+        total_realized = 0.0
+        for _, s, c, r in calc.replay_trades(confirmed):
+            total_realized += r
+            shares.append(s)
+            cost.append(c)
+            realized.append(total_realized)
+        st.event_dates = dates
+        st.events = (np.array(shares), np.array(cost), np.array(realized))
+
+    def _fill(self, st, start):
+        # map step-wise trade state onto the NAV date axis from index `start`
+        dates = st.dates[start:]
+        nav = st.nav[start:]
+        pos = np.searchsorted(st.event_dates, dates, side='right') - 1
+        has = pos >= 0
+        pos = np.clip(pos, 0, None)
+        if st.events is not None and len(st.event_dates):
+            shares = np.where(has, st.events[0][pos], 0.0)
+            cost = np.where(has, st.events[1][pos], 0.0)
+            realized = np.where(has, st.events[2][pos], 0.0)
+        else:
+            shares = cost = realized = np.zeros(len(dates))
+        shares = np.where(shares < 0.0001, 0.0, shares)
+        cost = np.where(shares > 0, cost, 0.0)
+        mv = shares * nav
+        unrealized = mv - cost
+        new = {
+            'shares': shares, 'cost': cost, 'market_value': mv,
+            'realized_pnl': realized, 'unrealized_pnl': unrealized, 'total_pnl': realized + unrealized,
+        }
+        for f, arr in new.items():
+            st.curve[f] = np.concatenate([st.curve[f][:start], arr])
+
+    def update_fund(self, fund_id, code):
+        st = self._funds.get(fund_id)
+        if st is None:
+            st = self._funds[fund_id] = _FundState()
+        start = len(st.dates)
+
+        last = str(st.dates[-1]) if len(st.dates) else None
+        new_navs = database.get_nav_history(code, since=last)
+        if new_navs:
+            st.dates = np.concatenate([st.dates, _to_days([d for d, _ in new_navs])])
+            st.nav = np.concatenate([st.nav, np.array([n for _, n in new_navs], dtype=float)])
+
+        trades = database.get_trades_by_fund(fund_id)
+        signature = _trade_signature(trades)
+        diff = _first_difference(st.signature, signature)
+        repriced = bool(new_navs) and st.unpriced_from is not None
+        if diff is not None or repriced or st.events is None:
+            changed = [self._effective_date(t) for t in (trades[diff:] if diff is not None else [])]
+            if diff is not None and diff < len(st.signature):
+                # edited/removed trades can only be located by their old dates
+                changed.append(np.datetime64(st.signature[diff][2][:10], 'D'))
+            if repriced:
+                changed.append(st.unpriced_from)
+            self._replay(st, trades)
+            st.signature = signature
+            if changed:
+                first = min(changed)
+                start = min(start, int(np.searchsorted(st.dates, first, side='left')))
+
+        if start < len(st.dates):
+            self._fill(st, start)
+            st.version += 1
+        return self.fund_curve(fund_id)
+
+    def fund_curve(self, fund_id):
+        st = self._funds.get(fund_id)
+        if st is None:
+            return None
+        curve = {'dates': st.dates, 'nav': st.nav}
+        curve.update(st.curve)
+        return curve
+
+    def update_all(self):
+        funds = database.get_all_funds_with_positions()
+        for f in funds:
+            self.update_fund(f['id'], f['code'])
+        groups = {}
+        for f in funds:
+            groups.setdefault(f.get('account') or '默认账户', []).append(f['id'])
+        return {name: self.aggregate(name, ids) for name, ids in groups.items()}
+
+    def aggregate(self, key, fund_ids):
+        versions = tuple((fid, self._funds[fid].version) for fid in fund_ids if fid in self._funds)
+        cached = self._accounts.get(key)
+        if cached and cached[0] == versions:
+            return cached[1]
+        members = [self._funds[fid] for fid, _ in versions if len(self._funds[fid].dates)]
+        if not members:
+            curve = {'dates': np.empty(0, dtype='datetime64[D]')}
+            curve.update({f: np.empty(0) for f in CURVE_FIELDS if f != 'nav'})
+        else:
+            dates = np.unique(np.concatenate([m.dates for m in members]))
+            curve = {'dates': dates}
+            for f in CURVE_FIELDS:
+                if f == 'nav':
+                    continue
+                total = np.zeros(len(dates))
+                for m in members:
+                    # carry each fund's last known value forward on the union axis
+                    pos = np.searchsorted(m.dates, dates, side='right') - 1
+                    vals = m.curve[f][np.clip(pos, 0, None)]
+                    total += np.where(pos >= 0, vals, 0.0)
+                curve[f] = total
+        self._accounts[key] = (versions, curve)
+        return curve
+
+    def portfolio_curve(self):
+        return self.aggregate('__all__', list(self._funds))
+
+    def invalidate(self, fund_id=None):
+        if fund_id is None:
+            self._funds.clear()
+        else:
+            self._funds.pop(fund_id, None)
+        self._accounts.clear()
+
+
+def daily_pnl(curve):
+    total = curve['total_pnl']
+    if not len(total):
+        return total
+    return np.diff(total, prepend=0.0)
@@ -0,0 +1,197 @@
+from collections import deque
+from datetime import date, datetime, time
+from functools import lru_cache
+
+import calc
+import database
+
+# Lot-level position accounting. Every confirmed buy opens a lot (shares, cost,
+# holding start); sells consume lots from the front (FIFO) or back (LIFO) of a
+# deque, so each lot is opened and closed once and a sell costs amortized O(1)
+# however long the history is. "average" prices sells at the pooled average
+# cost like calc.replay_trades, while its shares still leave oldest first,
+# which is how fund companies count holding days for redemption fees.
+#
+# Open lots and the (trade_time, id) of the last applied trade are stored per
+# fund and method (tables lots / lot_state), so sync() only applies trades
+# entered since the previous call; the last book per fund stays in memory
+# while the stored state still matches it. Triggers drop the state when an
+# earlier trade changes, and the next sync() replays that fund once.
+#
+# Realized P&L is net of the sell fee; unlike replay_trades the fee is not
+# taken off the remaining cost, so cost here is the lots' purchase cost. The
+# total P&L (realized + market value - cost) is the same.
+
+METHODS = {"fifo": "先进先出", "lifo": "后进先出", "average": "移动平均"}
+DEFAULT_METHOD = "fifo"
+# (held fewer than N days, redemption fee rate); under 7 days is the statutory 1.5%,
+# the longer tiers are the common defaults, individual funds differ
+REDEMPTION_FEE_TIERS = ((7, 0.015), (365, 0.005), (730, 0.0025), (None, 0.0))
+MIN_SHARES = 0.0001
+
+
+def fee_tier(days):
+    # (fee rate, days until the next lower tier or None) for a lot held `days` calendar days
+    for limit, rate in REDEMPTION_FEE_TIERS:
+        if limit is None or days < limit:
+            return rate, (None if limit is None else limit - days)
+    return 0.0, None
+
+
+@lru_cache(maxsize=None)
+def _confirmed_on(day, after_close):
+    return calc.confirm_date(datetime.combine(date.fromisoformat(day), time(15) if after_close else time(9, 30)))
+
+
+def holding_start(trade_time):
+    # holding days count from the confirmation date (T+1) of the buy; one calendar walk per day
+    try:
+        return _confirmed_on(trade_time[:10], trade_time[11:19] >= "15:00:00")
+    except Exception:
+        return datetime.strptime(trade_time[:10], "%Y-%m-%d").date()
+
+
+class Lot:
+    __slots__ = ("trade_id", "trade_time", "acquired", "shares", "cost")
+
+    def __init__(self, trade_id, trade_time, acquired, shares, cost):
+        self.trade_id = trade_id
+        self.trade_time = trade_time
+        self.acquired = acquired
+        self.shares = shares
+        self.cost = cost
+
+    def as_row(self):
+        return {"trade_id": self.trade_id, "trade_time": self.trade_time, "acquired": self.acquired,
+                "shares": self.shares, "cost": self.cost}
+
+
+class LotBook:
+    def __init__(self, method=DEFAULT_METHOD, lots=(), shares=0.0, cost=0.0, realized=0.0, last=("", 0)):
+        if method not in METHODS:
+            raise ValueError(f"unknown lot method: {method}")
+        self.method = method
+        self.lots = deque(lots)
+        self.shares = shares
+        self.cost = cost
+        self.realized = realized
+        self.last = last          # (trade_time, id) of the last applied trade
+        self.changed = {}         # trade_id -> Lot touched since load
+        self.removed = set()      # trade_ids of lots closed since load
+
+    def apply(self, trade):
+        # same rules as calc.replay_trades: unconfirmed buys (no shares yet) are skipped
+        shares = float(trade['shares'])
+        amount = float(trade['amount'])
+        fee = float(trade['fee'] or 0)
+        if trade['type'] == 'buy' and shares > 0:
+            self.buy(trade['id'], trade['trade_time'], holding_start(trade['trade_time']).isoformat(),
+                     shares, amount + fee)
+        elif trade['type'] == 'sell':
+            gross = amount if amount > 0 else min(shares, self.shares) * float(trade.get('price') or 0)
+            self.sell(shares, gross - fee)
+        self.last = (trade['trade_time'], trade['id'])
+
+    def buy(self, trade_id, trade_time, acquired, shares, cost):
+        lot = Lot(trade_id, trade_time, acquired, shares, cost)
+        self.lots.append(lot)
+        self.changed[trade_id] = lot
+        self.shares += shares
+        self.cost += cost
+
+    def sell(self, shares, proceeds):
+        # consume lots for `shares` (capped at the holding); returns the realized P&L
+        shares = min(shares, self.shares)
+        if shares <= 0:
+            self.realized += proceeds
+            return proceeds
+        average = self.cost * shares / self.shares
+        take = self.lots.pop if self.method == "lifo" else self.lots.popleft
+        put_back = self.lots.append if self.method == "lifo" else self.lots.appendleft
+        remaining = shares
+        consumed = 0.0
+        while remaining > MIN_SHARES and self.lots:
+            lot = take()
+            if lot.shares <= remaining + MIN_SHARES:
+                remaining -= lot.shares
+                consumed += lot.cost
+                self.changed.pop(lot.trade_id, None)
+                self.removed.add(lot.trade_id)
+                continue
+            part = lot.cost * remaining / lot.shares
+            lot.shares -= remaining
+            lot.cost -= part
+            consumed += part
+            remaining = 0.0
+            self.changed[lot.trade_id] = lot
+            put_back(lot)
+        released = average if self.method == "average" else consumed
+        self.shares -= shares
+        self.cost -= released
+        if self.shares < MIN_SHARES or not self.lots:
+            self.shares, self.cost = 0.0, 0.0
+        realized = proceeds - released
+        self.realized += realized
+        return realized
+
+    def average_cost(self):
+        return self.cost / self.shares if self.shares > 0 else 0.0
+
+    def open_lots(self, today=None):
+        # remaining lots with holding days and the redemption fee tier each is in
+        today = today or date.today()
+        average = self.average_cost()
+        out = []
+        for lot in self.lots:
+            days = (today - date.fromisoformat(lot.acquired)).days
+            rate, next_tier = fee_tier(days)
+            out.append({
+                "trade_id": lot.trade_id, "acquired": lot.acquired, "shares": lot.shares,
+                "cost": lot.shares * average if self.method == "average" else lot.cost,
+                "days": days, "fee_rate": rate, "next_tier_days": next_tier,
+            })
+        return out
+
+    def redemption_fee(self, shares, nav, today=None):
+        # fee for redeeming `shares` now; fund companies take the oldest shares first
+        today = today or date.today()
+        remaining = min(shares, self.shares)
+        fee = 0.0
+        for lot in self.lots:  # acquisition order whatever the cost method
+            if remaining <= MIN_SHARES:
+                break
+            n = min(lot.shares, remaining)
+            fee += n * nav * fee_tier((today - date.fromisoformat(lot.acquired)).days)[0]
+            remaining -= n
+        return fee
+
+    def state(self):
+        return (self.last[0], self.last[1], self.shares, self.cost, self.realized)
+
+
+_books = {}  # (fund_id, method) -> LotBook as of its stored state
+
+
+def sync(fund_id, method=DEFAULT_METHOD):
+    # bring the stored lots of one fund up to date and return its LotBook
+    with database.unit_of_work():
+        state = database.get_lot_state(fund_id, method)
+        book = _books.get((fund_id, method))
+        if state is None:
+            book = LotBook(method)
+            trades = database.get_trades_after(fund_id)
+        else:
+            stored = (state["last_time"], state["last_id"], state["shares"], state["cost"], state["realized"])
+            if book is None or book.state() != stored:
+                book = LotBook(method, (Lot(**r) for r in database.get_lots(fund_id, method)),
+                               state["shares"], state["cost"], state["realized"], stored[:2])
+            trades = database.get_trades_after(fund_id, *book.last)
+        for trade in trades:
+            book.apply(trade)
+        if state is None or trades:
+            database.save_lot_book(fund_id, method, book.state(), [lot.as_row() for lot in book.changed.values()],
+                                   book.removed, replace=state is None)
+    book.changed.clear()
+    book.removed.clear()
+    _books[(fund_id, method)] = book
+    return book
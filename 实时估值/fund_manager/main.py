@@ -1,20 +1,39 @@
 ﻿import sys
-from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                               QHBoxLayout, QTableWidget, QTableWidgetItem,
+from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout,
+                               QHBoxLayout, QTableView,
                                QPushButton, QLabel, QHeaderView, QMessageBox, QAbstractItemView, QInputDialog,
-                               QDialog, QListWidget, QListWidgetItem)
-from PySide6.QtCore import Qt, Slot
-from PySide6.QtGui import QColor
+                               QDialog, QListWidget, QListWidgetItem, QFileDialog, QSystemTrayIcon, QStyle, QSplitter,
+                               QLineEdit)
+from PySide6.QtCore import Qt, Slot, QTimer, QEvent
+from collections import deque
 from datetime import datetime
+import os
+import time
 import exchange_calendars as xcals
 
 import database
 import calc
-from quote_service import QuoteWorker
-from ui_components import AddFundDialog, AddTradeDialog
-
-COLOR_RED = QColor(220, 50, 50)
-COLOR_GREEN = QColor(50, 150, 50)
+import parsing
+from quote_service import QuoteWorker, is_trading_time, IDLE_REFRESH_SEC, TRADING_REFRESH_SEC
+from ui_components import (AddFundDialog, AddTradeDialog, ImportTradesDialog, ExportWorker,
+                           PeriodReturnsDialog, AlertRulesDialog, RiskDialog, TradeSearchDialog,
+                           LotsDialog)
+from snapshots import SnapshotJob
+from table_model import FundTableModel, FundSortFilterModel
+from valuation import PortfolioBook
+from db_writer import DbWriter
+from alerts import AlertEngine
+from risk import RiskEngine
+from charts import ChartPanel
+import exporter
+import power
+import profiling
+import quotes
+
+RECENT_VIEWED_MAX = 50
+STALE_CHECK_MS = 30000
+MEMORY_REPORT_MS = 10000
+IDLE_CHECK_MS = 5000
 
 
 class MainWindow(QMainWindow):
@@ -23,18 +42,62 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("基金持仓管家")
         self.resize(1100, 650)
         database.init_db()
+        self.snapshot_job = SnapshotJob()
         self.cache = {}
+        self.book = PortfolioBook()
+        # funds outside the shown account that alert rules need: quoted and valued here, not shown
+        self.alert_book = PortfolioBook()
+        self.watch_info = {}
         self.trade_dialog = None
+        self.export_worker = None
         self.current_account = "全部"
+        self.recent_viewed = deque(maxlen=RECENT_VIEWED_MAX)
+        self.alert_engine = AlertEngine()
+        self.risk_engine = RiskEngine()  # keeps aligned NAVs between openings of the dialog
+        self.alert_engine.load()
+        self.last_quote_at = {}  # fund code -> time of last good quote
+        self.started_at = time.time()
+        # last good quote per fund across all accounts, restored from the previous session
+        snapshot = quotes.load_snapshot(quotes.SNAPSHOT_FILE)
+        self.last_quotes = {fid: q for fid, (q, _) in snapshot.items()}
+        self.last_metrics = {fid: m for fid, (_, m) in snapshot.items() if m is not None}
+        self.stale_ids = set()
+        # saved metrics of shown funds not booked yet, so the summary covers rows still to be paged in
+        self.unbooked_metrics = {}
+        self.unbooked_totals = [0.0, 0.0, 0.0]
+        # minimized, hidden to tray or user away: fetch only funds with alert rules, repaint on return
+        self.background = False
+        self.pending_refresh = set()
         self.setup_ui()
         self.load_data()
 
+        # 行情处理中的数据库写入交给独立线程，界面线程不做同步 SQLite I/O
+        self.db_writer = DbWriter(self)
+        self.db_writer.start()
+
         # 启动估值刷新线程
         self.worker = QuoteWorker([])
         self.worker.price_updated.connect(self.on_price_updated)
+        self.worker.cycle_finished.connect(self.save_quote_snapshot)
         self.update_worker_funds()
         self.worker.start()
 
+        self.stale_timer = QTimer(self)
+        self.stale_timer.setInterval(STALE_CHECK_MS)
+        self.stale_timer.timeout.connect(self.check_stale_alerts)
+        self.stale_timer.start()
+
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setInterval(IDLE_CHECK_MS)
+        self.idle_timer.timeout.connect(self.update_power_state)
+        self.idle_timer.start()
+
+        if profiling.enabled():
+            self.memory_timer = QTimer(self)
+            self.memory_timer.setInterval(MEMORY_REPORT_MS)
+            self.memory_timer.timeout.connect(self.report_memory)
+            self.memory_timer.start()
+
     def setup_ui(self):
         central = QWidget()
         self.setCentralWidget(central)
@@ -66,6 +129,13 @@ class MainWindow(QMainWindow):
         btn_bar.setSpacing(10)
         self.btn_add = QPushButton("添加新基金")
         self.btn_trade = QPushButton("录入交易")
+        self.btn_import = QPushButton("导入交易")
+        self.btn_export = QPushButton("导出数据")
+        self.btn_periods = QPushButton("区间收益")
+        self.btn_alerts = QPushButton("提醒规则")
+        self.btn_risk = QPushButton("风险分析")
+        self.btn_search = QPushButton("搜索交易")
+        self.btn_lots = QPushButton("持有批次")
         self.btn_account = QPushButton("管理仓位")
         self.btn_delete = QPushButton("删除基金")
         self.btn_refresh = QPushButton("手动刷新")
@@ -76,23 +146,43 @@ class MainWindow(QMainWindow):
 
         btn_bar.addWidget(self.btn_add)
         btn_bar.addWidget(self.btn_trade)
+        btn_bar.addWidget(self.btn_import)
+        btn_bar.addWidget(self.btn_export)
+        btn_bar.addWidget(self.btn_periods)
+        btn_bar.addWidget(self.btn_alerts)
+        btn_bar.addWidget(self.btn_risk)
+        btn_bar.addWidget(self.btn_search)
+        btn_bar.addWidget(self.btn_lots)
         btn_bar.addWidget(self.btn_account)
         btn_bar.addWidget(self.btn_delete)
         btn_bar.addWidget(self.btn_refresh)
         btn_bar.addStretch()
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("筛选代码/名称/仓位")
+        self.filter_edit.setClearButtonEnabled(True)
+        self.filter_edit.setFixedWidth(200)
+        btn_bar.addWidget(self.filter_edit)
         layout.addLayout(btn_bar)
 
         self.btn_add.clicked.connect(self.show_add_fund)
         self.btn_trade.clicked.connect(self.show_add_trade)
+        self.btn_import.clicked.connect(self.show_import_trades)
+        self.btn_export.clicked.connect(self.export_data)
+        self.btn_periods.clicked.connect(lambda: PeriodReturnsDialog(self).exec())
+        self.btn_alerts.clicked.connect(self.show_alert_rules)
+        self.btn_risk.clicked.connect(lambda: RiskDialog(self.risk_engine, self).exec())
+        self.btn_search.clicked.connect(lambda: TradeSearchDialog(self).exec())
+        self.btn_lots.clicked.connect(self.show_lots)
         self.btn_account.clicked.connect(self.add_account)
         self.btn_delete.clicked.connect(self.delete_selected_fund)
         self.btn_refresh.clicked.connect(self.manual_refresh)
 
-        # 表格
-        self.table = QTableWidget()
-        headers = ["ID", "代码", "名称", "持仓市值", "今日涨跌", "实际涨跌", "今日盈亏", "累计盈亏", "收益率", "更新时间"]
-        self.table.setColumnCount(len(headers))
-        self.table.setHorizontalHeaderLabels(headers)
+        # 表格（按页从数据库懒加载；点表头排序，排序随行情实时调整）
+        self.model = FundTableModel(self.cache, self, on_fetch=self.restore_cached_quotes)
+        self.view_model = FundSortFilterModel(self.model, self)
+        self.table = QTableView()
+        self.table.setModel(self.view_model)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.verticalHeader().setVisible(False)
@@ -101,11 +191,41 @@ class MainWindow(QMainWindow):
         header.setSectionResizeMode(QHeaderView.Stretch)
         header.setSectionResizeMode(9, QHeaderView.ResizeToContents)
         header.setMinimumSectionSize(90)
+        header.setSortIndicator(-1, Qt.AscendingOrder)
+        header.setSortIndicatorClearable(True)
+        self.table.setSortingEnabled(True)
         self.table.setAlternatingRowColors(True)
-        layout.addWidget(self.table)
+        self.filter_edit.textChanged.connect(self.view_model.set_filter_text)
+
+        # 走势图（所选基金 / 当前仓位）
+        self.chart_panel = ChartPanel()
+        self.chart_panel.set_account(self.current_account)
+        splitter = QSplitter(Qt.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.chart_panel)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 2)
+        layout.addWidget(splitter)
+
+        # 可见行优先刷新
+        self.visible_timer = QTimer(self)
+        self.visible_timer.setSingleShot(True)
+        self.visible_timer.setInterval(200)
+        self.visible_timer.timeout.connect(self.update_worker_priority)
+        self.table.verticalScrollBar().valueChanged.connect(lambda _: self.visible_timer.start())
+        self.view_model.rowsInserted.connect(lambda *_: self.visible_timer.start())
+        self.view_model.modelReset.connect(lambda: self.visible_timer.start())
+        self.view_model.layoutChanged.connect(lambda: self.visible_timer.start())
+        self.table.selectionModel().currentRowChanged.connect(self.on_current_row_changed)
 
         self.setStyleSheet(self._style_sheet())
 
+        self.tray = None
+        if QSystemTrayIcon.isSystemTrayAvailable():
+            self.tray = QSystemTrayIcon(self.style().standardIcon(QStyle.SP_ComputerIcon), self)
+            self.tray.setToolTip("基金持仓管家")
+            self.tray.show()
+
     def _style_sheet(self):
         return (
             "QMainWindow {"
@@ -134,7 +254,7 @@ class MainWindow(QMainWindow):
             " border-radius: 18px; padding: 4px 16px; background: #ffe8d1; border: 1px solid #e8b68f; }"
             "QPushButton[tab=\"true\"][selected=\"true\"] {"
             " background: #ffcf9f; border: 1px solid #d98957; color: #2f1f15; }"
-            "QTableWidget {"
+            "QTableView {"
             " background: qlineargradient(x1:0, y1:0, x2:0, y2:1, stop:0 #fff3e6, stop:1 #ffd2ad);"
             " border: 1px solid #e0a879; border-radius: 12px; gridline-color: #e6b890;"
             " selection-background-color: #ffd0a8; selection-color: #3b2f2f;"
@@ -143,8 +263,8 @@ class MainWindow(QMainWindow):
             " background: qlineargradient(x1:0, y1:0, x2:0, y2:1, stop:0 #ffe8d1, stop:1 #f3b688);"
             " color: #3b2f2f; border: none; padding: 8px; font-weight: 700;"
             " }"
-            "QTableWidget::item { padding: 6px; color: #3b2f2f; }"
-            "QTableWidget::item:selected { background: #ffc99a; color: #3b2f2f; }"
+            "QTableView::item { padding: 6px; color: #3b2f2f; }"
+            "QTableView::item:selected { background: #ffc99a; color: #3b2f2f; }"
         )
 
     def refresh_accounts(self):
@@ -164,105 +284,330 @@ class MainWindow(QMainWindow):
 
     def set_account(self, name):
         self.current_account = name
+        self.chart_panel.set_account(name)
         self.refresh_accounts()
         self.load_data()
 
     def load_data(self):
-        funds = database.get_all_funds_with_positions()
-        if self.current_account and self.current_account != "全部":
-            funds = [f for f in funds if (f.get("account") or "默认账户") == self.current_account]
-        self.table.setRowCount(0)
-        self.cache = {}
-        for f in funds:
-            self.cache[f["id"]] = {"info": f, "quote": None, "metrics": None}
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-            self.table.setItem(row, 0, QTableWidgetItem(str(f["id"])))
-            self.table.setItem(row, 1, QTableWidgetItem(f["code"]))
-            self.table.setItem(row, 2, QTableWidgetItem(f["name"]))
-            self.update_row_display(row, f, None, None)
+        self.chart_panel.invalidate_history()
+        self.last_metrics.update((fid, e["metrics"]) for fid, e in self.cache.items() if e.get("metrics") is not None)
+        self.cache.clear()
+        self.book.clear()
+        self.alert_book.clear()
+        self.watch_info.clear()
+        self.stale_ids.clear()
+        self.unbooked_metrics = {f["id"]: self.last_metrics[f["id"]]
+                                 for f in database.get_fund_refs(self.current_account) if f["id"] in self.last_metrics}
+        self.unbooked_totals = [sum(m.market_value for m in self.unbooked_metrics.values()),
+                                sum(m.today_pnl for m in self.unbooked_metrics.values()),
+                                sum(m.total_pnl for m in self.unbooked_metrics.values())]
+        self.model.reset(self.current_account)
         self.update_worker_funds()
+        self.update_summary()
+
+    def restore_cached_quotes(self, rows):
+        # called by the model for each page of rows it loads: paint their last
+        # known values at once; they are marked stale until refreshed
+        if not self.last_quotes:
+            return
+        slots = {}
+        for info in rows:
+            fid = info["id"]
+            quote = self.last_quotes.get(fid)
+            entry = self.cache[fid]
+            if quote is None or entry["quote"] is not None:  # a live quote came in first
+                continue
+            entry["quote"] = quote
+            slots[fid] = self._book_quote(fid, info, quote)
+            if quote.stale:
+                self.stale_ids.add(fid)
+        if not slots:
+            return
+        valuation = self.book.compute()
+        for fid, slot in slots.items():
+            self.cache[fid]["metrics"] = valuation.row(slot)
+        self.update_summary()
+
+    def _quote_snapshot_payload(self):
+        # funds not paged in this session keep the metrics they were saved with
+        metrics = dict(self.last_metrics)
+        metrics.update((fid, e["metrics"]) for fid, e in self.cache.items() if e.get("metrics") is not None)
+        return quotes.snapshot_payload(self.last_quotes, metrics)
+
+    def save_quote_snapshot(self):
+        # built here, written on the writer thread; repeated saves collapse into one
+        self.db_writer.submit(("quote_snapshot",), quotes.write_snapshot, quotes.SNAPSHOT_FILE,
+                              self._quote_snapshot_payload())
 
     def update_worker_funds(self):
         if hasattr(self, "worker"):
-            funds_list = [v["info"] for v in self.cache.values()]
-            self.worker.set_funds(funds_list)
-
-    def update_row_display(self, row, info, quote, metrics):
-        def set_item(col, txt, color=None):
-            it = QTableWidgetItem(txt)
-            it.setTextAlignment(Qt.AlignCenter)
-            if color:
-                it.setForeground(color)
-            self.table.setItem(row, col, it)
-
-        if metrics and quote:
-            set_item(3, f"{metrics['market_value']:,.2f}")
-            c_day = COLOR_RED if metrics["today_pnl"] > 0 else COLOR_GREEN if metrics["today_pnl"] < 0 else Qt.black
-            rate_prefix = "估" if not quote.get("is_official") else "净"
-            set_item(4, f"{rate_prefix}{quote['est_rate'] * 100:+.2f}%", c_day)
-            actual_rate = quote.get("actual_rate_display", quote.get("actual_rate"))
-            actual_date = quote.get("actual_date_display", quote.get("actual_date"))
-            if actual_rate is None:
-                set_item(5, "--")
-            else:
-                actual_text = f"{actual_rate * 100:+.2f}%"
-                if actual_date:
-                    actual_text += f" ({actual_date})"
-                set_item(5, actual_text, COLOR_RED if actual_rate > 0 else COLOR_GREEN if actual_rate < 0 else Qt.black)
-            set_item(6, f"{metrics['today_pnl']:+,.2f}", c_day)
-            c_total = COLOR_RED if metrics["total_pnl"] > 0 else COLOR_GREEN if metrics["total_pnl"] < 0 else Qt.black
-            set_item(7, f"{metrics['total_pnl']:+,.2f}", c_total)
-            set_item(8, f"{metrics['total_rate'] * 100:+.2f}%", c_total)
-            date_str = quote.get("nav_date") or datetime.now().strftime("%Y-%m-%d")
-            time_str = f"{quote['time_str']} {date_str}" + (" (已校准)" if quote.get("is_official") else "")
-            set_item(9, time_str)
-        else:
-            for i in range(3, 10):
-                set_item(i, "--")
-
-    @Slot(int, dict)
+            refs = database.get_fund_refs(self.current_account)
+            if self.current_account != "全部":
+                # rules on other accounts' funds are evaluated whichever account is on screen
+                shown = {f["id"] for f in refs}
+                refs += [f for f in database.get_fund_refs()
+                         if f["id"] not in shown and self.alert_engine.watches(f["code"], f["account"] or "默认账户")]
+            self.worker.set_funds(refs)
+            self.update_worker_priority()
+
+    def visible_fund_ids(self):
+        if self.view_model.rowCount() == 0:
+            return []
+        top = self.table.rowAt(0)
+        bottom = self.table.rowAt(self.table.viewport().height() - 1)
+        if top < 0:
+            return []
+        if bottom < 0:
+            bottom = self.view_model.rowCount() - 1
+        return [self.view_model.fund_id_at(r) for r in range(top, bottom + 1)]
+
+    def update_worker_priority(self):
+        if not hasattr(self, "worker"):
+            return
+        if self.background:
+            self.worker.set_priority(self.watched_fund_ids())
+            return
+        ids = self.visible_fund_ids()
+        seen = set(ids)
+        ids.extend(fid for fid in reversed(self.recent_viewed) if fid not in seen)
+        self.worker.set_priority(ids)
+
+    def on_current_row_changed(self, current, previous):
+        fid = self.view_model.fund_id_at(current.row())
+        if fid is None:
+            return
+        if fid in self.recent_viewed:
+            self.recent_viewed.remove(fid)
+        self.recent_viewed.append(fid)
+        entry = self.cache.get(fid)
+        if entry is not None:
+            self.chart_panel.set_fund(fid, entry["info"]["code"], entry["info"]["name"])
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if hasattr(self, "visible_timer"):
+            self.visible_timer.start()
+
+    def current_fund_id(self):
+        index = self.table.currentIndex()
+        if not index.isValid():
+            return None
+        return self.view_model.fund_id_at(index.row())
+
+    @Slot(int, object)
     def on_price_updated(self, fid, quote):
+        if fid in self.watch_info:
+            self._watch_quote(fid, quote)
+            return
         if fid not in self.cache:
+            # off-screen fund that has not been paged in yet, or one only alert rules need
+            self.db_writer.submit(("info", fid), database.get_fund_with_position, fid,
+                                  callback=lambda info: self._adopt_fund(fid, info, quote))
             return
-        actual_rate_display, actual_date_display, use_actual_for_pnl = self._resolve_actual_rate(quote)
-        quote_display = dict(quote)
-        quote_display["actual_rate_display"] = actual_rate_display
-        quote_display["actual_date_display"] = actual_date_display
-        self.cache[fid]["quote"] = quote_display
-        if quote.get("ok"):
+        if quote.ok:
+            self.cache[fid]["quote"] = quote
+            self.cache[fid].pop("failed", None)
+        else:
+            # keep showing (and booking) the last good quote, only mark the refresh as failed
+            self.cache[fid]["failed"] = quote.error or True
+        if quote.ok:
             info = self.cache[fid]["info"]
-            try:
+            self.last_quotes[fid] = quote
+            self.stale_ids.discard(fid)
+            self.db_writer.submit(("quote", fid), self._persist_quote, fid, dict(info), quote,
+                                  callback=lambda updated: self.on_position_changed(fid, updated))
+            slot = self._book_quote(fid, info, quote)
+            self.cache[fid]["metrics"] = self.book.compute().row(slot)
+            self.check_alerts(info, quote, self.cache[fid]["metrics"])
+            if quote.est_rate is not None:
+                self.chart_panel.add_fund_tick(fid, time.time(), quote.est_rate * 100)
+            if self.trade_dialog and self.trade_dialog.isVisible():
+                if self.current_fund_id() == fid:
+                    self.trade_dialog.set_latest_price(quote.est_nav)
+        self.refresh_view(fid)
+        if quote.ok:
+            self.chart_panel.add_account_tick(self.current_account, time.time(), self.book.compute().totals[1])
+
+    def _book_quote(self, fid, info, quote, book=None):
+        actual_rate_display, actual_date_display, use_actual_for_pnl = self._resolve_actual_rate(quote)
+        # the worker hands over the record, so display fields go on it directly
+        quote.actual_rate_display = actual_rate_display
+        quote.actual_date_display = actual_date_display
+        rate_for_pnl = actual_rate_display if use_actual_for_pnl and actual_rate_display is not None else quote.est_rate
+        if book is None:
+            book = self.book
+            saved = self.unbooked_metrics.pop(fid, None)
+            if saved is not None:
+                self.unbooked_totals[0] -= saved.market_value
+                self.unbooked_totals[1] -= saved.today_pnl
+                self.unbooked_totals[2] -= saved.total_pnl
+        slot = book.set_position(fid, info["shares"], info["cost_amount"], info.get("account"))
+        book.update_quote(slot, quote.est_nav, rate_for_pnl)
+        return slot
+
+    def _persist_quote(self, fid, info, quote):
+        # runs on the DB writer thread; returns the new position if trades were confirmed
+        updated = None
+        try:
+            with database.unit_of_work():
                 if calc.reconcile_pending_trades(
                     fid,
-                    quote.get("est_nav"),
-                    nav=quote.get("nav"),
-                    nav_date=quote.get("nav_date"),
+                    quote.est_nav,
+                    nav=quote.nav,
+                    nav_date=quote.nav_date,
                     now_dt=datetime.now(),
                 ):
                     updated = database.get_fund_with_position(fid)
-                    if updated:
-                        self.cache[fid]["info"] = updated
-                        info = updated
-            except Exception:
-                pass
-            rate_for_pnl = actual_rate_display if use_actual_for_pnl and actual_rate_display is not None else quote["est_rate"]
-            m = calc.calc_display_metrics(info["shares"], info["cost_amount"], quote["est_nav"], rate_for_pnl)
-            self.cache[fid]["metrics"] = m
-            row = self.find_row(fid)
-            if row is not None:
-                self.update_row_display(row, info, quote_display, m)
-            if self.trade_dialog and self.trade_dialog.isVisible():
-                current_row = self.table.currentRow()
-                if current_row >= 0:
-                    current_fid = int(self.table.item(current_row, 0).text())
-                    if current_fid == fid:
-                        self.trade_dialog.set_latest_price(quote.get("est_nav"))
+        except Exception:
+            pass
+        try:
+            self.snapshot_job.on_quote(updated or info, quote)
+        except Exception as e:
+            print(f"Snapshot error for {info.get('code')}: {e}")
+        return updated
+
+    def _adopt_fund(self, fid, info, quote):
+        if not info or fid in self.cache:
+            return
+        if not self.shows_account(info.get("account") or "默认账户"):
+            self.watch_info[fid] = info
+            self._watch_quote(fid, quote)
+            return
+        self.cache[fid] = {"info": info, "quote": None, "metrics": None}
+        self.on_price_updated(fid, quote)
+
+    def shows_account(self, account):
+        return self.current_account == "全部" or account == self.current_account
+
+    def _watch_quote(self, fid, quote):
+        # a fund of another account that alert rules depend on
+        if not quote.ok:
+            return
+        info = self.watch_info[fid]
+        self.last_quotes[fid] = quote
+        self.db_writer.submit(("quote", fid), self._persist_quote, fid, dict(info), quote,
+                              callback=lambda updated: self._watch_position_changed(fid, updated))
+        slot = self._book_quote(fid, info, quote, self.alert_book)
+        self.check_alerts(info, quote, self.alert_book.compute().row(slot))
+
+    def _watch_position_changed(self, fid, info):
+        if not info or fid not in self.watch_info:
+            return
+        self.watch_info[fid] = info
+        self.alert_book.set_position(fid, info["shares"], info["cost_amount"], info.get("account"))
+
+    def on_position_changed(self, fid, info):
+        entry = self.cache.get(fid)
+        if not info or entry is None:
+            return
+        entry["info"] = info
+        slot = self.book.slot_of.get(fid)
+        if slot is not None:
+            self.book.set_position(fid, info["shares"], info["cost_amount"], info.get("account"))
+            entry["metrics"] = self.book.compute().row(slot)
+        self.refresh_view(fid)
+
+    def refresh_view(self, fid):
+        if self.background:
+            self.pending_refresh.add(fid)
+            return
+        self.model.refresh_fund(fid)
         self.update_summary()
 
+    def watched_fund_ids(self):
+        # funds whose quotes can still raise an alert while nobody is looking
+        return [f["id"] for f in self.worker.funds_data
+                if self.alert_engine.watches(f["code"], f.get("account") or "默认账户")]
+
+    def background_refresh_sec(self):
+        # slow enough to save power, fast enough that stale rules do not fire just from the slowdown
+        limits = [max(TRADING_REFRESH_SEC, rule.threshold / 2) for rule in self.alert_engine.stale_rules]
+        return min([IDLE_REFRESH_SEC] + limits)
+
+    def update_power_state(self):
+        idle = power.system_idle_seconds()
+        background = self.isMinimized() or not self.isVisible() or \
+            (idle is not None and idle >= power.IDLE_AFTER_SEC)
+        if background != self.background:
+            self.set_background(background)
+
+    def set_background(self, on):
+        self.background = on
+        if not hasattr(self, "worker"):
+            return
+        self.worker.set_background(self.background_refresh_sec() if on else None)
+        self.update_worker_priority()
+        if on:
+            return
+        if self.pending_refresh:
+            self.pending_refresh.clear()
+            self.model.refresh_all()
+            self.update_summary()
+        self.worker.trigger_now()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() in (QEvent.WindowStateChange, QEvent.ActivationChange):
+            self.update_power_state()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_power_state()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_power_state()
+
+    def check_alerts(self, info, quote, metrics):
+        code = info["code"]
+        self.last_quote_at[code] = time.time()
+        events = []
+        if self.alert_engine.has_fund_rules(code):
+            events = self.alert_engine.on_fund_tick(code, {
+                "est_rate": quote.est_rate,
+                "est_nav": quote.est_nav,
+                "today_pnl": metrics.today_pnl,
+                "total_pnl": metrics.total_pnl,
+            })
+        account = info.get("account") or "默认账户"
+        if self.alert_engine.has_account_rules(account):
+            book = self.book if self.shows_account(account) else self.alert_book
+            events += self.alert_engine.on_account_tick(account, book.compute().account(account) or {})
+        if events:
+            self.handle_alert_events(events)
+
+    def check_stale_alerts(self):
+        if not is_trading_time():
+            return
+        fetched = {f["code"] for f in self.worker.funds_data}
+        events = self.alert_engine.check_stale(time.time(), self.last_quote_at, self.started_at, fetched)
+        if events:
+            self.handle_alert_events(events)
+
+    def handle_alert_events(self, events):
+        for state, rule, value in events:
+            self.db_writer.submit(("alert", rule.id), database.set_alert_triggered, rule.id, rule.triggered)
+            if state == "fired":
+                self.notify("基金提醒", rule.describe(value))
+
+    def notify(self, title, text):
+        if self.tray is not None:
+            self.tray.showMessage(title, text)
+        self.statusBar().showMessage(text, 10000)
+
+    def show_alert_rules(self):
+        AlertRulesDialog(self).exec()
+        self.alert_engine.load()
+        self.update_worker_funds()
+
+    def report_memory(self):
+        report = quotes.memory_report(self.cache)
+        profiling.counter("quote_memory", report)
+        return report
+
     def _resolve_actual_rate(self, quote):
-        actual_rate = quote.get("actual_rate")
-        actual_date = quote.get("actual_date")
+        actual_rate = quote.actual_rate
+        actual_date = quote.actual_date
         if actual_rate is None or not actual_date:
             return None, None, False
         today_str = datetime.now().strftime("%Y-%m-%d")
@@ -277,14 +622,10 @@ class MainWindow(QMainWindow):
         return None, None, False
 
     def update_summary(self):
-        mv, day, tot = 0, 0, 0
-        for v in self.cache.values():
-            if v["metrics"]:
-                mv += v["metrics"]["market_value"]
-                day += v["metrics"]["today_pnl"]
-                tot += v["metrics"]["total_pnl"]
-
-        self.lbl_mv.setText(f"总市值: {mv:,.2f}")
+        mv, day, tot = (a + b for a, b in zip(self.book.compute().totals, self.unbooked_totals))
+        stale = " (缓存)" if self.stale_ids or self.unbooked_metrics else ""
+
+        self.lbl_mv.setText(f"总市值: {mv:,.2f}{stale}")
         self.lbl_today.setText(f"今日盈亏: {day:+,.2f}")
         self.lbl_today.setStyleSheet(
             f"color: {'red' if day > 0 else 'green' if day < 0 else 'black'}; font-size: 18px; font-weight: 600; border: 1px solid #e5e7eb; padding: 12px 14px; background: white; border-radius: 8px;")
@@ -292,24 +633,11 @@ class MainWindow(QMainWindow):
         self.lbl_total.setStyleSheet(
             f"color: {'red' if tot > 0 else 'green' if tot < 0 else 'black'}; font-size: 18px; font-weight: 600; border: 1px solid #e5e7eb; padding: 12px 14px; background: white; border-radius: 8px;")
 
-    def find_row(self, fid):
-        for r in range(self.table.rowCount()):
-            item = self.table.item(r, 0)
-            if not item:
-                continue
-            try:
-                if int(item.text()) == fid:
-                    return r
-            except Exception:
-                continue
-        return None
-
     def manual_refresh(self):
         if hasattr(self, "worker"):
             self.btn_refresh.setEnabled(False)
             self.btn_refresh.setText("刷新中...")
             self.worker.trigger_now()
-            from PySide6.QtCore import QTimer
             QTimer.singleShot(1500, lambda: (self.btn_refresh.setEnabled(True), self.btn_refresh.setText("手动刷新")))
 
     def show_add_fund(self):
@@ -330,30 +658,80 @@ class MainWindow(QMainWindow):
         self.load_data()
 
     def show_add_trade(self):
-        row = self.table.currentRow()
-        if row < 0:
+        fid = self.current_fund_id()
+        if fid is None:
             return
-        fid = int(self.table.item(row, 0).text())
         latest_nav = None
         quote = self.cache.get(fid, {}).get("quote")
-        if quote and quote.get("ok"):
-            latest_nav = quote.get("est_nav")
+        if quote and quote.ok:
+            latest_nav = quote.est_nav
         self.trade_dialog = AddTradeDialog(self.cache[fid]["info"], self, latest_nav)
         if self.trade_dialog.exec():
             d = self.trade_dialog.get_data()
-            database.add_trade(fid, d["type"], d["date"], d["amount"], d["shares"], d["price"], d["fee"], d["note"])
-            calc.recalculate_position(fid)
+            try:
+                with database.unit_of_work():
+                    database.add_trade(fid, d["type"], d["date"], d["amount"], d["shares"], d["price"], d["fee"],
+                                       d["note"])
+                    calc.recalculate_position(fid)
+            except Exception as e:
+                QMessageBox.critical(self, "错误", str(e))
             self.load_data()
         self.trade_dialog = None
 
+    def show_import_trades(self):
+        dlg = ImportTradesDialog(self)
+        if dlg.exec():
+            self.load_data()
+
+    def export_data(self):
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            return
+        dataset, ok = QInputDialog.getItem(self, "导出数据", "数据集:", exporter.available_datasets(), 0, False)
+        if not ok:
+            return
+        path, selected = QFileDialog.getSaveFileName(
+            self, "导出到", f"{dataset}.csv", ";;".join(exporter.FILE_FILTERS))
+        if not path:
+            return
+        fmt = exporter.FILE_FILTERS.get(selected)
+        if fmt and not os.path.splitext(path)[1]:
+            path += "." + fmt
+        self.export_worker = ExportWorker(dataset, path, fmt)
+        self.export_worker.progress.connect(lambda n: self.statusBar().showMessage(f"正在导出 {dataset}: {n:,} 行"))
+        self.export_worker.finished_export.connect(self.on_export_finished)
+        self.btn_export.setText("取消导出")
+        self.export_worker.start()
+
+    def on_export_finished(self, success, result):
+        path = self.export_worker.path
+        self.export_worker = None
+        self.btn_export.setText("导出数据")
+        if success and result is None:
+            self.statusBar().showMessage("已取消导出", 5000)
+        elif success:
+            self.statusBar().showMessage(f"已导出 {result:,} 行到 {path}", 8000)
+        else:
+            self.statusBar().clearMessage()
+            QMessageBox.critical(self, "错误", result)
+
+    def show_lots(self):
+        fid = self.current_fund_id()
+        if fid is None:
+            QMessageBox.information(self, "提示", "请先选择一只基金")
+            return
+        quote = self.cache[fid]["quote"]
+        nav = quote.est_nav if quote and quote.ok else None
+        LotsDialog(self.cache[fid]["info"], nav, self).exec()
+
     def delete_selected_fund(self):
-        row = self.table.currentRow()
-        if row < 0:
+        fid = self.current_fund_id()
+        if fid is None:
             QMessageBox.information(self, "提示", "请先选择一只基金")
             return
-        fid = int(self.table.item(row, 0).text())
-        code = self.table.item(row, 1).text() if self.table.item(row, 1) else ""
-        name = self.table.item(row, 2).text() if self.table.item(row, 2) else ""
+        info = self.cache[fid]["info"]
+        code = info.get("code", "")
+        name = info.get("name", "")
         reply = QMessageBox.question(
             self,
             "确认删除",
@@ -362,15 +740,31 @@ class MainWindow(QMainWindow):
         )
         if reply != QMessageBox.Yes:
             return
-        success, msg = database.delete_fund(fid)
+        with database.unit_of_work():
+            success, msg = database.delete_fund(fid)
         if success:
             self.load_data()
         else:
             QMessageBox.critical(self, "错误", msg)
 
     def closeEvent(self, event):
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            self.export_worker.wait()
         if hasattr(self, "worker"):
             self.worker.stop()
+        self.stale_timer.stop()
+        self.idle_timer.stop()
+        self.chart_panel.shutdown()
+        if profiling.enabled():
+            print("Quote memory: {funds} funds, {bytes_per_fund:.0f} bytes/fund".format(**self.report_memory()))
+        self.db_writer.stop()
+        # after the writer has drained, so a queued older snapshot cannot overwrite this one
+        try:
+            quotes.write_snapshot(quotes.SNAPSHOT_FILE, self._quote_snapshot_payload())
+        except Exception as e:
+            print(f"Quote snapshot error: {e}")
+        parsing.get_pool().shutdown()
         event.accept()
 
 
@@ -489,7 +883,9 @@ class ManageAccountsDialog(QDialog):
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    argv = profiling.configure(sys.argv)
+    profiling.wrap_methods(MainWindow, ("on_price_updated", "update_summary", "_persist_quote"), "ui")
+    app = profiling.application_class()(argv)
     window = MainWindow()
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,256 @@
+import argparse
+import glob
+import json
+import os
+import threading
+
+import numpy as np
+
+import database
+
+# Columnar NAV archive for analytics. One float64 matrix on disk, rows are
+# weekdays from `start` (np.busday_count gives a date's row, holidays stay
+# NaN), columns are funds; index.json maps codes to columns. The matrix is
+# opened with np.memmap, so reading thousands of funds x decades is a view of
+# the page cache rather than a parse.
+#
+# Rows are reserved a year ahead, so daily updates only fill NaN cells of
+# the current file. Adding columns past the reserved width, or dates before
+# `start`, writes the matrix to a new generation file and switches the index
+# to it; readers holding a map of the old file keep a valid view, and old
+# generations are removed once nothing has them open.
+
+ARCHIVE_DIR = "nav_archive"
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+ROW_RESERVE = 261  # about a year of weekdays
+COL_CHUNK = 64
+REBUILD_CHUNK = 500  # funds per write while rebuilding from nav_history
+DTYPE = np.dtype("<f8")
+
+
+def _day(value):
+    return np.datetime64(value, "D")
+
+
+class NavArchive:
+    def __init__(self, path=ARCHIVE_DIR):
+        self.path = path
+        self._lock = threading.Lock()
+        self._map = None
+        self._map_file = None
+        self.index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, INDEX_FILE), "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index
+        except (OSError, ValueError):
+            pass
+        return {"version": INDEX_VERSION, "file": None, "start": None, "rows": 0, "capacity": 0,
+                "width": 0, "codes": [], "last": {}}
+
+    def _write_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        target = os.path.join(self.path, INDEX_FILE)
+        tmp = f"{target}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, target)
+
+    def _matrix(self):
+        # writable map of the whole current file (capacity x width)
+        name = self.index["file"]
+        if name is None:
+            return None
+        if self._map_file != name:
+            self._map = np.memmap(os.path.join(self.path, name), dtype=DTYPE, mode="r+",
+                                  shape=(self.index["capacity"], self.index["width"]))
+            self._map_file = name
+        return self._map
+
+    # -- reading ------------------------------------------------------------
+
+    @property
+    def codes(self):
+        return list(self.index["codes"])
+
+    def __contains__(self, code):
+        return code in self.index["last"]
+
+    def last_date(self, code):
+        return self.index["last"].get(code)
+
+    def dates(self):
+        if self.index["start"] is None:
+            return np.empty(0, dtype="datetime64[D]")
+        return np.busday_offset(_day(self.index["start"]), np.arange(self.index["rows"]))
+
+    def matrix(self):
+        # (dates, T x N view, codes); the view is live, copy it to keep a stable snapshot
+        m = self._matrix()
+        if m is None:
+            return self.dates(), np.empty((0, 0), dtype=DTYPE), []
+        n = len(self.index["codes"])
+        return self.dates(), m[:self.index["rows"], :n], self.codes
+
+    def frame(self, codes):
+        # (dates, T x len(codes) array) for the given funds, NaN where a fund has no NAV
+        dates, m, all_codes = self.matrix()
+        col = {c: j for j, c in enumerate(all_codes)}
+        out = np.full((len(dates), len(codes)), np.nan)
+        for k, code in enumerate(codes):
+            if code in col:
+                out[:, k] = m[:, col[code]]
+        return dates, out
+
+    def series(self, code, start=None, end=None):
+        # (dates, navs) of one fund, publishing days only
+        dates, m, all_codes = self.matrix()
+        if code not in all_codes:
+            return np.empty(0, dtype="datetime64[D]"), np.empty(0)
+        lo = 0 if start is None else int(np.searchsorted(dates, _day(start)))
+        hi = len(dates) if end is None else int(np.searchsorted(dates, _day(end), side="right"))
+        column = m[lo:hi, all_codes.index(code)]
+        keep = ~np.isnan(column)
+        return dates[lo:hi][keep], np.array(column[keep])
+
+    # -- writing ------------------------------------------------------------
+
+    def append(self, code, rows):
+        return self.extend({code: rows})
+
+    def extend(self, rows_by_code):
+        # {code: [(nav_date, nav), ...]}; new dates and revised NAVs are both written in place
+        return self.extend_arrays({
+            code: (np.array([d for d, _ in rows], dtype="datetime64[D]"), np.array([v for _, v in rows], dtype=float))
+            for code, rows in rows_by_code.items()
+        })
+
+    def extend_arrays(self, series):
+        # {code: (datetime64[D] array, float array)}
+        with self._lock:
+            parsed = {}
+            for code, (days, navs) in series.items():
+                keep = np.is_busday(days) & (navs > 0)  # weekend entries have no row
+                if keep.any():
+                    parsed[code] = (days[keep], navs[keep])
+            if not parsed:
+                return 0
+            first = min(d.min() for d, _ in parsed.values())
+            last = max(d.max() for d, _ in parsed.values())
+            new_codes = [c for c in parsed if c not in self.index["codes"]]
+            self._reserve(first, last, len(self.index["codes"]) + len(new_codes))
+            self.index["codes"].extend(new_codes)
+            m = self._matrix()
+            start = _day(self.index["start"])
+            col = {c: j for j, c in enumerate(self.index["codes"])}
+            written = 0
+            for code, (days, navs) in parsed.items():
+                rows_at = np.busday_count(start, days)
+                m[rows_at, col[code]] = navs
+                written += len(days)
+                prev = self.index["last"].get(code)
+                newest = str(days.max())
+                self.index["last"][code] = newest if prev is None or newest > prev else prev
+            self.index["rows"] = max(self.index["rows"], int(np.busday_count(start, last)) + 1)
+            m.flush()
+            self._write_index()
+            return written
+
+    def _reserve(self, first, last, n_codes):
+        index = self.index
+        start = _day(index["start"]) if index["start"] else np.busday_offset(first, 0, roll="forward")
+        new_start = min(start, np.busday_offset(first, 0, roll="forward"))
+        need_rows = int(np.busday_count(new_start, last)) + 1
+        if index["file"] is not None and new_start == start and need_rows <= index["capacity"] \
+                and n_codes <= index["width"]:
+            return
+        capacity = max(index["capacity"] + int(np.busday_count(new_start, start)), need_rows) + ROW_RESERVE
+        width = max(index["width"], -(-n_codes // COL_CHUNK) * COL_CHUNK)
+        if n_codes > index["width"] and index["width"]:
+            width = max(width, 2 * index["width"])
+        self._rewrite(new_start, capacity, width)
+
+    def _rewrite(self, new_start, capacity, width):
+        index = self.index
+        os.makedirs(self.path, exist_ok=True)
+        generation = int(index["file"].split(".")[1]) + 1 if index["file"] else 1
+        name = f"navs.{generation}.f8"
+        fresh = np.memmap(os.path.join(self.path, name), dtype=DTYPE, mode="w+", shape=(capacity, width))
+        fresh[:] = np.nan
+        old = self._matrix()
+        if old is not None:
+            shift = int(np.busday_count(new_start, _day(index["start"])))
+            rows, cols = index["rows"], len(index["codes"])
+            for lo in range(0, rows, 4096):  # bounded copies, no full-matrix temporary
+                hi = min(rows, lo + 4096)
+                fresh[shift + lo:shift + hi, :cols] = old[lo:hi, :cols]
+            index["rows"] = rows + shift
+        fresh.flush()
+        self._map = fresh
+        self._map_file = name
+        previous = index["file"]
+        index.update(file=name, start=str(new_start), capacity=capacity, width=width)
+        self._write_index()
+        if previous:
+            self._remove_stale(keep=name)
+
+    def _remove_stale(self, keep):
+        for path in glob.glob(os.path.join(self.path, "navs.*.f8")):
+            if os.path.basename(path) == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still mapped somewhere (Windows); retried on the next rewrite
+
+    def rebuild(self):
+        # fill from every row in nav_history, a chunk of funds at a time; returns NAV values written
+        conn = database.get_connection()
+        c = conn.cursor()
+        c.row_factory = None
+        codes = [r[0] for r in c.execute("SELECT DISTINCT code FROM nav_history").fetchall()]
+        written = 0
+        for lo in range(0, len(codes), REBUILD_CHUNK):
+            chunk = {}
+            for code in codes[lo:lo + REBUILD_CHUNK]:
+                # day numbers come out of SQLite, so no per-row date parsing here
+                c.execute("SELECT CAST(julianday(nav_date) - 2440587.5 AS INTEGER), nav FROM nav_history "
+                          "WHERE code = ? ORDER BY nav_date", (code,))
+                arr = np.array(c.fetchall(), dtype=float).reshape(-1, 2)
+                chunk[code] = (arr[:, 0].astype(np.int64).astype("datetime64[D]"), arr[:, 1])
+            written += self.extend_arrays(chunk)
+        conn.close()
+        return written
+
+
+_default_archive = None
+_default_lock = threading.Lock()
+
+
+def get_archive():
+    global _default_archive
+    with _default_lock:
+        if _default_archive is None:
+            _default_archive = NavArchive()
+        return _default_archive
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="净值列式归档")
+    parser.add_argument("--rebuild", action="store_true", help="从数据库 nav_history 全量导入")
+    args = parser.parse_args(argv)
+    archive = get_archive()
+    if args.rebuild:
+        print(f"写入 {archive.rebuild()} 条净值")
+    dates, m, codes = archive.matrix()
+    span = f"{dates[0]} 至 {dates[-1]}" if len(dates) else "空"
+    print(f"{len(codes)} 只基金，{len(dates)} 个交易日（{span}）")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import json
+import os
+import re
+import threading
+
+# Parsers take raw response bytes and return only compact fields, so they can
+# run in worker processes: the bytes are pickled in, a few floats come back.
+
+PARSE_PROCESSES_ENV = "FUND_PARSE_PROCESSES"
+PARSE_TIMEOUT_SEC = 10
+
+_NET_WORTH_RE = re.compile(rb"Data_netWorthTrend\s*=\s*(\[.*?\]);", re.S)
+
+
+def _net_worth_points(raw):
+    m = _NET_WORTH_RE.search(raw)
+    if not m:
+        return None
+    return json.loads(m.group(1))
+
+
+def parse_actual_rate(raw):
+    data = _net_worth_points(raw)
+    if not data or len(data) < 2:
+        return None, None
+    last = data[-1]
+    prev = data[-2]
+    last_nav = float(last.get('y') or 0)
+    prev_nav = float(prev.get('y') or 0)
+    if prev_nav <= 0:
+        return None, None
+    actual_rate = (last_nav - prev_nav) / prev_nav
+    date_str = datetime.fromtimestamp(last.get('x') / 1000).strftime("%Y-%m-%d")
+    return actual_rate, date_str
+
+
+def parse_nav_history(raw, since=None):
+    # [(nav_date, nav), ...]; `since` trims what crosses back over the pipe
+    data = _net_worth_points(raw)
+    rows = []
+    for point in data or []:
+        nav = float(point.get('y') or 0)
+        if nav <= 0:
+            continue
+        d = datetime.fromtimestamp(point['x'] / 1000).strftime("%Y-%m-%d")
+        if since and d <= since:
+            continue
+        rows.append((d, nav))
+    return rows
+
+
+_ASSET_ALLOCATION_RE = re.compile(rb"Data_assetAllocation\s*=\s*(\{.*?\});", re.S)
+_HOLDINGS_TABLE_RE = re.compile(r"<table.*?</table>", re.S)
+_REPORT_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+_ROW_RE = re.compile(r"<tr>(.*?)</tr>", re.S)
+_CELL_RE = re.compile(r"<td[^>]*>(.*?)</td>", re.S)
+_TAG_RE = re.compile(r"<[^>]+>")
+_PERCENT_RE = re.compile(r"^(-?\d+(?:\.\d+)?)%$")
+
+
+def parse_stock_ratio(raw):
+    # latest stock share of NAV (fraction) from Data_assetAllocation, or None
+    m = _ASSET_ALLOCATION_RE.search(raw)
+    if not m:
+        return None
+    try:
+        data = json.loads(m.group(1))
+    except ValueError:
+        return None
+    for series in data.get('series') or []:
+        if '股票' in (series.get('name') or '') and series.get('data'):
+            value = series['data'][-1]
+            return float(value) / 100.0 if value is not None else None
+    return None
+
+
+def parse_holdings(raw):
+    # FundArchivesDatas jjcc page -> (report_date, [(stock_code, name, weight)]),
+    # latest quarter only; weight is a fraction of NAV
+    text = raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+    table = _HOLDINGS_TABLE_RE.search(text)
+    if not table:
+        return None, []
+    m = _REPORT_DATE_RE.search(text[:table.start()])
+    report_date = m.group(1) if m else None
+    holdings = []
+    for row in _ROW_RE.findall(table.group(0)):
+        cells = [_TAG_RE.sub('', c).strip() for c in _CELL_RE.findall(row)]
+        if len(cells) < 3 or not cells[1].isdigit():
+            continue
+        weight = None
+        for cell in cells[3:]:
+            pm = _PERCENT_RE.match(cell)
+            if pm:
+                weight = float(pm.group(1)) / 100.0
+                break
+        if weight:
+            holdings.append((cells[1], cells[2], weight))
+    return report_date, holdings
+
+
+class ParsePool:
+    def __init__(self, processes=0):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.processes > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+            return self._executor
+
+    def run(self, fn, *args):
+        executor = self._get_executor()
+        if executor is None:
+            return fn(*args)
+        try:
+            return executor.submit(fn, *args).result(timeout=PARSE_TIMEOUT_SEC)
+        except BrokenProcessPool:
+            # a worker died: drop the pool so the next parse starts a fresh one,
+            # and parse this response inline rather than drop the quote
+            self._discard(executor)
+            print("Parse pool broken, restarting it; this response is parsed in-process")
+            return fn(*args)
+        except TimeoutError:
+            # saturated pool: parse inline rather than drop the quote
+            return fn(*args)
+
+    def _discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+def _processes_from_env():
+    try:
+        return max(0, int(os.environ.get(PARSE_PROCESSES_ENV, "0")))
+    except ValueError:
+        return 0
+
+
+_default_pool = None
+
+
+def get_pool():
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ParsePool(_processes_from_env())
+    return _default_pool
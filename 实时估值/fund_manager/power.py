@@ -0,0 +1,87 @@
+import ctypes
+import ctypes.util
+import sys
+
+# Desktop-wide input idle time, used to put the app into background mode when
+# nobody is at the machine. Each platform is probed once; where there is no
+# way to ask (Wayland, headless, missing libXss) the answer is None and only
+# window visibility counts.
+
+IDLE_AFTER_SEC = 15 * 60
+
+_probe = None  # callable returning idle seconds, or False once probing failed
+
+
+class _LastInputInfo(ctypes.Structure):
+    _fields_ = [("cbSize", ctypes.c_uint), ("dwTime", ctypes.c_uint)]
+
+
+class _XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [("window", ctypes.c_ulong), ("state", ctypes.c_int), ("kind", ctypes.c_int),
+                ("til_or_since", ctypes.c_ulong), ("idle", ctypes.c_ulong), ("eventMask", ctypes.c_ulong)]
+
+
+def _windows_probe():
+    user32 = ctypes.windll.user32
+    kernel32 = ctypes.windll.kernel32
+    info = _LastInputInfo()
+    info.cbSize = ctypes.sizeof(info)
+
+    def idle():
+        if not user32.GetLastInputInfo(ctypes.byref(info)):
+            return None
+        return ((kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+    return idle
+
+
+def _mac_probe():
+    quartz = ctypes.cdll.LoadLibrary(
+        "/System/Library/Frameworks/ApplicationServices.framework/ApplicationServices")
+    fn = quartz.CGEventSourceSecondsSinceLastEventType
+    fn.restype = ctypes.c_double
+    fn.argtypes = [ctypes.c_int32, ctypes.c_uint32]
+    # combined session state, any input event
+    return lambda: float(fn(0, 0xFFFFFFFF))
+
+
+def _x11_probe():
+    xlib = ctypes.cdll.LoadLibrary(ctypes.util.find_library("X11") or "libX11.so.6")
+    xss = ctypes.cdll.LoadLibrary(ctypes.util.find_library("Xss") or "libXss.so.1")
+    xlib.XOpenDisplay.restype = ctypes.c_void_p
+    xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    xlib.XDefaultRootWindow.restype = ctypes.c_ulong
+    xlib.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(_XScreenSaverInfo)
+    xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XScreenSaverInfo)]
+    display = xlib.XOpenDisplay(None)
+    if not display:
+        raise OSError("no X display")
+    root = xlib.XDefaultRootWindow(display)
+    info = xss.XScreenSaverAllocInfo()
+
+    def idle():
+        if not xss.XScreenSaverQueryInfo(display, root, info):
+            return None
+        return info.contents.idle / 1000.0
+    return idle
+
+
+def system_idle_seconds():
+    # seconds since the last keyboard/mouse input anywhere on the desktop, None when unknown
+    global _probe
+    if _probe is None:
+        try:
+            if sys.platform == "win32":
+                _probe = _windows_probe()
+            elif sys.platform == "darwin":
+                _probe = _mac_probe()
+            else:
+                _probe = _x11_probe()
+        except Exception:
+            _probe = False
+    if not _probe:
+        return None
+    try:
+        return _probe()
+    except Exception:
+        return None
@@ -0,0 +1,215 @@
+import argparse
+import atexit
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from PySide6.QtCore import QEvent, QThread
+from PySide6.QtWidgets import QApplication
+
+# Opt-in tracing of the refresh pipeline. Spans are written as Chrome
+# trace-event JSON (open in chrome://tracing or ui.perfetto.dev).
+#   FUND_PROFILE=trace.json           or  python main.py --profile trace.json
+#   FUND_PROFILE_CPROFILE=5           or  --profile-cprofile 5
+# The latter also dumps cProfile stats for every 5th worker cycle.
+# When tracing is off nothing is wrapped and span() is a shared no-op.
+
+PROFILE_ENV = "FUND_PROFILE"
+CPROFILE_ENV = "FUND_PROFILE_CPROFILE"
+DEFAULT_TRACE_FILE = "fund_trace.json"
+
+_NULL_SPAN = nullcontext()
+
+
+class Tracer:
+    def __init__(self, path, cprofile_every=0):
+        self.path = path
+        self.cprofile_every = cprofile_every
+        self.events = []  # list.append is atomic, so both threads write here unlocked
+        self._t0 = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._named = set()
+        self._cycles = 0
+        self._lock = threading.Lock()
+
+    def _now_us(self):
+        return (time.perf_counter_ns() - self._t0) / 1000.0
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self._named:
+            self._named.add(tid)
+            name = threading.current_thread().name
+            if name.startswith("Dummy"):
+                # a QThread: label it by its class (QuoteWorker, DbWriter, ...)
+                name = type(QThread.currentThread()).__name__
+            self.events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid,
+                                "args": {"name": name}})
+        return tid
+
+    @contextmanager
+    def span(self, name, cat="app", args=None):
+        tid = self._tid()
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            event = {"name": name, "cat": cat, "ph": "X", "ts": start, "dur": self._now_us() - start,
+                     "pid": self._pid, "tid": tid}
+            if args:
+                event["args"] = args
+            self.events.append(event)
+
+    @contextmanager
+    def cycle(self, name="cycle", args=None):
+        with self._lock:
+            self._cycles += 1
+            n = self._cycles
+        profile = None
+        if self.cprofile_every and n % self.cprofile_every == 0:
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            with self.span(name, "worker", dict(args or {}, n=n)):
+                yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(f"{os.path.splitext(self.path)[0]}.cycle{n}.prof")
+
+    def flush(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": list(self.events), "displayTimeUnit": "ms"}, f)
+        return self.path
+
+
+_tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, cat="app", args=None):
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, cat, args)
+
+
+def cycle(name="cycle", args=None):
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.cycle(name, args)
+
+
+def counter(name, values):
+    # numeric series drawn as a counter track in the trace viewer
+    if _tracer is not None:
+        _tracer.events.append({"name": name, "ph": "C", "ts": _tracer._now_us(), "pid": _tracer._pid,
+                               "tid": _tracer._tid(), "args": values})
+
+
+def flush():
+    if _tracer is not None:
+        return _tracer.flush()
+    return None
+
+
+def traced(fn, name, cat):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _tracer.span(name, cat):
+            return fn(*args, **kwargs)
+    wrapper.__traced__ = True
+    return wrapper
+
+
+def _wrap_functions(module, cat, skip=(), also_in=()):
+    # module-level functions, including copies bound by `from module import name`
+    for name, fn in list(vars(module).items()):
+        if name.startswith("_") or name in skip or isinstance(fn, type) or not callable(fn):
+            continue
+        if getattr(fn, "__module__", None) != module.__name__ or getattr(fn, "__traced__", False):
+            continue
+        wrapped = traced(fn, f"{module.__name__}.{name}", cat)
+        setattr(module, name, wrapped)
+        for other in also_in:
+            if getattr(other, name, None) is fn:
+                setattr(other, name, wrapped)
+
+
+def wrap_methods(cls, names, cat):
+    if _tracer is None:
+        return
+    for name in names:
+        fn = cls.__dict__.get(name)
+        if fn is None or getattr(fn, "__traced__", False):
+            continue
+        setattr(cls, name, traced(fn, f"{cls.__name__}.{name}", cat))
+
+
+def _instrument():
+    import calc
+    import database
+    import db_writer
+    import parsing
+    import providers
+    import quote_sources
+
+    # batch()/unit_of_work() are context managers and get_connection() is pure noise
+    _wrap_functions(database, "sqlite", skip=("batch", "unit_of_work", "get_connection"), also_in=(calc,))
+    for name in ("reconcile_pending_trades", "recalculate_position"):
+        setattr(calc, name, traced(getattr(calc, name), f"calc.{name}", "calc"))
+    wrap_methods(db_writer.DbWriter, ("_run_batch",), "sqlite")
+    wrap_methods(providers.RealProvider, ("fetch", "get_actual_rate", "get_nav_history", "get_fund_name"), "http")
+    wrap_methods(providers.HedgedProvider, ("fetch", "fetch_estimate"), "http")
+    wrap_methods(providers.HoldingsProvider, ("fetch",), "http")
+    wrap_methods(parsing.ParsePool, ("run",), "parse")
+    providers.timed_fetch = traced(quote_sources.timed_fetch, "timed_fetch", "http")
+
+
+class TracingApplication(QApplication):
+    # Qt repaint time shows up as "paint" spans
+    def notify(self, receiver, event):
+        if _tracer is not None and event.type() == QEvent.Type.Paint:
+            with _tracer.span("paint", "qt", {"widget": type(receiver).__name__}):
+                return super().notify(receiver, event)
+        return super().notify(receiver, event)
+
+
+def application_class():
+    return TracingApplication if _tracer is not None else QApplication
+
+
+def enable(path=None, cprofile_every=0):
+    global _tracer
+    if _tracer is not None:
+        return _tracer
+    _tracer = Tracer(path or DEFAULT_TRACE_FILE, cprofile_every)
+    _instrument()
+    atexit.register(flush)
+    return _tracer
+
+
+def configure(argv=None):
+    # picks up --profile / --profile-cprofile or the environment; returns leftover argv
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--profile", nargs="?", const=DEFAULT_TRACE_FILE, default=None)
+    parser.add_argument("--profile-cprofile", type=int, default=None)
+    args, rest = parser.parse_known_args(argv)
+    path = args.profile or os.environ.get(PROFILE_ENV) or None
+    if path in ("1", "true", "yes"):
+        path = DEFAULT_TRACE_FILE
+    every = args.profile_cprofile
+    if every is None:
+        try:
+            every = int(os.environ.get(CPROFILE_ENV, "0"))
+        except ValueError:
+            every = 0
+    if path:
+        enable(path, max(0, every))
+    return rest
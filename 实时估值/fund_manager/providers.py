@@ -1,8 +1,17 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
 import requests
 import re
 import json
 
+from quote_sources import default_sources, timed_fetch
+from estimator import HoldingsEstimator
+from quotes import Quote
+import parsing
+import database
+import history
+
 
 class BaseProvider:
     def fetch(self, code):
@@ -13,8 +22,10 @@ class BaseProvider:
 
 
 class RealProvider(BaseProvider):
-    def __init__(self):
+    def __init__(self, parse_pool=None):
         self._actual_cache = {}  # code -> (ts, rate, date_str)
+        # pingzhongdata parsing can be moved off this interpreter (FUND_PARSE_PROCESSES)
+        self.parse_pool = parse_pool if parse_pool is not None else parsing.get_pool()
 
     def fetch(self, code):
         try:
@@ -23,35 +34,33 @@ class RealProvider(BaseProvider):
             resp = requests.get(url, headers=headers, timeout=5)
             content = resp.text
 
-            result = {'ok': False, 'is_official': False, 'source': '\u5929\u5929\u57fa\u91d1'}
-
             if "jsonpgz" in content:
                 data_str = re.findall(r'jsonpgz\((.*)\);', content)[0]
                 data = json.loads(data_str)
                 gz_time_full = data['gztime']
 
-                result.update({
-                    'est_nav': float(data['gsz']),
-                    'est_rate': float(data['gszzl']) / 100.0,
-                    'time_str': data['gztime'].split(' ')[1],
-                    'nav': float(data.get('dwjz')) if data.get('dwjz') else None,
-                    'nav_date': data.get('jzrq'),
-                    'ok': True,
-                    'is_official': False
-                })
+                result = Quote(
+                    ok=True,
+                    est_nav=float(data['gsz']),
+                    est_rate=float(data['gszzl']) / 100.0,
+                    time_str=data['gztime'].split(' ')[1],
+                    nav=float(data.get('dwjz')) if data.get('dwjz') else None,
+                    nav_date=data.get('jzrq'),
+                    source='\u5929\u5929\u57fa\u91d1',
+                )
 
                 if "15:00" in gz_time_full and datetime.now().hour >= 20:
-                    result['is_official'] = True
+                    result.is_official = True
 
                 actual_rate, actual_date = self.get_actual_rate(code)
                 if actual_rate is not None:
-                    result['actual_rate'] = actual_rate
-                    result['actual_date'] = actual_date
+                    result.actual_rate = actual_rate
+                    result.actual_date = actual_date
 
                 return result
-            return {'ok': False, 'error': '\u65e0\u6548\u4ee3\u7801', 'source': 'Real'}
+            return Quote.failed('\u65e0\u6548\u4ee3\u7801', 'Real')
         except Exception as e:
-            return {'ok': False, 'error': str(e), 'source': 'Real'}
+            return Quote.failed(str(e), 'Real')
 
     def get_fund_name(self, code):
         try:
@@ -65,6 +74,15 @@ class RealProvider(BaseProvider):
             pass
         return None
 
+    def get_nav_history(self, code, since=None):
+        # [(nav_date, nav), ...] from Data_netWorthTrend, oldest first
+        try:
+            url = f"http://fund.eastmoney.com/pingzhongdata/{code}.js"
+            resp = requests.get(url, timeout=10)
+            return self.parse_pool.run(parsing.parse_nav_history, resp.content, since)
+        except Exception:
+            return []
+
     def get_actual_rate(self, code):
         cached = self._actual_cache.get(code)
         if cached:
@@ -75,39 +93,170 @@ class RealProvider(BaseProvider):
         try:
             url = f"http://fund.eastmoney.com/pingzhongdata/{code}.js"
             resp = requests.get(url, timeout=6)
-            text = resp.text
-            m = re.search(r"Data_netWorthTrend\s*=\s*(\[.*?\]);", text, re.S)
-            if not m:
-                return None, None
-            data = json.loads(m.group(1))
-            if len(data) < 2:
+            actual_rate, date_str = self.parse_pool.run(parsing.parse_actual_rate, resp.content)
+            if actual_rate is None:
                 return None, None
-            last = data[-1]
-            prev = data[-2]
-            last_nav = float(last.get('y') or 0)
-            prev_nav = float(prev.get('y') or 0)
-            if prev_nav <= 0:
-                return None, None
-            actual_rate = (last_nav - prev_nav) / prev_nav
-            date_str = datetime.fromtimestamp(last.get('x') / 1000).strftime("%Y-%m-%d")
             self._actual_cache[code] = (datetime.now(), actual_rate, date_str)
             return actual_rate, date_str
         except Exception:
             return None, None
 
 
+class HoldingsProvider(BaseProvider):
+    # Estimate computed here from disclosed holdings and live stock quotes,
+    # used when no external estimate source answers.
+    def __init__(self, estimator=None, nav_provider=None):
+        self.estimator = estimator if estimator is not None else HoldingsEstimator()
+        self.nav_provider = nav_provider if nav_provider is not None else RealProvider()
+        self._base_nav = {}  # code -> (day, nav before day)
+
+    def base_nav(self, code, day):
+        cached = self._base_nav.get(code)
+        if cached and cached[0] == day:
+            return cached[1]
+        before = (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        nav = database.get_nav_on_or_before(code, before)
+        if nav is None:
+            history.sync_nav_history(self.nav_provider, code)
+            nav = database.get_nav_on_or_before(code, before)
+        if nav is not None:
+            self._base_nav[code] = (day, nav)
+        return nav
+
+    def fetch(self, code):
+        try:
+            if not self.estimator.ensure(code):
+                return Quote.failed('\u65e0\u6301\u4ed3\u6570\u636e', 'Holdings')
+            self.estimator.poll()
+            est = self.estimator.estimate(code)
+            now = datetime.now()
+            base = self.base_nav(code, now.strftime("%Y-%m-%d"))
+            if est is None or base is None:
+                return Quote.failed('\u884c\u60c5\u4e0d\u8db3', 'Holdings')
+            rate, coverage = est
+            return Quote(
+                ok=True,
+                est_nav=base * (1.0 + rate),
+                est_rate=rate,
+                time_str=now.strftime("%H:%M:%S"),
+                nav=base,
+                coverage=coverage,
+                source='\u6301\u4ed3\u4f30\u7b97',
+            )
+        except Exception as e:
+            return Quote.failed(str(e), 'Holdings')
+
+    def get_fund_name(self, code):
+        return self.nav_provider.get_fund_name(code)
+
+
+class HedgedProvider(BaseProvider):
+    def __init__(self, sources=None, timeout=5, nav_provider=None, fallback=None):
+        self.sources = sources if sources is not None else default_sources()
+        self.timeout = timeout
+        # official NAV / actual rate still comes from pingzhongdata
+        self.nav_provider = nav_provider if nav_provider is not None else RealProvider()
+        # answers when every estimate source failed, e.g. HoldingsProvider
+        self.fallback = fallback
+        self._pool = ThreadPoolExecutor(max_workers=max(2, len(self.sources) * 2))
+
+    def ranked_sources(self):
+        return sorted(self.sources, key=lambda s: s.stats.score(self.timeout))
+
+    def fetch_estimate(self, code):
+        order = self.ranked_sources()
+        if not order:
+            return None, None
+        deadline = time.monotonic() + self.timeout
+        pending = {}
+        next_idx = 0
+
+        def launch():
+            nonlocal next_idx
+            src = order[next_idx]
+            next_idx += 1
+            pending[self._pool.submit(timed_fetch, src, code)] = src
+
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if next_idx < len(order):
+                # hedge: fire the next source once the in-flight one is slower than its p95
+                in_flight = list(pending.values())[-1]
+                wait_for = min(remaining, in_flight.stats.hedge_delay())
+            else:
+                wait_for = remaining
+            done, _ = wait(list(pending), timeout=wait_for, return_when=FIRST_COMPLETED)
+            for fut in done:
+                src = pending.pop(fut)
+                data = fut.result()
+                if data:
+                    return data, src
+            if next_idx < len(order):
+                launch()
+        return None, None
+
+    def fetch(self, code):
+        try:
+            data, src = self.fetch_estimate(code)
+            if not data:
+                if self.fallback is not None:
+                    return self._fallback_fetch(code)
+                return Quote.failed('\u6240\u6709\u6570\u636e\u6e90\u5747\u5931\u8d25', 'Hedged')
+            gz_time_full = data['gz_time']
+            result = Quote(
+                ok=True,
+                est_nav=float(data['est_nav']),
+                est_rate=float(data['est_rate']),
+                time_str=gz_time_full.split(' ')[1],
+                nav=data.get('nav'),
+                nav_date=data.get('nav_date'),
+                source=src.name,
+            )
+            if "15:00" in gz_time_full and datetime.now().hour >= 20:
+                result.is_official = True
+
+            actual_rate, actual_date = self.nav_provider.get_actual_rate(code)
+            if actual_rate is not None:
+                result.actual_rate = actual_rate
+                result.actual_date = actual_date
+            return result
+        except Exception as e:
+            return Quote.failed(str(e), 'Hedged')
+
+    def _fallback_fetch(self, code):
+        result = self.fallback.fetch(code)
+        if result.ok:
+            actual_rate, actual_date = self.nav_provider.get_actual_rate(code)
+            if actual_rate is not None:
+                result.actual_rate = actual_rate
+                result.actual_date = actual_date
+        return result
+
+    def get_fund_name(self, code):
+        data, _ = self.fetch_estimate(code)
+        if data and data.get('name'):
+            return data['name']
+        return self.nav_provider.get_fund_name(code)
+
+    def latency_report(self):
+        return {s.name: s.stats.summary() for s in self.sources}
+
+
 class MockProvider(BaseProvider):
     def fetch(self, code):
         now = datetime.now()
-        return {
-            'est_nav': 1.2345,
-            'est_rate': 0.012,
-            'actual_rate': 0.008,
-            'actual_date': now.strftime("%Y-%m-%d"),
-            'time_str': now.strftime("%H:%M:%S"),
-            'is_official': now.hour >= 20,
-            'ok': True
-        }
+        return Quote(
+            ok=True,
+            est_nav=1.2345,
+            est_rate=0.012,
+            actual_rate=0.008,
+            actual_date=now.strftime("%Y-%m-%d"),
+            time_str=now.strftime("%H:%M:%S"),
+            is_official=now.hour >= 20,
+        )
 
     def get_fund_name(self, code):
         return f"\u6a21\u62df\u57fa\u91d1({code})"
\ No newline at end of file
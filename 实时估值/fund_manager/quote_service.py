@@ -1,5 +1,6 @@
 from PySide6.QtCore import QThread, Signal, QMutex
-from providers import RealProvider
+from providers import HedgedProvider, HoldingsProvider, RealProvider
+import profiling
 import time
 from datetime import datetime, time as dtime
 from chinese_calendar import is_workday
@@ -7,17 +8,38 @@ from chinese_calendar import is_workday
 
 TRADING_REFRESH_SEC = 10
 NON_TRADING_REFRESH_SEC = 120
+# funds not on screen are refreshed at most this often, a few per cycle
+BACKGROUND_REFRESH_SEC = 60
+BACKGROUND_BATCH = 20
+# while the window is hidden or the user is away only watched funds are fetched
+IDLE_REFRESH_SEC = 300
+
+
+def is_trading_time(now=None):
+    now = now or datetime.now()
+    if not is_workday(now.date()):
+        return False
+    # trading hours 09:30-15:00
+    return dtime(9, 30) <= now.time() <= dtime(15, 0)
 
 
 class QuoteWorker(QThread):
-    price_updated = Signal(int, dict)
+    # Quote records are passed by reference, not copied into a dict per tick
+    price_updated = Signal(int, object)
+    cycle_finished = Signal()
 
     def __init__(self, funds_data):
         super().__init__()
         self.funds_data = funds_data
         self.running = True
-        self.provider = RealProvider()
+        nav_provider = RealProvider()
+        # holdings-based estimate steps in when every external source fails
+        self.provider = HedgedProvider(nav_provider=nav_provider,
+                                       fallback=HoldingsProvider(nav_provider=nav_provider))
         self._force_trigger = False
+        self._priority = []
+        self._last_fetch = {}  # fund id -> monotonic time of last fetch
+        self._background_sec = None  # set while the app is in the background
         self.mutex = QMutex()
 
     def set_funds(self, funds):
@@ -25,25 +47,53 @@ class QuoteWorker(QThread):
         self.funds_data = funds
         self.mutex.unlock()
 
+    def set_priority(self, fund_ids):
+        # visible / recently viewed funds, fetched every cycle
+        self.mutex.lock()
+        self._priority = list(fund_ids)
+        self.mutex.unlock()
+
+    def set_background(self, refresh_sec=None):
+        # None returns to normal cadence; otherwise only the priority funds are
+        # fetched, every refresh_sec, with no background sweep of the rest
+        self._background_sec = refresh_sec
+
+    def _plan_cycle(self, funds, priority):
+        by_id = {f['id']: f for f in funds}
+        plan = [by_id[fid] for fid in priority if fid in by_id]
+        if self._background_sec is not None:
+            return plan
+        seen = {f['id'] for f in plan}
+        now = time.monotonic()
+        never = float('-inf')
+        stale = [f for f in funds
+                 if f['id'] not in seen and now - self._last_fetch.get(f['id'], never) >= BACKGROUND_REFRESH_SEC]
+        stale.sort(key=lambda f: self._last_fetch.get(f['id'], never))
+        plan.extend(stale[:BACKGROUND_BATCH])
+        return plan
+
     def trigger_now(self):
         self._force_trigger = True
 
     def run(self):
         while self.running:
             self.mutex.lock()
-            current_list = list(self.funds_data)
+            current_list = self._plan_cycle(self.funds_data, self._priority)
             self.mutex.unlock()
 
             if current_list:
-                for fund in current_list:
-                    if not self.running:
-                        break
-                    try:
-                        res = self.provider.fetch(fund['code'])
-                        self.price_updated.emit(fund['id'], res)
-                    except Exception as e:
-                        print(f"Fetch error for {fund['code']}: {e}")
-                    time.sleep(0.2)
+                with profiling.cycle("refresh", {"funds": len(current_list)}):
+                    for fund in current_list:
+                        if not self.running:
+                            break
+                        try:
+                            res = self.provider.fetch(fund['code'])
+                            self._last_fetch[fund['id']] = time.monotonic()
+                            self.price_updated.emit(fund['id'], res)
+                        except Exception as e:
+                            print(f"Fetch error for {fund['code']}: {e}")
+                        time.sleep(0.2)
+                self.cycle_finished.emit()
 
             self._force_trigger = False
 
@@ -54,14 +104,10 @@ class QuoteWorker(QThread):
                 time.sleep(1)
 
     def _next_wait_seconds(self):
-        now = datetime.now()
-        if not is_workday(now.date()):
-            return NON_TRADING_REFRESH_SEC
-        # trading hours 09:30-15:00
-        t = now.time()
-        if dtime(9, 30) <= t <= dtime(15, 0):
-            return TRADING_REFRESH_SEC
-        return NON_TRADING_REFRESH_SEC
+        background = self._background_sec
+        if is_trading_time():
+            return TRADING_REFRESH_SEC if background is None else max(TRADING_REFRESH_SEC, int(background))
+        return NON_TRADING_REFRESH_SEC if background is None else max(NON_TRADING_REFRESH_SEC, int(background))
 
     def stop(self):
         self.running = False
@@ -0,0 +1,151 @@
+from collections import deque
+import threading
+import time
+import requests
+import re
+import json
+
+
+# Each source returns a normalized estimate dict or None:
+# {'est_nav', 'est_rate', 'gz_time', 'nav', 'nav_date', 'name'}
+# base_url can be pointed at a local stand-in server for testing.
+
+class LatencyStats:
+    MIN_SAMPLES = 5
+    DEFAULT_DELAY = 0.5
+    MIN_DELAY = 0.1
+    MAX_DELAY = 2.0
+
+    def __init__(self, window=100):
+        self._samples = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok):
+        with self._lock:
+            self._samples.append(latency)
+            self._outcomes.append(1 if ok else 0)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, int(round(q * (len(samples) - 1))))
+        return samples[idx]
+
+    def failure_rate(self):
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return 1.0 - sum(self._outcomes) / len(self._outcomes)
+
+    def hedge_delay(self):
+        with self._lock:
+            enough = len(self._samples) >= self.MIN_SAMPLES
+        if not enough:
+            return self.DEFAULT_DELAY
+        p95 = self.percentile(0.95)
+        return max(self.MIN_DELAY, min(self.MAX_DELAY, p95))
+
+    def score(self, timeout):
+        # lower is better; failures count as a full timeout
+        p50 = self.percentile(0.5)
+        if p50 is None:
+            p50 = self.DEFAULT_DELAY
+        return p50 + self.failure_rate() * timeout
+
+    def summary(self):
+        return {
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'failure_rate': self.failure_rate(),
+            'samples': len(self._samples),
+        }
+
+
+class QuoteSource:
+    name = 'base'
+
+    def __init__(self, base_url=None, timeout=5):
+        if base_url:
+            self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.stats = LatencyStats()
+
+    def fetch_estimate(self, code):
+        raise NotImplementedError
+
+
+class FundgzSource(QuoteSource):
+    name = '天天基金'
+    base_url = 'http://fundgz.1234567.com.cn'
+
+    def fetch_estimate(self, code):
+        url = f"{self.base_url}/js/{code}.js"
+        headers = {'Referer': 'http://fund.eastmoney.com/'}
+        resp = requests.get(url, headers=headers, timeout=self.timeout)
+        content = resp.text
+        if "jsonpgz" not in content:
+            return None
+        data = json.loads(re.findall(r'jsonpgz\((.*)\);', content)[0])
+        return {
+            'est_nav': float(data['gsz']),
+            'est_rate': float(data['gszzl']) / 100.0,
+            'gz_time': data['gztime'],
+            'nav': float(data.get('dwjz')) if data.get('dwjz') else None,
+            'nav_date': data.get('jzrq'),
+            'name': data.get('name'),
+        }
+
+
+class SinaSource(QuoteSource):
+    name = '新浪财经'
+    base_url = 'http://hq.sinajs.cn'
+
+    def fetch_estimate(self, code):
+        url = f"{self.base_url}/list=fu_{code}"
+        headers = {'Referer': 'https://finance.sina.com.cn/'}
+        resp = requests.get(url, headers=headers, timeout=self.timeout)
+        m = re.search(r'hq_str_fu_\d+="([^"]*)"', resp.text)
+        if not m or not m.group(1):
+            return None
+        # name, time, est_nav, last_nav, accum_nav, ?, est_rate(%), date
+        parts = m.group(1).split(',')
+        if len(parts) < 8:
+            return None
+        est_nav = float(parts[2])
+        if est_nav <= 0:
+            return None
+        return {
+            'est_nav': est_nav,
+            'est_rate': float(parts[6]) / 100.0,
+            'gz_time': f"{parts[7]} {parts[1][:5]}",
+            'nav': float(parts[3]) if parts[3] else None,
+            'nav_date': None,
+            'name': parts[0],
+        }
+
+
+def default_sources():
+    return [FundgzSource(), SinaSource()]
+
+
+def timed_fetch(source, code):
+    start = time.perf_counter()
+    try:
+        data = source.fetch_estimate(code)
+    except Exception:
+        data = None
+    ok = is_valid_estimate(data)
+    source.stats.record(time.perf_counter() - start, ok)
+    return data if ok else None
+
+
+def is_valid_estimate(data):
+    if not data:
+        return False
+    try:
+        return float(data['est_nav']) > 0 and bool(data.get('gz_time'))
+    except Exception:
+        return False
@@ -0,0 +1,147 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+# One Quote object is built by the provider and travels by reference through
+# the worker signal into MainWindow.cache; the GUI fills in the display fields
+# on the same object instead of copying it.
+
+
+class Quote:
+    __slots__ = ("ok", "est_nav", "est_rate", "time_str", "nav", "nav_date", "is_official",
+                 "actual_rate", "actual_date", "actual_rate_display", "actual_date_display",
+                 "coverage", "source", "error", "stale")
+
+    def __init__(self, ok=False, est_nav=None, est_rate=None, time_str=None, nav=None, nav_date=None,
+                 is_official=False, actual_rate=None, actual_date=None, coverage=None, source=None, error=None):
+        self.ok = ok
+        self.est_nav = est_nav
+        self.est_rate = est_rate
+        self.time_str = time_str
+        self.nav = nav
+        self.nav_date = nav_date
+        self.is_official = is_official
+        self.actual_rate = actual_rate
+        self.actual_date = actual_date
+        self.actual_rate_display = None
+        self.actual_date_display = None
+        self.coverage = coverage
+        self.source = source
+        self.error = error
+        self.stale = False  # restored from the last session, not fetched yet
+
+    @classmethod
+    def failed(cls, error, source=None):
+        return cls(ok=False, error=error, source=source)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        quote = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(quote, name, data[name])
+        return quote
+
+    def __repr__(self):
+        if not self.ok:
+            return f"Quote(ok=False, error={self.error!r})"
+        return f"Quote({self.est_nav}, {self.est_rate:+.4f}, {self.time_str}, source={self.source!r})"
+
+
+# fields kept in the warm-start snapshot; display fields are re-derived on load
+SNAPSHOT_FIELDS = ("est_nav", "est_rate", "time_str", "nav", "nav_date", "is_official",
+                   "actual_rate", "actual_date", "source")
+SNAPSHOT_VERSION = 1
+SNAPSHOT_FILE = "quote_snapshot.json"
+
+
+def snapshot_payload(quotes, metrics=None):
+    # quotes: {fund_id: Quote}; metrics: {fund_id: FundMetrics}. Rows are plain
+    # lists so the file stays small and loads with a single json.load.
+    metrics = metrics or {}
+    rows = {}
+    for fid, q in quotes.items():
+        if not q.ok:
+            continue
+        row = [getattr(q, name) for name in SNAPSHOT_FIELDS]
+        m = metrics.get(fid)
+        row.append([m.market_value, m.today_pnl, m.total_pnl, m.total_rate] if m is not None else None)
+        rows[str(fid)] = row
+    return {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "fields": list(SNAPSHOT_FIELDS) + ["metrics"],
+        "quotes": rows,
+    }
+
+
+def write_snapshot(path, payload):
+    # write-then-rename so a crash never leaves a half-written snapshot
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    # {fund_id: (Quote, FundMetrics or None)}, every quote marked stale
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if payload.get("version") != SNAPSHOT_VERSION:
+        return {}
+    out = {}
+    n = len(SNAPSHOT_FIELDS)
+    for fid, row in payload.get("quotes", {}).items():
+        quote = Quote(ok=True)
+        for name, value in zip(SNAPSHOT_FIELDS, row[:n]):
+            setattr(quote, name, value)
+        quote.stale = True
+        m = row[n] if len(row) > n else None
+        out[int(fid)] = (quote, FundMetrics(*m) if m else None)
+    return out
+
+
+class FundMetrics:
+    __slots__ = ("market_value", "today_pnl", "total_pnl", "total_rate")
+
+    def __init__(self, market_value, today_pnl, total_pnl, total_rate):
+        self.market_value = market_value
+        self.today_pnl = today_pnl
+        self.total_pnl = total_pnl
+        self.total_rate = total_rate
+
+
+def record_size(obj):
+    # the record plus the values it references; None/True/False are skipped but
+    # strings shared between records are counted each time, so this is an upper bound
+    if obj is None:
+        return 0
+    size = sys.getsizeof(obj)
+    values = obj.values() if isinstance(obj, dict) else (getattr(obj, n, None) for n in obj.__slots__)
+    for v in values:
+        if v is not None and v is not True and v is not False:
+            size += sys.getsizeof(v)
+    return size
+
+
+def memory_report(cache):
+    # bytes held per fund by the latest quote and metrics records in MainWindow.cache
+    funds = quote_bytes = metric_bytes = 0
+    for entry in cache.values():
+        funds += 1
+        quote_bytes += record_size(entry.get("quote"))
+        metric_bytes += record_size(entry.get("metrics"))
+    total = quote_bytes + metric_bytes
+    return {
+        "funds": funds,
+        "quote_bytes": quote_bytes,
+        "metrics_bytes": metric_bytes,
+        "bytes_per_fund": total / funds if funds else 0.0,
+    }
@@ -0,0 +1,233 @@
+import numpy as np
+
+import database
+import history
+from history import HistoryEngine
+from providers import RealProvider
+
+# Risk analytics over stored NAV history (nav_history). All held funds are
+# aligned on one date axis as a T x N NAV matrix (forward-filled, NaN before a
+# fund's first NAV), so every metric is a column-wise reduction and the
+# correlation matrix is a handful of N x N matrix products.
+# Results are cached per window and dropped only when the (last date, count)
+# stamp of some series changes, i.e. when new NAV dates have been stored.
+
+TRADING_DAYS = 252
+RISK_FREE_RATE = 0.015  # annual, for Sharpe
+BENCHMARK_CODE = "510300"  # 沪深300ETF
+BENCHMARK_NAME = "沪深300"
+WINDOWS = {"3m": ("近3月", 63), "6m": ("近6月", 126), "1y": ("近1年", 252), "3y": ("近3年", 756),
+           "all": ("成立以来", None)}
+MIN_OBSERVATIONS = 20  # fewer daily returns than this -> NaN
+METRIC_FIELDS = ("volatility", "max_drawdown", "sharpe", "beta", "observations")
+
+
+def align_navs(series):
+    # {code: (dates, navs)} -> (dates, codes, T x N matrix) on the union of all dates
+    codes = [code for code, (d, _) in series.items() if len(d)]
+    if not codes:
+        return np.empty(0, dtype="datetime64[D]"), [], np.empty((0, 0))
+    per_code = [(np.asarray(series[c][0], dtype="datetime64[D]"), np.asarray(series[c][1], dtype=float))
+                for c in codes]
+    dates = np.unique(np.concatenate([d for d, _ in per_code]))
+    navs = np.full((len(dates), len(codes)), np.nan)
+    for j, (d, v) in enumerate(per_code):
+        # carry the last NAV over days the fund did not publish (QDII holidays etc.)
+        pos = np.searchsorted(d, dates, side="right") - 1
+        navs[:, j] = np.where(pos >= 0, v[np.clip(pos, 0, None)], np.nan)
+    return dates, codes, navs
+
+
+def daily_returns(navs):
+    # T x N NAVs -> (T-1) x N simple returns, NaN where either day is missing
+    navs = np.asarray(navs, dtype=float)
+    if len(navs) < 2:
+        return np.empty((0,) + navs.shape[1:])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return navs[1:] / navs[:-1] - 1.0
+
+
+def _masked_moments(returns, bench):
+    # column-wise mean/std over valid rows, plus beta on rows where the benchmark is valid too
+    valid = ~np.isnan(returns)
+    n = valid.sum(axis=0)
+    x = np.where(valid, returns, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = x.sum(axis=0) / n
+        var = np.where(valid, (returns - mean) ** 2, 0.0).sum(axis=0) / (n - 1)
+        beta = np.full(returns.shape[1], np.nan)
+        if bench is not None:
+            both = valid & ~np.isnan(bench)[:, None]
+            m = both.sum(axis=0)
+            rx = np.where(both, returns, 0.0)
+            rb = np.where(both, bench[:, None], 0.0)
+            mx = rx.sum(axis=0) / m
+            mb = rb.sum(axis=0) / m
+            cov = np.where(both, (rx - mx) * (rb - mb), 0.0).sum(axis=0)
+            var_b = np.where(both, (rb - mb) ** 2, 0.0).sum(axis=0)
+            beta = np.where(m >= MIN_OBSERVATIONS, cov / var_b, np.nan)
+    return n, mean, np.sqrt(var), beta
+
+
+def max_drawdown(returns):
+    # largest peak-to-trough fall of the compounded return path, per column
+    if not len(returns):
+        return np.full(returns.shape[1:], np.nan)
+    wealth = np.cumprod(1.0 + np.nan_to_num(returns), axis=0)
+    wealth = np.vstack([np.ones((1,) + wealth.shape[1:]), wealth])
+    peak = np.maximum.accumulate(wealth, axis=0)
+    return (1.0 - wealth / peak).max(axis=0)
+
+
+def risk_metrics(returns, bench=None, risk_free=RISK_FREE_RATE):
+    # returns: T x N daily returns (NaN = no data) -> {field: (N,) array}
+    returns = np.asarray(returns, dtype=float)
+    n, mean, std, beta = _masked_moments(returns, bench)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vol = std * np.sqrt(TRADING_DAYS)
+        sharpe = (mean * TRADING_DAYS - risk_free) / vol
+    enough = n >= MIN_OBSERVATIONS
+    return {
+        "volatility": np.where(enough, vol, np.nan),
+        "max_drawdown": np.where(n > 0, max_drawdown(returns), np.nan),
+        "sharpe": np.where(enough & (vol > 0), sharpe, np.nan),
+        "beta": beta,
+        "observations": n,
+    }
+
+
+def correlation_matrix(returns):
+    # pairwise-complete Pearson correlation, N x N; NaN for pairs with too little overlap
+    returns = np.asarray(returns, dtype=float)
+    valid = ~np.isnan(returns)
+    m = valid.astype(float)
+    x = np.where(valid, returns, 0.0)
+    counts = m.T @ m
+    sx = x.T @ m            # [i, j]: sum of x_i over rows where j is valid too
+    sxx = (x * x).T @ m
+    sxy = x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / counts
+        var_i = sxx - sx ** 2 / counts
+        corr = cov / np.sqrt(var_i * var_i.T)
+    corr[counts < MIN_OBSERVATIONS] = np.nan
+    np.fill_diagonal(corr, np.where(np.diag(counts) >= MIN_OBSERVATIONS, 1.0, np.nan))
+    return np.clip(corr, -1.0, 1.0)
+
+
+def account_returns(curve):
+    # daily return of an account net of cash flows: change in total P&L over
+    # the previous day's market value (trades move value and cost together)
+    mv = curve["market_value"]
+    pnl = curve["total_pnl"]
+    out = np.full(len(mv), np.nan)
+    if len(mv) > 1:
+        prev = mv[:-1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[1:] = np.where(prev > 0, np.diff(pnl) / prev, np.nan)
+    return out
+
+
+class RiskEngine:
+    def __init__(self, benchmark=BENCHMARK_CODE, risk_free=RISK_FREE_RATE):
+        self.benchmark = benchmark
+        self.risk_free = risk_free
+        self.history = HistoryEngine()  # loads NAVs incrementally and owns the account curves
+        self._bench = (np.empty(0, dtype="datetime64[D]"), np.empty(0))
+        self._stamps = None
+        self._aligned = None  # (dates, codes, returns, bench)
+        self._results = {}    # window -> (key, report)
+
+    def sync(self, provider=None):
+        # fetch missing NAV days for held funds and the benchmark; returns rows added
+        provider = provider or RealProvider()
+        codes = sorted({f["code"] for f in database.get_all_funds_with_positions()})
+        return sum(history.sync_nav_history(provider, code) for code in codes + [self.benchmark])
+
+    def _update(self):
+        # one shared connection for the per-fund reads; only days after the cached ones are fetched
+        with database.batch():
+            funds = database.get_all_funds_with_positions()
+            curves = self.history.update_all()
+            bench_dates, bench_nav = self._bench
+            rows = database.get_nav_history(self.benchmark, since=str(bench_dates[-1]) if len(bench_dates) else None)
+        if rows:
+            self._bench = (np.concatenate([bench_dates, np.array([d for d, _ in rows], dtype="datetime64[D]")]),
+                           np.concatenate([bench_nav, np.array([v for _, v in rows], dtype=float)]))
+        curves["全部"] = self.history.portfolio_curve()
+        return funds, curves
+
+    def _align(self, funds):
+        series = {}
+        for f in funds:
+            curve = self.history.fund_curve(f["id"])
+            if curve is not None and len(curve["dates"]) and f["code"] not in series:
+                series[f["code"]] = (curve["dates"], curve["nav"])
+        codes = sorted(series)
+        stamps = (tuple((c, len(series[c][0])) for c in codes), len(self._bench[0]))
+        if stamps == self._stamps:
+            return False
+        if len(self._bench[0]):
+            series[self.benchmark] = self._bench
+        dates, all_codes, navs = align_navs(series)
+        returns = daily_returns(navs)
+        held_codes = set(codes)
+        held = [j for j, code in enumerate(all_codes) if code in held_codes]
+        bench = (returns[:, all_codes.index(self.benchmark)] if len(self._bench[0])
+                 else np.full(len(returns), np.nan))
+        self._aligned = (dates[1:], [all_codes[j] for j in held], returns[:, held], bench)
+        self._stamps = stamps
+        self._results.clear()
+        return True
+
+    def report(self, window="1y"):
+        # {"dates", "funds": [{code, name, accounts, metrics...}], "accounts": [...], "codes", "correlation"}
+        funds, curves = self._update()
+        self._align(funds)
+        key = tuple((name, id(c)) for name, c in sorted(curves.items()))
+        cached = self._results.get(window)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        dates, aligned_codes, returns, bench = self._aligned
+        span = WINDOWS[window][1]
+        if span is not None and len(dates) > span:
+            dates, returns, bench = dates[-span:], returns[-span:], bench[-span:]
+        names = {}
+        accounts = {}
+        for f in funds:
+            names.setdefault(f["code"], f["name"])
+            accounts.setdefault(f["code"], set()).add(f.get("account") or "默认账户")
+
+        metrics = risk_metrics(returns, bench, self.risk_free) if len(aligned_codes) else {}
+        fund_rows = []
+        for j, code in enumerate(aligned_codes):
+            row = {"code": code, "name": names.get(code, code), "accounts": sorted(accounts.get(code, ()))}
+            row.update({k: float(metrics[k][j]) for k in METRIC_FIELDS})
+            fund_rows.append(row)
+
+        account_rows = []
+        if len(dates):
+            names_sorted = sorted(curves)
+            cols = np.full((len(dates), len(names_sorted)), np.nan)
+            for j, name in enumerate(names_sorted):
+                curve = curves[name]
+                if not len(curve["dates"]):
+                    continue
+                r = account_returns(curve)
+                pos = np.searchsorted(curve["dates"], dates)
+                hit = (pos < len(r)) & (curve["dates"][np.clip(pos, 0, len(r) - 1)] == dates)
+                cols[:, j] = np.where(hit, r[np.clip(pos, 0, len(r) - 1)], np.nan)
+            acc = risk_metrics(cols, bench, self.risk_free)
+            for j, name in enumerate(names_sorted):
+                account_rows.append({"account": name, **{k: float(acc[k][j]) for k in METRIC_FIELDS}})
+
+        result = {
+            "window": window,
+            "dates": dates,
+            "funds": fund_rows,
+            "accounts": account_rows,
+            "codes": aligned_codes,
+            "correlation": correlation_matrix(returns) if len(aligned_codes) else np.empty((0, 0)),
+        }
+        self._results[window] = (key, result)
+        return result
@@ -0,0 +1,158 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import database
+import calc
+import history
+from history import HistoryEngine
+from providers import RealProvider
+
+PERIODS = {"week": "本周", "month": "本月", "ytd": "今年"}
+
+
+def _fund_state_at(fund_id, code, snap_date, nav):
+    # replay only trades priced on or before snap_date; pending buys are skipped
+    cutoff = datetime.strptime(snap_date, "%Y-%m-%d").date()
+    trades = []
+    for t in database.get_trades_by_fund(fund_id):
+        try:
+            priced = calc.pricing_date(datetime.strptime(t['trade_time'], "%Y-%m-%d %H:%M:%S"))
+        except Exception:
+            priced = datetime.strptime(t['trade_time'][:10], "%Y-%m-%d").date()
+        if priced > cutoff:
+            continue
+        if t['type'] == 'sell' and not float(t['amount']) and not float(t.get('price') or 0):
+            # same valuation HistoryEngine uses for sells entered by shares only
+            t = dict(t)
+            t['price'] = database.get_nav_on_or_before(code, priced.isoformat()) or nav
+        trades.append(t)
+    shares, cost, realized = 0.0, 0.0, 0.0
+    for _, shares, cost, r in calc.replay_trades(trades):
+        realized += r
+    if shares < 0.0001:
+        shares, cost = 0.0, 0.0
+    return shares, cost, realized
+
+
+class SnapshotJob:
+    def __init__(self):
+        self._last = database.get_last_snapshot_dates()  # code -> last snap_date
+
+    def on_quote(self, info, quote):
+        # quote.nav / quote.nav_date is the latest official NAV
+        nav = quote.nav
+        nav_date = quote.nav_date
+        if not nav or not nav_date:
+            return False
+        code = info["code"]
+        if self._last.get(code, "") >= nav_date:
+            return False
+        self.snapshot_fund(info["id"], code, float(nav), nav_date)
+        self._last[code] = nav_date
+        return True
+
+    def snapshot_fund(self, fund_id, code, nav, nav_date):
+        shares, cost, realized = _fund_state_at(fund_id, code, nav_date, nav)
+        mv = shares * nav
+        database.write_snapshots([(nav_date, "fund", code, shares, cost, nav, mv, realized, mv - cost)])
+        database.refresh_group_snapshots(nav_date)
+
+
+def backfill(start=None, end=None, engine=None, provider=None, should_stop=None):
+    # fetch the missing NAV days of every fund first, the curves are built from them;
+    # returns the snapshot rows written, or None when should_stop() cancelled it
+    provider = provider or RealProvider()
+    funds = database.get_all_funds_with_positions()
+    for code in sorted({f['code'] for f in funds}):
+        if should_stop and should_stop():
+            return None
+        try:
+            history.sync_nav_history(provider, code)
+        except Exception as e:
+            print(f"NAV sync error for {code}: {e}")
+    engine = engine or HistoryEngine()
+    account_curves = engine.update_all()
+    lo = np.datetime64(start, 'D') if start else None
+    hi = np.datetime64(end, 'D') if end else None
+
+    def window(curve):
+        mask = np.ones(len(curve['dates']), dtype=bool)
+        if lo is not None:
+            mask &= curve['dates'] >= lo
+        if hi is not None:
+            mask &= curve['dates'] <= hi
+        return mask
+
+    rows = []
+    for f in funds:
+        curve = engine.fund_curve(f['id'])
+        if curve is None or not len(curve['dates']):
+            continue
+        m = window(curve)
+        rows.extend(zip(
+            curve['dates'][m].astype(str).tolist(), ["fund"] * int(m.sum()), [f['code']] * int(m.sum()),
+            curve['shares'][m].tolist(), curve['cost'][m].tolist(), curve['nav'][m].tolist(),
+            curve['market_value'][m].tolist(), curve['realized_pnl'][m].tolist(),
+            curve['unrealized_pnl'][m].tolist(),
+        ))
+    groups = [("account", name, c) for name, c in account_curves.items()]
+    groups.append(("portfolio", "全部", engine.portfolio_curve()))
+    for scope, key, curve in groups:
+        if not len(curve['dates']):
+            continue
+        m = window(curve)
+        n = int(m.sum())
+        rows.extend(zip(
+            curve['dates'][m].astype(str).tolist(), [scope] * n, [key] * n, [None] * n,
+            curve['cost'][m].tolist(), [None] * n, curve['market_value'][m].tolist(),
+            curve['realized_pnl'][m].tolist(), curve['unrealized_pnl'][m].tolist(),
+        ))
+    if should_stop and should_stop():
+        return None
+    database.write_snapshots(rows)
+    return len(rows)
+
+
+def period_start(period, today=None):
+    today = today or date.today()
+    if period == "week":
+        return today - timedelta(days=today.weekday())
+    if period == "month":
+        return today.replace(day=1)
+    if period == "ytd":
+        return today.replace(month=1, day=1)
+    raise ValueError(period)
+
+
+def period_pnl(scope, key, start, end=None):
+    # two-row lookup: close before the period vs latest close inside it
+    end = end or date.today()
+    base = database.get_snapshot_on_or_before(scope, key, (start - timedelta(days=1)).isoformat())
+    last = database.get_snapshot_on_or_before(scope, key, end.isoformat())
+    if not last:
+        return None
+
+    def total(row):
+        return (row['realized_pnl'] or 0.0) + (row['unrealized_pnl'] or 0.0) if row else 0.0
+
+    pnl = total(last) - total(base)
+    if base and base['market_value']:
+        denom = base['market_value']
+    else:
+        denom = last['cost_amount'] or 0.0
+    return {
+        "pnl": pnl,
+        "rate": pnl / denom if denom else 0.0,
+        "from": base['snap_date'] if base else None,
+        "to": last['snap_date'],
+    }
+
+
+def period_report(today=None):
+    # {account: {period: result}} plus the whole portfolio under "全部"
+    keys = [("portfolio", "全部")] + [("account", a) for a in database.get_accounts()]
+    report = {}
+    for scope, key in keys:
+        report[key] = {p: period_pnl(scope, key, period_start(p, today), today) for p in PERIODS}
+    return report
@@ -0,0 +1,537 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QAbstractProxyModel, QModelIndex, QTimer
+from PySide6.QtGui import QColor
+from datetime import datetime
+import random
+
+import database
+
+COLOR_RED = QColor(220, 50, 50)
+COLOR_GREEN = QColor(50, 150, 50)
+COLOR_BLACK = QColor(Qt.black)
+COLOR_GREY = QColor(140, 140, 140)
+
+HEADERS = ["ID", "代码", "名称", "持仓市值", "今日涨跌", "实际涨跌", "今日盈亏", "累计盈亏", "收益率", "更新时间"]
+PAGE_SIZE = 200
+RERANK_MS = 1000  # moved rows are repositioned at most this often
+
+
+def _sign_color(value):
+    return COLOR_RED if value > 0 else COLOR_GREEN if value < 0 else COLOR_BLACK
+
+
+def format_row(quote, metrics, failed=False):
+    # [(text, color)] for columns 3..9; quote is the last good one, failed marks a refresh that did not succeed since
+    if not (metrics and quote and quote.ok):
+        return [("--", None)] * 7
+    cells = [(f"{metrics.market_value:,.2f}", None)]
+    c_day = _sign_color(metrics.today_pnl)
+    rate_prefix = "估" if not quote.is_official else "净"
+    cells.append((f"{rate_prefix}{quote.est_rate * 100:+.2f}%", c_day))
+    actual_rate = quote.actual_rate_display
+    actual_date = quote.actual_date_display
+    if actual_rate is None:
+        cells.append(("--", None))
+    else:
+        actual_text = f"{actual_rate * 100:+.2f}%"
+        if actual_date:
+            actual_text += f" ({actual_date})"
+        cells.append((actual_text, _sign_color(actual_rate)))
+    cells.append((f"{metrics.today_pnl:+,.2f}", c_day))
+    c_total = _sign_color(metrics.total_pnl)
+    cells.append((f"{metrics.total_pnl:+,.2f}", c_total))
+    cells.append((f"{metrics.total_rate * 100:+.2f}%", c_total))
+    date_str = quote.nav_date or datetime.now().strftime("%Y-%m-%d")
+    if failed:
+        cells.append((f"刷新失败 {quote.time_str} {date_str}", COLOR_GREY))
+    elif quote.stale:
+        # last session's quote, shown until the worker refreshes this fund
+        cells.append((f"缓存 {quote.time_str} {date_str}", COLOR_GREY))
+    else:
+        cells.append((f"{quote.time_str} {date_str}" + (" (已校准)" if quote.is_official else ""), None))
+    return cells
+
+
+class FundTableModel(QAbstractTableModel):
+    # Rows are paged in from SQLite as the view scrolls (canFetchMore/fetchMore);
+    # cell text is formatted once per quote, not per paint.
+    def __init__(self, cache, parent=None, on_fetch=None):
+        super().__init__(parent)
+        self.cache = cache  # fid -> {"info", "quote", "metrics"}, owned by MainWindow
+        self.on_fetch = on_fetch  # called with each page's fund rows before they are shown
+        self._ids = []
+        self._row_of = {}
+        self._display = {}  # fid -> format_row(...)
+        self._account = None
+        self._total = 0
+
+    def reset(self, account=None):
+        self.beginResetModel()
+        self._account = account
+        self._ids = []
+        self._row_of = {}
+        self._display = {}
+        self._total = database.count_funds(account)
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and len(self._ids) < self._total
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        rows = database.get_funds_page(self._account, len(self._ids), PAGE_SIZE)
+        if not rows:
+            self._total = len(self._ids)
+            return
+        for f in rows:
+            entry = self.cache.get(f["id"])
+            if entry is None:
+                self.cache[f["id"]] = {"info": f, "quote": None, "metrics": None}
+            else:
+                entry["info"] = f
+        if self.on_fetch is not None:
+            self.on_fetch(rows)
+        start = len(self._ids)
+        self.beginInsertRows(QModelIndex(), start, start + len(rows) - 1)
+        for f in rows:
+            self._row_of[f["id"]] = len(self._ids)
+            self._ids.append(f["id"])
+        self.endInsertRows()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        fid = self._ids[index.row()]
+        col = index.column()
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignCenter) if col >= 3 else None
+        if role not in (Qt.DisplayRole, Qt.ForegroundRole):
+            return None
+        if col < 3:
+            if role != Qt.DisplayRole:
+                return None
+            if col == 0:
+                return str(fid)
+            info = self.cache[fid]["info"]
+            return info["code"] if col == 1 else info["name"]
+        cells = self._display.get(fid)
+        if cells is None:
+            entry = self.cache.get(fid) or {}
+            cells = self._display[fid] = format_row(entry.get("quote"), entry.get("metrics"), entry.get("failed"))
+        text, color = cells[col - 3]
+        return text if role == Qt.DisplayRole else color
+
+    def fund_id_at(self, row):
+        if 0 <= row < len(self._ids):
+            return self._ids[row]
+        return None
+
+    def row_of(self, fid):
+        return self._row_of.get(fid)
+
+    def loaded_ids(self):
+        return list(self._ids)
+
+    def refresh_fund(self, fid):
+        row = self._row_of.get(fid)
+        if row is None:
+            return
+        self._display.pop(fid, None)
+        self.dataChanged.emit(self.index(row, 1), self.index(row, len(HEADERS) - 1))
+
+    def refresh_all(self):
+        # one signal for every loaded row, after updates were held back
+        if not self._ids:
+            return
+        self._display.clear()
+        self.dataChanged.emit(self.index(0, 1), self.index(len(self._ids) - 1, len(HEADERS) - 1))
+
+
+def sort_value(entry, column):
+    # the value a column sorts by, None when the fund has nothing to show there.
+    # Keys come from the last good quote; entry["failed"] is ignored, so a fund
+    # whose refresh fails once keeps its place instead of dropping to the bottom.
+    info, quote, metrics = entry.get("info") or {}, entry.get("quote"), entry.get("metrics")
+    if column == 1:
+        return info.get("code")
+    if column == 2:
+        return info.get("name")
+    if not (quote and quote.ok):
+        return None
+    if column == 4:
+        return quote.est_rate
+    if column == 5:
+        return quote.actual_rate_display
+    if column == 9:
+        return f"{quote.nav_date or ''} {quote.time_str or ''}"
+    if metrics is None:
+        return None
+    return (metrics.market_value, None, None, metrics.today_pnl, metrics.total_pnl, metrics.total_rate)[column - 3]
+
+
+class _Node:
+    __slots__ = ("key", "priority", "left", "right", "size")
+
+    def __init__(self, key, priority):
+        self.key = key
+        self.priority = priority
+        self.left = None
+        self.right = None
+        self.size = 1
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _split(node, key):
+    # -> (keys < key, keys >= key)
+    if node is None:
+        return None, None
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.size = 1 + _size(node.left) + _size(node.right)
+        return node, right
+    left, node.left = _split(node.left, key)
+    node.size = 1 + _size(node.left) + _size(node.right)
+    return left, node
+
+
+def _merge(left, right):
+    # every key of left is below every key of right
+    if left is None or right is None:
+        return left if right is None else right
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.size = 1 + _size(left.left) + _size(left.right)
+        return left
+    right.left = _merge(left, right.left)
+    right.size = 1 + _size(right.left) + _size(right.right)
+    return right
+
+
+def _drop_first(node):
+    if node.left is None:
+        return node.right
+    node.left = _drop_first(node.left)
+    node.size -= 1
+    return node
+
+
+class RankedKeys:
+    # Sorted distinct keys in a treap whose nodes count their subtree, so
+    # insert, remove, rank (position of a key) and select (key at a position)
+    # all take O(log n) expected time.
+    def __init__(self, keys=()):
+        # balanced from the sorted keys; priorities handed out level by level
+        # from the highest down keep the heap order
+        keys = sorted(keys)
+        levels = []
+
+        def build(lo, hi, depth):
+            if lo >= hi:
+                return None
+            mid = (lo + hi) // 2
+            node = _Node(keys[mid], 0.0)
+            if depth == len(levels):
+                levels.append([])
+            levels[depth].append(node)
+            node.left = build(lo, mid, depth + 1)
+            node.right = build(mid + 1, hi, depth + 1)
+            node.size = hi - lo
+            return node
+        self._root = build(0, len(keys), 0)
+        priorities = iter(sorted((random.random() for _ in keys), reverse=True))
+        for level in levels:
+            for node in level:
+                node.priority = next(priorities)
+
+    def __len__(self):
+        return _size(self._root)
+
+    def insert(self, key):
+        left, right = _split(self._root, key)
+        self._root = _merge(_merge(left, _Node(key, random.random())), right)
+
+    def remove(self, key):
+        left, right = _split(self._root, key)
+        if right is not None:
+            right = _drop_first(right)
+        self._root = _merge(left, right)
+
+    def rank(self, key):
+        # number of keys below `key`
+        node, count = self._root, 0
+        while node is not None:
+            if node.key < key:
+                count += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return count
+
+    def select(self, position):
+        node = self._root
+        while node is not None:
+            left = _size(node.left)
+            if position < left:
+                node = node.left
+            elif position == left:
+                return node.key
+            else:
+                position -= left + 1
+                node = node.right
+        raise IndexError(position)
+
+
+class FundSortFilterModel(QAbstractProxyModel):
+    # Sort and filter layer over FundTableModel. The shown funds are kept in
+    # self._order, RankedKeys of (flag, value, fid) sorted ascending (descending
+    # order reads it from the end). A quote only re-keys its own fund: the
+    # new key is noted and, at most every RERANK_MS, each fund whose position
+    # changed is moved in O(log n) and announced with beginMoveRows for that
+    # row alone. Selection and the current row follow the fund, not the row
+    # number. Unsorted, rows keep the source order and
+    # the source keeps paging lazily; sorting or filtering loads every row.
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self._column = -1
+        self._ascending = True
+        self._filter = ""
+        self._order = RankedKeys()
+        self._key_of = {}    # fid -> key currently in self._order
+        self._text_of = {}   # fid -> lowercased "code name account" for the filter
+        self._dirty = set()
+        self._loading = False
+        self._rerank_timer = QTimer(self)
+        self._rerank_timer.setSingleShot(True)
+        self._rerank_timer.setInterval(RERANK_MS)
+        self._rerank_timer.timeout.connect(self._rerank)
+        self.setSourceModel(source)
+        source.modelReset.connect(self._source_reset)
+        source.rowsInserted.connect(self._source_rows_inserted)
+        source.dataChanged.connect(self._source_data_changed)
+        self._source_reset()
+
+    # -- keys ---------------------------------------------------------------
+
+    def _key(self, fid, source_row=None):
+        if self._column < 0:
+            row = self.sourceModel().row_of(fid) if source_row is None else source_row
+            return (1, row, fid)
+        value = sort_value(self.sourceModel().cache.get(fid) or {}, self._column)
+        if value is None:
+            # funds without a value stay at the bottom either way
+            return (2 if self._ascending else 0, 0, fid)
+        return (1, value, fid)
+
+    def _accepts(self, fid):
+        return not self._filter or self._filter in self._text_of.get(fid, "")
+
+    def _remember_text(self, fid):
+        info = (self.sourceModel().cache.get(fid) or {}).get("info") or {}
+        self._text_of[fid] = f"{info.get('code', '')} {info.get('name', '')} {info.get('account') or ''}".lower()
+
+    def _row_at(self, position):
+        return position if self._ascending else len(self._order) - 1 - position
+
+    def _build(self):
+        source = self.sourceModel()
+        if self._column >= 0 or self._filter:
+            self._loading = True
+            try:
+                while source.canFetchMore():
+                    source.fetchMore()
+            finally:
+                self._loading = False
+        ids = source.loaded_ids()
+        for fid in ids:
+            if fid not in self._text_of:
+                self._remember_text(fid)
+        self._key_of = {fid: self._key(fid, row) for row, fid in enumerate(ids) if self._accepts(fid)}
+        self._order = RankedKeys(self._key_of.values())
+        self._dirty.clear()
+
+    def _relayout(self, change):
+        # reorder with persistent indexes (selection, current row) kept on their funds
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        fids = [self.fund_id_at(ix.row()) for ix in persistent]
+        change()
+        self.changePersistentIndexList(persistent, [
+            self.index(row, ix.column()) if row is not None else QModelIndex()
+            for ix, row in zip(persistent, (self.row_of(fid) for fid in fids))
+        ])
+        self.layoutChanged.emit()
+
+    # -- public -------------------------------------------------------------
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        column = column if column > 0 else -1
+        # unsorted always means source order, whatever direction the header indicator shows
+        ascending = column < 0 or order == Qt.AscendingOrder
+        if (column, ascending) == (self._column, self._ascending):
+            return
+
+        def change():
+            self._column, self._ascending = column, ascending
+            self._build()
+        self._relayout(change)
+
+    def set_filter_text(self, text):
+        text = text.strip().lower()
+        if text == self._filter:
+            return
+
+        def change():
+            self._filter = text
+            self._build()
+        self._relayout(change)
+
+    def fund_id_at(self, row):
+        if 0 <= row < len(self._order):
+            return self._order.select(self._row_at(row))[2]
+        return None
+
+    def row_of(self, fid):
+        key = self._key_of.get(fid)
+        if key is None:
+            return None
+        return self._row_at(self._order.rank(key))
+
+    # -- source signals -----------------------------------------------------
+
+    def _source_reset(self):
+        self.beginResetModel()
+        self._key_of = {}
+        self._order = RankedKeys()
+        self._text_of = {}
+        self._dirty.clear()
+        self._build()
+        self.endResetModel()
+
+    def _source_rows_inserted(self, parent, first, last):
+        if self._loading:
+            return
+        source = self.sourceModel()
+        new = []
+        for row in range(first, last + 1):
+            fid = source.fund_id_at(row)
+            self._remember_text(fid)
+            if self._accepts(fid):
+                new.append((self._key(fid, row), fid))
+        if not new:
+            return
+        if self._column < 0:
+            # unsorted: source rows are appended to self._order, which shows at the
+            # end when read ascending and at the top when read from the end
+            start = len(self._order) if self._ascending else 0
+            self.beginInsertRows(QModelIndex(), start, start + len(new) - 1)
+            for key, fid in new:
+                self._key_of[fid] = key
+                self._order.insert(key)
+            self.endInsertRows()
+            return
+        for key, fid in new:
+            position = self._order.rank(key)
+            row = position if self._ascending else len(self._order) - position
+            self.beginInsertRows(QModelIndex(), row, row)
+            self._key_of[fid] = key
+            self._order.insert(key)
+            self.endInsertRows()
+
+    def _source_data_changed(self, top_left, bottom_right, roles=()):
+        source = self.sourceModel()
+        first = last = None
+        for source_row in range(top_left.row(), bottom_right.row() + 1):
+            fid = source.fund_id_at(source_row)
+            row = self.row_of(fid)
+            if row is None:
+                continue
+            first = row if first is None else min(first, row)
+            last = row if last is None else max(last, row)
+            if self._column >= 0 and self._key(fid) != self._key_of[fid]:
+                self._dirty.add(fid)
+        if first is not None:
+            # a bulk refresh becomes one signal over the rows it spans
+            self.dataChanged.emit(self.index(first, top_left.column()), self.index(last, bottom_right.column()))
+        if self._dirty and not self._rerank_timer.isActive():
+            self._rerank_timer.start()
+
+    def _rerank(self):
+        dirty, self._dirty = self._dirty, set()
+        for fid in dirty:
+            old = self._key_of.get(fid)
+            if old is None:
+                continue
+            key = self._key(fid)
+            if key == old:
+                continue
+            src = self._row_at(self._order.rank(old))
+            # position among the other funds, i.e. once the old key is gone
+            dst = self._row_at(self._order.rank(key) - (old < key))
+            moved = dst != src
+            if moved:
+                # destination is given in the row numbers before the move
+                self.beginMoveRows(QModelIndex(), src, src, QModelIndex(), dst + 1 if dst > src else dst)
+            self._order.remove(old)
+            self._order.insert(key)
+            self._key_of[fid] = key
+            if moved:
+                self.endMoveRows()
+
+    # -- QAbstractProxyModel ------------------------------------------------
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self._order)) or not (0 <= column < len(HEADERS)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return self._column < 0 and not self._filter and self.sourceModel().canFetchMore(parent)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.canFetchMore(parent):
+            self.sourceModel().fetchMore(parent)
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        source = self.sourceModel()
+        row = source.row_of(self.fund_id_at(proxy_index.row()))
+        if row is None:
+            return QModelIndex()
+        return source.index(row, proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid():
+            return QModelIndex()
+        row = self.row_of(self.sourceModel().fund_id_at(source_index.row()))
+        if row is None:
+            return QModelIndex()
+        return self.index(row, source_index.column())
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        return self.sourceModel().headerData(section, orientation, role)
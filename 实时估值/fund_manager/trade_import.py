@@ -0,0 +1,197 @@
+import csv
+import re
+from datetime import datetime
+
+import database
+import calc
+
+# field -> header aliases seen in Alipay / WeChat / broker statements
+DEFAULT_COLUMN_ALIASES = {
+    'code': ['基金代码', '代码', '产品代码', 'code'],
+    'name': ['基金名称', '名称', '产品名称', '商品', 'name'],
+    'type': ['交易类型', '业务类型', '操作类型', '类型', 'type'],
+    'time': ['交易时间', '成交时间', '申请时间', '交易日期', '确认日期', '日期', 'time', 'date'],
+    'amount': ['交易金额', '申请金额', '成交金额', '确认金额', '金额', 'amount'],
+    'shares': ['确认份额', '成交份额', '份额', 'shares'],
+    'price': ['成交净值', '确认净值', '净值', 'price'],
+    'fee': ['手续费', '费用', 'fee'],
+    'note': ['备注', '订单号', '交易单号', '流水号', 'note'],
+}
+REQUIRED_FIELDS = ('code', 'type', 'time')
+
+BUY_WORDS = ('买入', '申购', '认购', '定投', 'buy')
+SELL_WORDS = ('卖出', '赎回', 'sell')
+
+TIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S", "%Y/%m/%d %H:%M", "%Y/%m/%d",
+    "%Y%m%d",
+)
+HEADER_SCAN_ROWS = 30
+
+
+def _iter_csv(path):
+    for encoding in ('utf-8-sig', 'gbk'):
+        try:
+            with open(path, newline='', encoding=encoding) as f:
+                f.read(4096)
+        except UnicodeDecodeError:
+            continue
+        with open(path, newline='', encoding=encoding) as f:
+            for row in csv.reader(f):
+                yield [cell.strip() for cell in row]
+        return
+    raise ValueError("无法识别文件编码")
+
+
+def _iter_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("导入 xlsx 需要安装 openpyxl")
+    # read_only streams rows instead of loading the whole sheet
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ["" if v is None else str(v).strip() for v in row]
+    finally:
+        wb.close()
+
+
+def iter_rows(path):
+    if path.lower().endswith(('.xlsx', '.xlsm')):
+        return _iter_xlsx(path)
+    return _iter_csv(path)
+
+
+def detect_columns(header, overrides=None):
+    mapping = {}
+    for field, aliases in DEFAULT_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                mapping[field] = header.index(alias)
+                break
+    for field, col in (overrides or {}).items():
+        if col in header:
+            mapping[field] = header.index(col)
+        elif col is None:
+            mapping.pop(field, None)
+    return mapping
+
+
+def _find_header(rows, overrides=None):
+    # statements often carry a preamble before the real header row
+    for _ in range(HEADER_SCAN_ROWS):
+        header = next(rows, None)
+        if header is None:
+            break
+        mapping = detect_columns(header, overrides)
+        if all(f in mapping for f in REQUIRED_FIELDS):
+            return header, mapping
+    return None, None
+
+
+def read_header(path):
+    header, _ = _find_header(iter(iter_rows(path)))
+    return header
+
+
+def _parse_number(text):
+    if text is None:
+        return 0.0
+    text = re.sub(r'[¥￥,元份+\s]', '', str(text))
+    if not text or text in ('-', '--'):
+        return 0.0
+    return float(text)
+
+
+def _parse_time(text):
+    text = str(text).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_type(text):
+    text = str(text).lower()
+    if any(w in text for w in SELL_WORDS):
+        return 'sell'
+    if any(w in text for w in BUY_WORDS):
+        return 'buy'
+    return None
+
+
+def _parse_code(text):
+    m = re.search(r'(?<!\d)(\d{6})(?!\d)', str(text))
+    if m:
+        return m.group(1)
+    text = str(text).strip()
+    if text.isdigit() and len(text) < 6:
+        return text.zfill(6)
+    return None
+
+
+def iter_statement(path, overrides=None, stats=None):
+    rows = iter(iter_rows(path))
+    header, mapping = _find_header(rows, overrides)
+    if header is None:
+        raise ValueError("未找到包含基金代码、交易类型和交易时间的表头")
+
+    def cell(row, field):
+        idx = mapping.get(field)
+        if idx is None or idx >= len(row):
+            return ""
+        return row[idx]
+
+    for row in rows:
+        if not any(row):
+            continue
+        try:
+            code = _parse_code(cell(row, 'code'))
+            t_type = _parse_type(cell(row, 'type'))
+            trade_time = _parse_time(cell(row, 'time'))
+            if not code or not t_type or not trade_time:
+                raise ValueError("missing code/type/time")
+            amount = abs(_parse_number(cell(row, 'amount')))
+            shares = abs(_parse_number(cell(row, 'shares')))
+            price = abs(_parse_number(cell(row, 'price'))) or None
+            nav_date = None
+            if not shares and amount:
+                if price:
+                    shares = amount / price
+                else:
+                    # priced later from the stored NAV of the order's pricing session
+                    nav_date = calc.pricing_date(datetime.strptime(trade_time, "%Y-%m-%d %H:%M:%S")).isoformat()
+            yield {
+                'code': code,
+                'name': cell(row, 'name') or code,
+                'type': t_type,
+                'trade_time': trade_time,
+                'amount': amount,
+                'shares': shares,
+                'price': price,
+                'fee': abs(_parse_number(cell(row, 'fee'))),
+                'note': cell(row, 'note'),
+                'nav_date': nav_date,
+            }
+        except Exception:
+            if stats is not None:
+                stats['invalid'] = stats.get('invalid', 0) + 1
+
+
+def import_statement(path, account="默认账户", overrides=None):
+    stats = {'invalid': 0}
+    records = iter_statement(path, overrides, stats)
+    # the trades and the recalculated positions commit together; the file is
+    # parsed into a TEMP table first, which keeps the main database unlocked
+    with database.unit_of_work():
+        success, result = database.import_trades(records, account)
+        if not success:
+            return False, result
+        for fund_id in result['touched']:
+            calc.recalculate_position(fund_id)
+    result['invalid'] = stats['invalid']
+    return True, result
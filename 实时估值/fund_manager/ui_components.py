@@ -1,9 +1,17 @@
 ﻿from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                                QLineEdit, QPushButton, QComboBox, QDateTimeEdit,
-                               QFormLayout, QDoubleSpinBox, QMessageBox)
-from PySide6.QtCore import QDateTime, Qt
+                               QFormLayout, QDoubleSpinBox, QMessageBox, QFileDialog,
+                               QTableWidget, QTableWidgetItem, QTableView, QHeaderView, QAbstractItemView, QTabWidget)
+from PySide6.QtGui import QColor
+from PySide6.QtCore import QDateTime, Qt, QThread, Signal, QAbstractTableModel, QTimer
 from providers import RealProvider, MockProvider
 import database
+import trade_import
+import exporter
+import snapshots
+import alerts
+import risk
+import lots
 
 
 class AddFundDialog(QDialog):
@@ -194,3 +202,743 @@ class AddTradeDialog(QDialog):
             "price": price,
             "note": self.note_edit.text()
         }
+
+
+class ImportWorker(QThread):
+    finished_import = Signal(bool, object)
+
+    def __init__(self, path, account, overrides):
+        super().__init__()
+        self.path = path
+        self.account = account
+        self.overrides = overrides
+
+    def run(self):
+        try:
+            success, result = trade_import.import_statement(self.path, self.account, self.overrides)
+        except Exception as e:
+            success, result = False, str(e)
+        self.finished_import.emit(success, result)
+
+
+class ExportWorker(QThread):
+    progress = Signal(int)
+    finished_export = Signal(bool, object)
+
+    def __init__(self, dataset, path, fmt=None):
+        super().__init__()
+        self.dataset = dataset
+        self.path = path
+        self.fmt = fmt
+        self._stop = False
+
+    def cancel(self):
+        self._stop = True
+
+    def run(self):
+        try:
+            n = exporter.export_dataset(self.dataset, self.path, self.fmt,
+                                        progress=self.progress.emit, should_stop=lambda: self._stop)
+            self.finished_export.emit(True, n)
+        except Exception as e:
+            self.finished_export.emit(False, str(e))
+
+
+class ImportTradesDialog(QDialog):
+    FIELD_LABELS = [
+        ("code", "基金代码"), ("name", "基金名称"), ("type", "交易类型"), ("time", "交易时间"),
+        ("amount", "金额"), ("shares", "份额"), ("price", "净值"), ("fee", "手续费"), ("note", "备注"),
+    ]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("批量导入交易")
+        self.setFixedSize(420, 480)
+        self.path = None
+        self.worker = None
+
+        layout = QFormLayout()
+        file_row = QHBoxLayout()
+        self.file_edit = QLineEdit()
+        self.file_edit.setReadOnly(True)
+        self.btn_browse = QPushButton("选择文件")
+        file_row.addWidget(self.file_edit)
+        file_row.addWidget(self.btn_browse)
+        layout.addRow("对账单:", file_row)
+
+        self.account_combo = QComboBox()
+        self.account_combo.addItems(database.get_accounts() or ["默认账户"])
+        layout.addRow("新基金仓位:", self.account_combo)
+
+        self.column_combos = {}
+        for field, label in self.FIELD_LABELS:
+            combo = QComboBox()
+            combo.setEnabled(False)
+            self.column_combos[field] = combo
+            layout.addRow(f"{label}列:", combo)
+
+        self.status_label = QLabel("支持 CSV / XLSX，已存在的交易会自动跳过")
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 11px;")
+
+        btn_layout = QHBoxLayout()
+        self.btn_ok = QPushButton("开始导入")
+        self.btn_ok.setEnabled(False)
+        self.btn_cancel = QPushButton("关闭")
+        btn_layout.addWidget(self.btn_ok)
+        btn_layout.addWidget(self.btn_cancel)
+
+        main_layout = QVBoxLayout()
+        main_layout.addLayout(layout)
+        main_layout.addWidget(self.status_label)
+        main_layout.addLayout(btn_layout)
+        self.setLayout(main_layout)
+
+        self.btn_browse.clicked.connect(self.choose_file)
+        self.btn_ok.clicked.connect(self.start_import)
+        self.btn_cancel.clicked.connect(self.reject)
+
+    def choose_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "选择对账单", "", "对账单 (*.csv *.xlsx)")
+        if not path:
+            return
+        try:
+            header = trade_import.read_header(path)
+        except Exception as e:
+            QMessageBox.warning(self, "错误", str(e))
+            return
+        if not header:
+            QMessageBox.warning(self, "错误", "未识别到表头，请检查文件")
+            return
+        self.path = path
+        self.file_edit.setText(path)
+        detected = trade_import.detect_columns(header)
+        for field, combo in self.column_combos.items():
+            combo.clear()
+            combo.addItem("(无)")
+            combo.addItems(header)
+            idx = detected.get(field)
+            combo.setCurrentIndex(idx + 1 if idx is not None else 0)
+            combo.setEnabled(True)
+        self.btn_ok.setEnabled(True)
+
+    def column_overrides(self):
+        overrides = {}
+        for field, combo in self.column_combos.items():
+            overrides[field] = None if combo.currentIndex() == 0 else combo.currentText()
+        return overrides
+
+    def start_import(self):
+        if not self.path:
+            return
+        self.btn_ok.setEnabled(False)
+        self.btn_browse.setEnabled(False)
+        self.status_label.setText("正在导入...")
+        self.worker = ImportWorker(self.path, self.account_combo.currentText().strip(), self.column_overrides())
+        self.worker.finished_import.connect(self.on_import_finished)
+        self.worker.start()
+
+    def on_import_finished(self, success, result):
+        self.worker = None
+        self.btn_browse.setEnabled(True)
+        if not success:
+            self.btn_ok.setEnabled(True)
+            self.status_label.setText("导入失败")
+            QMessageBox.critical(self, "错误", str(result))
+            return
+        QMessageBox.information(
+            self,
+            "导入完成",
+            f"新增 {result['inserted']} 笔，重复跳过 {result['duplicates']} 笔，"
+            f"文件内同一时间同金额的多笔 {result['repeated']} 笔，"
+            f"无法识别 {result['invalid']} 行，涉及 {len(result['touched'])} 只基金。"
+        )
+        self.accept()
+
+    def reject(self):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        super().reject()
+
+
+class BackfillWorker(QThread):
+    finished_backfill = Signal(bool, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._stop = False
+
+    def cancel(self):
+        self._stop = True
+
+    def run(self):
+        self._stop = False
+        try:
+            success, result = True, snapshots.backfill(should_stop=lambda: self._stop)
+        except Exception as e:
+            success, result = False, str(e)
+        self.finished_backfill.emit(success, result)
+
+
+class PeriodReturnsDialog(QDialog):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("区间收益")
+        self.resize(520, 320)
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget()
+        self.table.setColumnCount(1 + len(snapshots.PERIODS))
+        self.table.setHorizontalHeaderLabels(["仓位"] + list(snapshots.PERIODS.values()))
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel("按每日收盘快照计算；缺少历史快照时可先从净值历史回填")
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 11px;")
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        self.btn_backfill = QPushButton("从历史回填")
+        self.btn_close = QPushButton("关闭")
+        btn_layout.addWidget(self.btn_backfill)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_close)
+        layout.addLayout(btn_layout)
+
+        self.worker = BackfillWorker(self)
+        self.worker.finished_backfill.connect(self.on_backfill_finished)
+        self._closing = None  # dialog result to close with once a cancelled backfill stops
+
+        self.btn_backfill.clicked.connect(self.run_backfill)
+        self.btn_close.clicked.connect(self.accept)
+        self.refresh()
+
+    def refresh(self):
+        report = snapshots.period_report()
+        self.table.setRowCount(0)
+        for key, periods in report.items():
+            row = self.table.rowCount()
+            self.table.insertRow(row)
+            self.table.setItem(row, 0, QTableWidgetItem(key))
+            for col, period in enumerate(snapshots.PERIODS, start=1):
+                res = periods.get(period)
+                if res is None:
+                    txt = "--"
+                else:
+                    txt = f"{res['pnl']:+,.2f} ({res['rate'] * 100:+.2f}%)"
+                it = QTableWidgetItem(txt)
+                it.setTextAlignment(Qt.AlignCenter)
+                if res is not None and res['pnl']:
+                    it.setForeground(Qt.red if res['pnl'] > 0 else Qt.darkGreen)
+                self.table.setItem(row, col, it)
+
+    def run_backfill(self):
+        if self.worker.isRunning():
+            return
+        self.btn_backfill.setEnabled(False)
+        self.status_label.setText("正在同步净值并回填快照…")
+        self.worker.start()
+
+    def on_backfill_finished(self, success, result):
+        if self._closing is not None:
+            super().done(self._closing)
+            return
+        self.btn_backfill.setEnabled(True)
+        if not success:
+            self.status_label.setText("回填失败")
+            QMessageBox.critical(self, "错误", result)
+        elif result:
+            self.status_label.setText(f"已回填 {result} 条快照")
+        else:
+            self.status_label.setText("没有可回填的净值历史，请确认已添加交易且能获取到基金净值")
+        self.refresh()
+
+    def done(self, result):
+        # a running backfill stops at the next fund; the dialog closes once it has
+        if self.worker.isRunning():
+            self._closing = result
+            self.worker.cancel()
+            self.btn_close.setEnabled(False)
+            self.status_label.setText("正在取消回填…")
+            return
+        super().done(result)
+
+
+def _risk_text(value, fmt):
+    return "--" if value != value else fmt.format(value)
+
+
+class CorrelationModel(QAbstractTableModel):
+    # 相关性矩阵按需取值，几百只基金也不必逐格建 QTableWidgetItem
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.codes = []
+        self.matrix = None
+
+    def set_matrix(self, codes, matrix):
+        self.beginResetModel()
+        self.codes = list(codes)
+        self.matrix = matrix
+        self.endResetModel()
+
+    def rowCount(self, parent=None):
+        return len(self.codes)
+
+    def columnCount(self, parent=None):
+        return len(self.codes)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and 0 <= section < len(self.codes):
+            return self.codes[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        v = float(self.matrix[index.row(), index.column()])
+        if role == Qt.DisplayRole:
+            return _risk_text(v, "{:.2f}")
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignCenter)
+        if role == Qt.BackgroundRole and v == v:
+            # 正相关偏红，负相关偏绿
+            a = int(abs(v) * 120)
+            return QColor(255, 255 - a, 255 - a) if v > 0 else QColor(255 - a, 255, 255 - a)
+        return None
+
+
+class RiskLoader(QThread):
+    # 净值同步和风险报告在后台线程计算，结果在 loaded 之后由对话框读取
+    loaded = Signal()
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.window = None
+        self.sync = False
+        self.report = None
+        self.synced = None
+        self.error = None
+
+    def load(self, window, sync=False):
+        if self.isRunning():
+            return False
+        self.window = window
+        self.sync = sync
+        self.start()
+        return True
+
+    def run(self):
+        self.report = self.synced = self.error = None
+        try:
+            if self.sync:
+                self.synced = self.engine.sync()
+            self.report = self.engine.report(self.window)
+        except Exception as e:
+            self.error = str(e)
+        self.loaded.emit()
+
+
+class RiskDialog(QDialog):
+    # 波动率 / 最大回撤 / 夏普 / Beta 与相关性矩阵，按历史净值计算
+    FUND_COLUMNS = ["代码", "名称", "仓位", "年化波动", "最大回撤", "夏普", "Beta", "样本天数"]
+
+    def __init__(self, engine, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("风险分析")
+        self.resize(820, 520)
+        self.engine = engine
+
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        top.addWidget(QLabel("区间:"))
+        self.window_combo = QComboBox()
+        for key, (label, _) in risk.WINDOWS.items():
+            self.window_combo.addItem(label, key)
+        self.window_combo.setCurrentIndex(list(risk.WINDOWS).index("1y"))
+        top.addWidget(self.window_combo)
+        top.addStretch()
+        layout.addLayout(top)
+
+        self.tabs = QTabWidget()
+        self.fund_table = self._make_table(self.FUND_COLUMNS)
+        self.account_table = self._make_table(["仓位"] + self.FUND_COLUMNS[3:])
+        self.corr_model = CorrelationModel(self)
+        self.corr_table = QTableView()
+        self.corr_table.setModel(self.corr_model)
+        self.corr_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tabs.addTab(self.fund_table, "基金")
+        self.tabs.addTab(self.account_table, "仓位")
+        self.tabs.addTab(self.corr_table, "相关性")
+        layout.addWidget(self.tabs)
+
+        self.status_label = QLabel(f"按每日净值计算，Beta 相对{risk.BENCHMARK_NAME}（{risk.BENCHMARK_CODE}），"
+                                   f"无风险利率 {risk.RISK_FREE_RATE * 100:.1f}%")
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 11px;")
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        self.btn_sync = QPushButton("同步净值")
+        self.btn_close = QPushButton("关闭")
+        btn_layout.addWidget(self.btn_sync)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_close)
+        layout.addLayout(btn_layout)
+
+        self.loader = RiskLoader(engine, self)
+        self.loader.loaded.connect(self._report_loaded)
+        self._queued_sync = None  # request waiting for the loader, True when it should sync first
+
+        self.window_combo.currentIndexChanged.connect(self.refresh)
+        self.btn_sync.clicked.connect(self.run_sync)
+        self.btn_close.clicked.connect(self.accept)
+        self.refresh()
+
+    def _make_table(self, headers):
+        table = QTableWidget()
+        table.setColumnCount(len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        return table
+
+    def _metric_cells(self, row):
+        return [
+            _risk_text(row["volatility"] * 100, "{:.2f}%"),
+            _risk_text(row["max_drawdown"] * 100, "{:.2f}%"),
+            _risk_text(row["sharpe"], "{:.2f}"),
+            _risk_text(row["beta"], "{:.2f}"),
+            f"{row['observations']:.0f}",
+        ]
+
+    def _fill(self, table, rows):
+        table.setRowCount(len(rows))
+        for r, cells in enumerate(rows):
+            for c, txt in enumerate(cells):
+                it = QTableWidgetItem(txt)
+                it.setTextAlignment(Qt.AlignCenter)
+                table.setItem(r, c, it)
+
+    def refresh(self):
+        self._request(False)
+
+    def run_sync(self):
+        self._request(True)
+
+    def _request(self, sync):
+        if not self.loader.load(self.window_combo.currentData(), sync):
+            self._queued_sync = bool(self._queued_sync) or sync
+            return
+        self.btn_sync.setEnabled(False)
+        self.status_label.setText("正在同步净值…" if sync else "正在计算…")
+
+    def _report_loaded(self):
+        self.btn_sync.setEnabled(True)
+        if self.loader.error is not None:
+            self.status_label.setText("计算失败")
+            QMessageBox.critical(self, "错误", self.loader.error)
+        else:
+            self._show(self.loader.report)
+            if self.loader.synced is not None:
+                self.status_label.setText(f"已同步 {self.loader.synced} 条净值；" + self.status_label.text())
+        if self._queued_sync is not None:
+            sync, self._queued_sync = self._queued_sync, None
+            self._request(sync)
+
+    def _show(self, report):
+        self._fill(self.fund_table, [[f["code"], f["name"], ",".join(f["accounts"])] + self._metric_cells(f)
+                                     for f in report["funds"]])
+        self._fill(self.account_table, [[a["account"]] + self._metric_cells(a) for a in report["accounts"]])
+
+        self.corr_model.set_matrix(report["codes"], report["correlation"])
+        if len(report["dates"]):
+            self.status_label.setText(f"{report['dates'][0]} 至 {report['dates'][-1]}，共 {len(report['dates'])} 个交易日；"
+                                      f"Beta 相对{risk.BENCHMARK_NAME}（{risk.BENCHMARK_CODE}）")
+        else:
+            self.status_label.setText(f"按每日净值计算，Beta 相对{risk.BENCHMARK_NAME}（{risk.BENCHMARK_CODE}），"
+                                      f"无风险利率 {risk.RISK_FREE_RATE * 100:.1f}%")
+
+    def done(self, result):
+        # the engine is shared with the main window, let a running report finish first
+        self._queued_sync = None
+        self.loader.wait()
+        super().done(result)
+
+
+class TradeSearchDialog(QDialog):
+    # 按备注、基金代码或名称搜索全部交易，每页 SEARCH_PAGE_SIZE 条，输入停顿后自动查询
+    COLUMNS = ["时间", "代码", "名称", "仓位", "类型", "金额", "份额", "备注"]
+    TYPING_DELAY_MS = 300
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("搜索交易")
+        self.resize(820, 520)
+        self.page = 0
+
+        layout = QVBoxLayout(self)
+        search_row = QHBoxLayout()
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("备注 / 基金代码 / 名称，多个关键词用空格分隔")
+        self.query_edit.setClearButtonEnabled(True)
+        search_row.addWidget(self.query_edit)
+        layout.addLayout(search_row)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        btn_layout = QHBoxLayout()
+        self.status_label = QLabel("")
+        self.status_label.setStyleSheet("color: #6b7280; font-size: 11px;")
+        self.btn_prev = QPushButton("上一页")
+        self.btn_next = QPushButton("下一页")
+        self.btn_close = QPushButton("关闭")
+        btn_layout.addWidget(self.status_label)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_prev)
+        btn_layout.addWidget(self.btn_next)
+        btn_layout.addWidget(self.btn_close)
+        layout.addLayout(btn_layout)
+
+        self.typing_timer = QTimer(self)
+        self.typing_timer.setSingleShot(True)
+        self.typing_timer.setInterval(self.TYPING_DELAY_MS)
+        self.typing_timer.timeout.connect(lambda: self.show_page(0))
+        self.query_edit.textChanged.connect(self.typing_timer.start)
+        self.query_edit.returnPressed.connect(lambda: self.show_page(0))
+        self.btn_prev.clicked.connect(lambda: self.show_page(self.page - 1))
+        self.btn_next.clicked.connect(lambda: self.show_page(self.page + 1))
+        self.btn_close.clicked.connect(self.accept)
+        self.show_page(0)
+
+    def show_page(self, page):
+        self.typing_timer.stop()
+        self.page = max(0, page)
+        query = self.query_edit.text().strip()
+        size = database.SEARCH_PAGE_SIZE
+        rows, more = database.search_trades(query, offset=self.page * size, limit=size)
+        self.table.setRowCount(len(rows))
+        for r, trade in enumerate(rows):
+            values = [
+                trade["trade_time"], trade["code"], trade["name"], trade["account"] or "默认账户",
+                "买入" if trade["type"] == "buy" else "卖出",
+                f"{trade['amount']:,.2f}", f"{trade['shares']:,.2f}", trade["note"] or "",
+            ]
+            for col, text in enumerate(values):
+                it = QTableWidgetItem(text)
+                if col in (4, 5, 6):
+                    it.setTextAlignment(Qt.AlignCenter)
+                self.table.setItem(r, col, it)
+        if not query:
+            self.status_label.setText("输入关键词开始搜索")
+        elif not rows:
+            self.status_label.setText("没有匹配的交易")
+        else:
+            first = self.page * size + 1
+            self.status_label.setText(f"第 {self.page + 1} 页，第 {first}-{first + len(rows) - 1} 条")
+        self.btn_prev.setEnabled(self.page > 0)
+        self.btn_next.setEnabled(more)
+
+
+class LotsDialog(QDialog):
+    # 单只基金的持有批次：按所选成本法计算已实现盈亏，逐批显示持有天数和赎回费档位
+    COLUMNS = ["确认日", "份额", "成本", "持有天数", "赎回费率", "降档还需(天)"]
+
+    def __init__(self, info, nav=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"持有批次 - {info['name']} ({info['code']})")
+        self.resize(620, 440)
+        self.fund_id = info["id"]
+        self.nav = nav
+
+        layout = QVBoxLayout(self)
+        top = QHBoxLayout()
+        self.method_combo = QComboBox()
+        for key, label in lots.METHODS.items():
+            self.method_combo.addItem(label, key)
+        top.addWidget(QLabel("成本法:"))
+        top.addWidget(self.method_combo)
+        top.addStretch()
+        layout.addLayout(top)
+
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        self.hint_label = QLabel("持有天数从份额确认日起算；赎回按先进先出扣减份额，各基金费率以合同为准")
+        self.hint_label.setStyleSheet("color: #6b7280; font-size: 11px;")
+        layout.addWidget(self.hint_label)
+
+        btn_layout = QHBoxLayout()
+        self.btn_close = QPushButton("关闭")
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_close)
+        layout.addLayout(btn_layout)
+
+        self.method_combo.currentIndexChanged.connect(self.refresh)
+        self.btn_close.clicked.connect(self.accept)
+        self.refresh()
+
+    def refresh(self):
+        try:
+            book = lots.sync(self.fund_id, self.method_combo.currentData())
+        except Exception as e:
+            QMessageBox.critical(self, "错误", str(e))
+            return
+        text = f"持有份额: {book.shares:,.2f}    成本: {book.cost:,.2f}    已实现盈亏: {book.realized:+,.2f}"
+        if self.nav:
+            text += f"    全部赎回费约: {book.redemption_fee(book.shares, self.nav):,.2f}"
+        self.summary_label.setText(text)
+        rows = book.open_lots()
+        self.table.setRowCount(len(rows))
+        for r, lot in enumerate(rows):
+            values = [lot["acquired"], f"{lot['shares']:,.2f}", f"{lot['cost']:,.2f}", str(lot["days"]),
+                      f"{lot['fee_rate'] * 100:.2f}%",
+                      "--" if lot["next_tier_days"] is None else str(lot["next_tier_days"])]
+            for col, text in enumerate(values):
+                it = QTableWidgetItem(text)
+                it.setTextAlignment(Qt.AlignCenter)
+                if col == 4 and lot["fee_rate"] >= lots.REDEMPTION_FEE_TIERS[0][1]:
+                    it.setForeground(Qt.red)
+                self.table.setItem(r, col, it)
+
+
+class AlertRulesDialog(QDialog):
+    SCOPES = [("fund", "基金"), ("account", "仓位")]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("提醒规则")
+        self.resize(620, 460)
+
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget()
+        self.table.setColumnCount(4)
+        self.table.setHorizontalHeaderLabels(["ID", "规则", "回差", "状态"])
+        self.table.setColumnHidden(0, True)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+
+        form = QFormLayout()
+        self.scope_combo = QComboBox()
+        for _, label in self.SCOPES:
+            self.scope_combo.addItem(label)
+        self.target_edit = QComboBox()
+        self.target_edit.setEditable(True)
+        self.metric_combo = QComboBox()
+        self.op_combo = QComboBox()
+        self.op_combo.addItems(["低于 (<)", "高于 (>)"])
+        self.threshold_spin = QDoubleSpinBox()
+        self.threshold_spin.setRange(-1e12, 1e12)
+        self.threshold_spin.setDecimals(2)
+        self.hysteresis_spin = QDoubleSpinBox()
+        self.hysteresis_spin.setRange(0, 1e12)
+        self.hysteresis_spin.setDecimals(2)
+        self.unit_label = QLabel("")
+        form.addRow("对象:", self.scope_combo)
+        form.addRow("基金代码/仓位:", self.target_edit)
+        form.addRow("指标:", self.metric_combo)
+        form.addRow("条件:", self.op_combo)
+        form.addRow("阈值:", self.threshold_spin)
+        form.addRow("回差:", self.hysteresis_spin)
+        form.addRow("", self.unit_label)
+        layout.addLayout(form)
+
+        btn_layout = QHBoxLayout()
+        self.btn_add = QPushButton("添加规则")
+        self.btn_del = QPushButton("删除所选")
+        self.btn_close = QPushButton("关闭")
+        btn_layout.addWidget(self.btn_add)
+        btn_layout.addWidget(self.btn_del)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.btn_close)
+        layout.addLayout(btn_layout)
+
+        self.scope_combo.currentIndexChanged.connect(self.update_scope)
+        self.metric_combo.currentIndexChanged.connect(self.update_unit)
+        self.btn_add.clicked.connect(self.add_rule)
+        self.btn_del.clicked.connect(self.delete_rule)
+        self.btn_close.clicked.connect(self.accept)
+        self.update_scope()
+        self.refresh()
+
+    def scope(self):
+        return self.SCOPES[self.scope_combo.currentIndex()][0]
+
+    def update_scope(self):
+        metrics = alerts.FUND_METRICS if self.scope() == "fund" else alerts.ACCOUNT_METRICS
+        self.metric_combo.clear()
+        for key, label in metrics.items():
+            self.metric_combo.addItem(label, key)
+        self.target_edit.clear()
+        if self.scope() == "account":
+            self.target_edit.addItems(database.get_accounts())
+        else:
+            self.target_edit.setEditText("")
+        self.update_unit()
+
+    def update_unit(self):
+        metric = self.metric_combo.currentData()
+        if metric in alerts.RATE_METRICS:
+            self.unit_label.setText("阈值和回差按百分比填写，如 -2 表示 -2%")
+        elif metric == "stale":
+            self.unit_label.setText("交易时段内超过该秒数未收到行情时提醒")
+        else:
+            self.unit_label.setText("")
+
+    def refresh(self):
+        self.table.setRowCount(0)
+        held = {f["code"] for f in database.get_fund_refs()}
+        for row in database.get_alert_rules():
+            rule = alerts.AlertRule(row)
+            r = self.table.rowCount()
+            self.table.insertRow(r)
+            self.table.setItem(r, 0, QTableWidgetItem(str(rule.id)))
+            self.table.setItem(r, 1, QTableWidgetItem(rule.describe()))
+            hyst = f"{rule.hysteresis * 100:.2f}%" if rule.metric in alerts.RATE_METRICS else f"{rule.hysteresis:,.2f}"
+            self.table.setItem(r, 2, QTableWidgetItem(hyst))
+            if rule.scope == "fund" and rule.target not in held:
+                status = "未添加该基金，不会检查"
+            else:
+                status = "已触发" if rule.triggered else "监控中"
+            self.table.setItem(r, 3, QTableWidgetItem(status))
+
+    def add_rule(self):
+        metric = self.metric_combo.currentData()
+        threshold = self.threshold_spin.value()
+        hysteresis = self.hysteresis_spin.value()
+        if metric in alerts.RATE_METRICS:
+            threshold /= 100.0
+            hysteresis /= 100.0
+        op = "<" if self.op_combo.currentIndex() == 0 else ">"
+        success, msg = database.add_alert_rule(
+            self.scope(), self.target_edit.currentText().strip(), metric, op, threshold, hysteresis)
+        if not success:
+            QMessageBox.warning(self, "提示", msg)
+        self.refresh()
+
+    def delete_rule(self):
+        row = self.table.currentRow()
+        if row < 0:
+            return
+        database.delete_alert_rule(int(self.table.item(row, 0).text()))
+        self.refresh()
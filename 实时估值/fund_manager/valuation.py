@@ -0,0 +1,119 @@
+import numpy as np
+
+from quotes import FundMetrics
+
+DEFAULT_ACCOUNT = "默认账户"
+
+
+class Valuation:
+    # result of one vectorized pass over every slot
+    def __init__(self, market_value, today_pnl, total_pnl, total_rate, account_names, by_account):
+        self.market_value = market_value
+        self.today_pnl = today_pnl
+        self.total_pnl = total_pnl
+        self.total_rate = total_rate
+        self.account_names = account_names
+        self.by_account = by_account  # (3, n_accounts): market_value, today_pnl, total_pnl
+        self.totals = by_account.sum(axis=1)
+
+    def row(self, slot):
+        return FundMetrics(
+            float(self.market_value[slot]),
+            float(self.today_pnl[slot]),
+            float(self.total_pnl[slot]),
+            float(self.total_rate[slot]),
+        )
+
+    def account(self, name):
+        try:
+            i = self.account_names.index(name)
+        except ValueError:
+            return None
+        mv, day, tot = self.by_account[:, i]
+        return {"market_value": float(mv), "today_pnl": float(day), "total_pnl": float(tot)}
+
+
+class PortfolioBook:
+    # Positions and latest quotes as contiguous arrays indexed by fund slot.
+    # Same formulas as calc.calc_display_metrics, applied to all slots at once.
+    def __init__(self, capacity=256):
+        self.slot_of = {}
+        self.fund_ids = []
+        self.account_names = []
+        self._account_idx = {}
+        self._alloc(capacity)
+        self._result = None
+
+    def _alloc(self, capacity):
+        self.shares = np.zeros(capacity)
+        self.cost = np.zeros(capacity)
+        self.est_nav = np.zeros(capacity)
+        self.rate = np.zeros(capacity)
+        self.has_quote = np.zeros(capacity, dtype=bool)
+        self.account = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self):
+        n = len(self.shares)
+        old = (self.shares, self.cost, self.est_nav, self.rate, self.has_quote, self.account)
+        self._alloc(n * 2)
+        for dst, src in zip((self.shares, self.cost, self.est_nav, self.rate, self.has_quote, self.account), old):
+            dst[:n] = src
+
+    def __len__(self):
+        return len(self.fund_ids)
+
+    def clear(self):
+        self.slot_of = {}
+        self.fund_ids = []
+        self.has_quote[:] = False
+        self._result = None
+
+    def _account_slot(self, name):
+        name = name or DEFAULT_ACCOUNT
+        idx = self._account_idx.get(name)
+        if idx is None:
+            idx = self._account_idx[name] = len(self.account_names)
+            self.account_names.append(name)
+        return idx
+
+    def set_position(self, fid, shares, cost, account=None):
+        slot = self.slot_of.get(fid)
+        if slot is None:
+            slot = len(self.fund_ids)
+            if slot >= len(self.shares):
+                self._grow()
+            self.slot_of[fid] = slot
+            self.fund_ids.append(fid)
+            self.has_quote[slot] = False
+        self.shares[slot] = float(shares or 0)
+        self.cost[slot] = float(cost or 0)
+        self.account[slot] = self._account_slot(account)
+        self._result = None
+        return slot
+
+    def update_quote(self, slot, est_nav, rate):
+        self.est_nav[slot] = est_nav
+        self.rate[slot] = rate
+        self.has_quote[slot] = True
+        self._result = None
+
+    def compute(self):
+        if self._result is not None:
+            return self._result
+        n = len(self.fund_ids)
+        shares = self.shares[:n]
+        cost = self.cost[:n]
+        live = self.has_quote[:n] & (shares > 0)
+        mv = np.where(live, shares * self.est_nav[:n], 0.0)
+        today = mv * self.rate[:n]
+        total = np.where(live, mv - cost, 0.0)
+        total_rate = np.divide(total, cost, out=np.zeros(n), where=live & (cost != 0))
+        n_acc = len(self.account_names)
+        acc = self.account[:n]
+        by_account = np.vstack([
+            np.bincount(acc, weights=mv, minlength=n_acc),
+            np.bincount(acc, weights=today, minlength=n_acc),
+            np.bincount(acc, weights=total, minlength=n_acc),
+        ]) if n_acc else np.zeros((3, 0))
+        self._result = Valuation(mv, today, total, total_rate, list(self.account_names), by_account)
+        return self._result